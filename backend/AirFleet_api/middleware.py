@@ -0,0 +1,225 @@
+"""
+Response compression
+
+CompressionMiddleware compresses responses with the best encoding both sides
+support: zstd and brotli when their libraries are installed, gzip always.
+Small bodies, already-compressed media and responses that are encoded
+already are passed through. Streaming responses are compressed chunk by
+chunk and flushed after every chunk, so clients still receive data as soon
+as the view yields it.
+"""
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content types that are compressed already, or not worth compressing.
+SKIP_CONTENT_TYPES = (
+    'image/', 'video/', 'audio/', 'font/woff',
+    'application/gzip', 'application/x-gzip', 'application/zip',
+    'application/zstd', 'application/x-brotli', 'application/pdf',
+    'application/octet-stream',
+)
+
+_no_transform_re = re.compile(r'\bno-transform\b', re.IGNORECASE)
+
+
+class GzipCompressor:
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    encoding = 'br'
+
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    encoding = 'zstd'
+
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_compressors():
+    """{encoding: compressor class} for the libraries that are installed."""
+    compressors = {'gzip': GzipCompressor}
+    if brotli is not None:
+        compressors['br'] = BrotliCompressor
+    if zstandard is not None:
+        compressors['zstd'] = ZstdCompressor
+    return compressors
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into {coding: q}."""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header, encodings):
+    """
+    Pick the encoding the client ranks highest among `encodings` (in server
+    preference order, which also breaks ties), or None.
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def weaken_etag(response):
+    """
+    A compressed body is a different byte sequence: a strong ETag no longer
+    applies, but it still validates weakly (If-None-Match).
+    """
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response.headers['ETag'] = 'W/' + etag
+
+
+def compress_stream(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def compress_async_stream(chunks, compressor):
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Negotiated zstd/brotli/gzip compression.
+
+    Settings:
+        COMPRESSION_ENCODINGS: Encodings to offer, most preferred first
+        COMPRESSION_LEVELS: {encoding: level}
+        COMPRESSION_MIN_SIZE: Smallest non-streaming body worth compressing
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        compressors = available_compressors()
+        self.compressors = {
+            encoding: compressors[encoding]
+            for encoding in settings.COMPRESSION_ENCODINGS
+            if encoding in compressors
+        }
+        self.levels = settings.COMPRESSION_LEVELS
+        self.min_size = settings.COMPRESSION_MIN_SIZE
+
+    def process_response(self, request, response):
+        if response.status_code == 304:
+            return self.process_not_modified(request, response)
+        if response.has_header('Content-Encoding') or response.status_code in (204, 206):
+            return response
+        if response.get('Content-Type', '').lower().startswith(SKIP_CONTENT_TYPES):
+            return response
+        if _no_transform_re.search(response.get('Cache-Control', '')):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.compressors)
+        if encoding is None:
+            return response
+        compressor = self.compressors[encoding](self.levels[encoding])
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_async_stream(response.streaming_content, compressor)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, compressor)
+            del response.headers['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            # Return the original if compression doesn't save anything.
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        weaken_etag(response)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def process_not_modified(self, request, response):
+        """
+        A 304 has no body to compress, but it must carry the validator the
+        compressed 200 did, or the client's stored ETag stops matching.
+        """
+        if _no_transform_re.search(response.get('Cache-Control', '')):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.compressors) is not None:
+            weaken_etag(response)
+        return response
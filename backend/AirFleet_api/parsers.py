@@ -0,0 +1,40 @@
+"""
+orjson-backed JSON parsing
+
+ORJSONParser accepts exactly what DRF's JSONParser accepts (with STRICT_JSON,
+NaN and Infinity are rejected by both) and falls back to it when orjson is
+not installed, the body is not UTF-8, or it may hold an integer wider than
+64 bits (which orjson decodes as a float or rejects, while json keeps it
+exact). Bodies orjson rejects are re-parsed by DRF for its error message.
+"""
+import codecs
+import io
+import re
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer, orjson
+
+# Any run of 19+ digits might overflow 64 bits; a match inside a string only
+# costs the slower parse.
+_wide_int_re = re.compile(rb'\d{19}')
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        data = stream.read()
+        if _wide_int_re.search(data):
+            return super().parse(io.BytesIO(data), media_type, parser_context)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # DRF either parses it or raises its own ParseError.
+            return super().parse(io.BytesIO(data), media_type, parser_context)
@@ -0,0 +1,54 @@
+"""
+orjson-backed JSON rendering
+
+ORJSONRenderer is a drop-in replacement for DRF's JSONRenderer that produces
+the same bytes several times faster. datetime, date, time and UUID are
+encoded by orjson itself; everything else orjson does not know (timedelta,
+Decimal, lazy strings, querysets, ...) goes through DRF's JSONEncoder.default,
+so the output matches the stock renderer (except that a float NaN renders as
+null instead of raising). Without orjson installed, or when indented output
+is requested (the browsable API), it is DRF's renderer.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+else:
+    OPTIONS = 0
+
+_default = JSONEncoder().default
+
+
+def dumps(data):
+    """
+    Serialise `data` to compact UTF-8 JSON bytes the way DRF's JSONRenderer
+    does, with orjson when it is available.
+    """
+    if orjson is None:
+        return JSONRenderer().render(data)
+    try:
+        ret = orjson.dumps(data, default=_default, option=OPTIONS)
+    except TypeError:
+        # e.g. integers wider than 64 bits, which only the stdlib handles.
+        return JSONRenderer().render(data)
+    # DRF escapes these so the output is also valid JavaScript.
+    if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+        ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return ret
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FlightsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flights'
+
+    def ready(self):
+        # Build the shared OpenAI client once per process.
+        from . import llm
+        llm.configure()
@@ -0,0 +1,124 @@
+"""
+Async OpenAI API access
+
+The asyncio counterpart of direct_openai.DirectOpenAI, built on
+httpx.AsyncClient, for the async narrative view under ASGI: a request
+awaiting the API holds no thread, so one process can keep hundreds of calls
+in flight. Timeouts, retries, backoff, errors and metrics are the same as
+DirectOpenAI's.
+
+httpx clients belong to the event loop they were first used on, so one
+pooled client is kept per running loop.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .direct_openai import (
+    DEFAULT_MAX_RETRIES, DEFAULT_TIMEOUT, RETRY_STATUSES, ObjectWithDotNotation, OpenAIError,
+    backoff_delay, failure_count, latency, parse_retry_after, request_count, retry_count, timeout_count,
+)
+
+logger = logging.getLogger(__name__)
+
+# Connections per loop; requests beyond this wait for a free one.
+MAX_CONNECTIONS = 500
+
+
+class AsyncDirectOpenAI:
+    """
+    Usage:
+        client = AsyncDirectOpenAI(api_key='sk-...')
+        response = await client.chat_completion(model='gpt-4o-mini', messages=[...])
+        response.choices[0].message.content
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 timeout: Optional[Tuple[float, float]] = None, max_retries: Optional[int] = None,
+                 max_connections: int = MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.base_url = (base_url or "https://api.openai.com/v1").rstrip("/")
+        connect, read = tuple(timeout) if timeout else DEFAULT_TIMEOUT
+        self.timeout = httpx.Timeout(read, connect=connect)
+        self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.clients = weakref.WeakKeyDictionary()
+
+    def http_client(self) -> httpx.AsyncClient:
+        """The pooled client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self.clients.get(loop)
+        if client is None:
+            client = self.clients[loop] = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=self.timeout,
+                limits=self.limits,
+            )
+        return client
+
+    async def aclose(self):
+        """Close the running loop's client, if it has one."""
+        client = self.clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def chat_completion(self, model: str, messages: List[Dict[str, str]], **options) -> Any:
+        """
+        Create a chat completion; `options` are passed through (max_tokens,
+        temperature, ...). Raises OpenAIError like DirectOpenAI.
+        """
+        data = {"model": model, "messages": messages, **options}
+        try:
+            response = await self._send("chat/completions", data)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            failure_count.incr()
+            try:
+                message = e.response.json().get("error", {}).get("message", str(e))
+            except ValueError:
+                message = str(e)
+            raise OpenAIError(f"OpenAI API error: {message}", e.response.status_code)
+        except httpx.HTTPError as e:
+            failure_count.incr()
+            raise OpenAIError(f"OpenAI API request failed: {str(e) or type(e).__name__}")
+        try:
+            return ObjectWithDotNotation(response.json())
+        except ValueError:
+            # E.g. a proxy's HTML page: as bad as an error status.
+            failure_count.incr()
+            raise OpenAIError("OpenAI API request failed: response is not JSON", response.status_code)
+
+    async def _send(self, endpoint: str, data: Dict[str, Any]) -> httpx.Response:
+        """POST with DirectOpenAI._send's retry policy, sleeping without blocking the loop."""
+        client = self.http_client()
+        attempt = 0
+        while True:
+            request_count.incr()
+            start = time.perf_counter()
+            try:
+                response = await client.post(endpoint, json=data)
+            except httpx.TransportError as e:
+                latency.observe((time.perf_counter() - start) * 1000)
+                if isinstance(e, httpx.TimeoutException):
+                    timeout_count.incr()
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"POST {endpoint} failed ({e!r}); retrying in {delay:.2f}s")
+            else:
+                latency.observe((time.perf_counter() - start) * 1000)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = backoff_delay(attempt, parse_retry_after(response.headers))
+                if delay is None:
+                    return response
+                logger.warning(f"POST {endpoint} returned {response.status_code}; retrying in {delay:.2f}s")
+
+            retry_count.incr()
+            await asyncio.sleep(delay)
+            attempt += 1
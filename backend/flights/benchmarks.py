@@ -0,0 +1,86 @@
+"""
+Helpers for the narrative benchmark commands
+
+Start the app (and its workers) as subprocesses wired to a FakeOpenAIServer,
+wait for them to listen and summarise latencies. Nothing here is used on
+the request path.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server did not start listening on port {port}")
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def server_command(server, port, workers, threads=2):
+    """The argv serving the app on `port`: Gunicorn for 'wsgi', Uvicorn for 'asgi'."""
+    if server == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'AirFleet_api.wsgi:application',
+            '--workers', str(workers), '--threads', str(threads),
+            '--timeout', '300', '--log-level', 'warning', '--bind', f'127.0.0.1:{port}',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'AirFleet_api.asgi:application',
+        '--workers', str(workers), '--log-level', 'warning', '--port', str(port),
+    ]
+
+
+def bench_env(fake, **overrides):
+    """
+    Environment for the app's processes: OpenAI calls go to `fake`, and
+    per-user quotas are off because one user sends every request.
+    """
+    return {
+        **os.environ,
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_BASE_URL': fake.base_url,
+        'NARRATIVE_USER_RATE': '0',
+        'NARRATIVE_USER_DAILY_TOKENS': '0',
+        **overrides,
+    }
+
+
+@contextmanager
+def running(command, env, quiet=False):
+    """
+    Run `command` from BASE_DIR with its stdout discarded (and stderr too if
+    `quiet`), yielding the process; it is terminated on exit.
+    """
+    process = subprocess.Popen(
+        command, cwd=settings.BASE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL if quiet else None,
+    )
+    try:
+        yield process
+    finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,104 @@
+"""
+Bulk flight writes
+
+Creation validates many flight payloads with the same rules as
+FlightSerializer and inserts the valid ones with a single bulk_create,
+instead of one INSERT and commit per flight. Updates and deletes are
+set-based: one UPDATE for the whole selection, and DELETEs in bounded
+chunks so row locks are held briefly.
+"""
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Flight
+from .serializers import FlightSerializer
+
+
+def validate_flights(items, start=0):
+    """
+    Validate flight payloads.
+
+    Args:
+        items: Iterable of dictionaries in FlightSerializer's input format
+        start: Index of the first item, for error reporting
+
+    Returns:
+        (valid, errors): `valid` is a list of (index, validated_data) and
+        `errors` a list of {'index': ..., 'errors': ...}
+    """
+    # A single serializer instance is reused; building its fields is the
+    # expensive part of FlightSerializer(data=...).
+    serializer = FlightSerializer()
+    valid = []
+    errors = []
+    for index, item in enumerate(items, start=start):
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as exc:
+            errors.append({'index': index, 'errors': serializers.as_serializer_error(exc)})
+    return valid, errors
+
+
+def create_flights(user, validated, batch_size=500):
+    """
+    Insert validated flight data for `user` in one transaction.
+    """
+    with transaction.atomic():
+        return Flight.objects.bulk_create(
+            [Flight(user=user, **data) for _, data in validated],
+            batch_size=batch_size,
+        )
+
+
+# Fields a bulk update may set. The times are left out: their consistency
+# rules (departure before arrival, total_time) are per row.
+UPDATABLE_FIELDS = (
+    'departure_airport', 'arrival_airport', 'departure_gate', 'arrival_gate',
+    'flight_plan', 'notes', 'aircraft_condition', 'registration_number', 'distance',
+)
+
+
+def validate_changes(data):
+    """
+    Validate a bulk update payload field by field with FlightSerializer's
+    field validators and return the cleaned values.
+    """
+    if not isinstance(data, dict) or not data:
+        raise serializers.ValidationError({'non_field_errors': ['Expected an object of fields to update']})
+
+    fields = FlightSerializer().fields
+    changes = {}
+    errors = {}
+    for name, value in data.items():
+        if name not in UPDATABLE_FIELDS:
+            errors[name] = ['This field cannot be bulk updated']
+            continue
+        try:
+            changes[name] = fields[name].run_validation(value)
+        except serializers.ValidationError as exc:
+            errors[name] = exc.detail
+    if changes.get('distance', 0) < 0:
+        errors.setdefault('distance', []).append('Distance cannot be negative')
+    if errors:
+        raise serializers.ValidationError(errors)
+    return changes
+
+
+def update_flights(queryset, changes):
+    """Apply `changes` to every flight in `queryset` with one UPDATE."""
+    return queryset.update(updated_at=timezone.now(), **changes)
+
+
+def delete_flights(queryset, chunk_size=1000):
+    """
+    Delete the flights in `queryset`, `chunk_size` rows per transaction.
+    Returns the number of flights deleted.
+    """
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        _, counts = Flight.objects.filter(pk__in=pks).delete()
+        deleted += counts.get(Flight._meta.label, 0)
@@ -0,0 +1,194 @@
+"""
+Single-flight narrative generation
+
+Double clicks, several open tabs and equal jobs in different workers all
+produce identical narrative requests at once. Wrapping a generation in
+single_flight(key) (asingle_flight in async code) makes them cost one
+upstream call:
+
+- the first caller for a key in a process leads, and callers arriving
+  while it runs wait on its Event, then read the narrative it stored;
+- the leader also takes a NarrativeLease row for the key, so leaders in
+  other worker processes poll for the stored narrative instead of calling
+  the LLM themselves.
+
+If the leader fails, a waiter takes over and generates. Nobody waits longer
+than NARRATIVE_COALESCE_TIMEOUT; after that a caller generates regardless.
+A lease outlives the slowest possible upstream call, so it only expires
+when its worker died, and a leader only ever releases its own lease.
+"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .direct_openai import BACKOFF_MAX
+from .metrics import counter
+from .models import FlightNarrative, NarrativeLease
+
+# Seconds between checks for another worker's result.
+POLL_INTERVAL = 0.05
+
+saved_in_process = counter(
+    'narrative_coalesced_in_process', 'LLM calls saved by sharing an identical request in the same process',
+)
+saved_across_workers = counter(
+    'narrative_coalesced_across_workers', 'LLM calls saved by sharing an identical request in another worker',
+)
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def begin_local(key):
+    """Return (event, leader): the in-process call for `key`, and whether we started it."""
+    with _inflight_lock:
+        event = _inflight.get(key)
+        if event is not None:
+            return event, False
+        event = _inflight[key] = threading.Event()
+        return event, True
+
+
+def end_local(key, event):
+    with _inflight_lock:
+        if _inflight.get(key) is event:
+            del _inflight[key]
+    event.set()
+
+
+def lease_lifetime():
+    """
+    Seconds a lease lasts: longer than a generation whose every attempt
+    times out and whose every retry backs off as long as it can.
+    """
+    connect, read = settings.OPENAI_TIMEOUT
+    retries = settings.OPENAI_MAX_RETRIES
+    slowest_call = (retries + 1) * (connect + read) + retries * BACKOFF_MAX
+    return max(settings.NARRATIVE_COALESCE_TIMEOUT, slowest_call + 30)
+
+
+def acquire_lease(key):
+    """
+    Take the cross-worker lease for `key`. Returns its expiry, which
+    identifies this holder to release_lease(), or None if another worker
+    holds it.
+    """
+    now = timezone.now()
+    NarrativeLease.objects.filter(key=key, expires_at__lte=now).delete()
+    expires_at = now + timedelta(seconds=lease_lifetime())
+    _, created = NarrativeLease.objects.get_or_create(key=key, defaults={'expires_at': expires_at})
+    return expires_at if created else None
+
+
+def release_lease(key, expires_at):
+    """Drop our lease for `key`; one another worker took over since is left alone."""
+    NarrativeLease.objects.filter(key=key, expires_at=expires_at).delete()
+
+
+def lease_held(key):
+    return NarrativeLease.objects.filter(key=key, expires_at__gt=timezone.now()).exists()
+
+
+def stored_since(key, since):
+    """The narrative for `key` if it was stored at or after `since`."""
+    return FlightNarrative.objects.filter(key=key, updated_at__gte=since).first()
+
+
+def poll_remote(key, since):
+    """
+    Return (narrative, done): done once the narrative is stored or the
+    worker holding the lease has let go of it without storing one.
+    """
+    stored = stored_since(key, since)
+    if stored is not None:
+        return stored, True
+    return None, not lease_held(key)
+
+
+@contextmanager
+def single_flight(key):
+    """
+    Yields None when the caller should generate and store the narrative for
+    `key` itself, or the FlightNarrative an identical concurrent request
+    stored meanwhile.
+    """
+    since = timezone.now()
+    deadline = time.monotonic() + settings.NARRATIVE_COALESCE_TIMEOUT
+    while time.monotonic() < deadline:
+        event, leader = begin_local(key)
+        if not leader:
+            event.wait(max(deadline - time.monotonic(), 0))
+            stored = stored_since(key, since)
+            if stored is not None:
+                saved_in_process.incr()
+                yield stored
+                return
+            continue
+
+        try:
+            lease = acquire_lease(key)
+            if lease is not None:
+                try:
+                    yield None
+                finally:
+                    release_lease(key, lease)
+                return
+            stored = None
+            while time.monotonic() < deadline:
+                stored, done = poll_remote(key, since)
+                if done:
+                    break
+                time.sleep(POLL_INTERVAL)
+            if stored is not None:
+                saved_across_workers.incr()
+                yield stored
+                return
+        finally:
+            end_local(key, event)
+    yield None
+
+
+@asynccontextmanager
+async def asingle_flight(key):
+    """single_flight() for async views: waits without blocking the event loop."""
+    since = timezone.now()
+    deadline = time.monotonic() + settings.NARRATIVE_COALESCE_TIMEOUT
+    while time.monotonic() < deadline:
+        event, leader = begin_local(key)
+        if not leader:
+            while not event.is_set() and time.monotonic() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+            stored = await sync_to_async(stored_since)(key, since)
+            if stored is not None:
+                saved_in_process.incr()
+                yield stored
+                return
+            continue
+
+        try:
+            lease = await sync_to_async(acquire_lease)(key)
+            if lease is not None:
+                try:
+                    yield None
+                finally:
+                    await sync_to_async(release_lease)(key, lease)
+                return
+            stored = None
+            while time.monotonic() < deadline:
+                stored, done = await sync_to_async(poll_remote)(key, since)
+                if done:
+                    break
+                await asyncio.sleep(POLL_INTERVAL)
+            if stored is not None:
+                saved_across_workers.incr()
+                yield stored
+                return
+        finally:
+            end_local(key, event)
+    yield None
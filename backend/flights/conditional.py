@@ -0,0 +1,49 @@
+"""
+Conditional GET support for the flight endpoints.
+
+Validators are derived from `updated_at`, which is cheap to read, so an
+unchanged resource can be answered with 304 Not Modified before the full
+queryset is fetched or anything is serialized. ETags also cover the
+negotiated media type, since JSON and the browsable API share a URL.
+"""
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the given parts.
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return quote_etag(digest)
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Attach ETag/Last-Modified to a response. Representations differ per user
+    and per negotiated format, so shared caches must key on the
+    Authorization and Accept headers.
+    """
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ['Accept', 'Authorization'])
+    return response
+
+
+def conditional_response(request, etag, last_modified=None):
+    """
+    Return a 304 (or 412) response when the request's preconditions match the
+    current validators, otherwise None.
+    """
+    validators = set_validators(HttpResponse(), etag, last_modified)
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+        response=validators,
+    )
+    return None if response is validators else response
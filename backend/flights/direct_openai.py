@@ -3,36 +3,157 @@ Direct OpenAI API Access
 
 This module provides direct access to OpenAI APIs using the requests library,
 bypassing the OpenAI Python client entirely to avoid proxy issues.
+
+All clients share one pooled keep-alive requests.Session, so repeat calls
+reuse open connections instead of paying a TCP+TLS handshake each time.
+Every call has connect/read timeouts, and 429/5xx responses and connection
+failures are retried with jittered exponential backoff that honours
+Retry-After.
+
+chat.create(..., stream=True) relays a streamed completion chunk by chunk,
+parsing the server-sent events as they arrive.
 """
 import os
 import json
 import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 import requests
-from typing import List, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from .metrics import counter, histogram
 
 logger = logging.getLogger(__name__)
 
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5.0, 60.0)
+DEFAULT_MAX_RETRIES = 3
+# Backoff before retry n is random(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)).
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+POOL_SIZE = 20
+# Largest read while streaming; smaller HTTP chunks are passed on at once.
+STREAM_CHUNK_SIZE = 1024
+
+request_count = counter('openai_requests', 'HTTP requests sent to the OpenAI API, retries included')
+retry_count = counter('openai_retries', 'OpenAI requests retried after a 429/5xx or connection failure')
+failure_count = counter('openai_failures', 'OpenAI calls that failed after all retries')
+timeout_count = counter('openai_timeouts', 'OpenAI requests that hit the connect or read timeout')
+latency = histogram(
+    'openai_latency_ms', (100, 250, 500, 1000, 2500, 5000, 10000, 30000),
+    'Round-trip time of each OpenAI HTTP request',
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """
+    The process-wide session. requests.Session is safe to share between
+    threads for sending requests; the adapter's pool holds up to POOL_SIZE
+    keep-alive connections per host.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are done by DirectOpenAI._request, which can see
+                # Retry-After and record metrics.
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait from Retry-After (or OpenAI's retry-after-ms), if given."""
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds to sleep before retry number `attempt` (0-based), or None when a
+    server-requested wait exceeds BACKOFF_MAX and retrying is pointless.
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        if retry_after > BACKOFF_MAX:
+            return None
+        delay = max(delay, retry_after)
+    return delay
+
+
+class OpenAIError(ValueError):
+    """
+    A failed API call. status_code is the HTTP status of the final response,
+    or None when no response arrived (connection error or timeout).
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def upstream_fault(self) -> bool:
+        """True unless the API rejected the request itself (a 4xx other than 429)."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
 class DirectOpenAI:
     """
     Direct OpenAI API access using requests instead of the OpenAI client library.
     This bypasses any proxy-related issues with the OpenAI client.
     """
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 timeout: Optional[Tuple[float, float]] = None, max_retries: Optional[int] = None):
         """
         Initialize the direct OpenAI client.
         
         Args:
             api_key: OpenAI API key. If None, will be read from OPENAI_API_KEY environment variable.
+            base_url: API root, e.g. a local fake server in tests. Defaults to OpenAI's.
+            timeout: (connect, read) timeout in seconds. Defaults to DEFAULT_TIMEOUT.
+            max_retries: Retries after a 429/5xx or connection failure. Defaults to DEFAULT_MAX_RETRIES.
         """
         self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("No API key provided and OPENAI_API_KEY environment variable not set")
         
-        self.base_url = "https://api.openai.com/v1"
+        self.base_url = (base_url or "https://api.openai.com/v1").rstrip("/")
+        self.timeout = tuple(timeout) if timeout else DEFAULT_TIMEOUT
+        self.max_retries = DEFAULT_MAX_RETRIES if max_retries is None else max_retries
+        self.session = get_session()
         self.chat = ChatCompletions(self)
         
-    def _request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def _request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None,
+                 stream: bool = False) -> Any:
         """
         Make a request to the OpenAI API.
         
@@ -40,9 +161,10 @@ class DirectOpenAI:
             method: HTTP method (get, post, etc.)
             endpoint: API endpoint (without the base URL)
             data: Request data
+            stream: Return the open response without reading its body
             
         Returns:
-            Response data as dictionary
+            Response data as dictionary, or the requests.Response when streaming
         """
         url = f"{self.base_url}/{endpoint}"
         headers = {
@@ -50,27 +172,106 @@ class DirectOpenAI:
             "Content-Type": "application/json"
         }
         
+        if method.lower() not in ("get", "post"):
+            raise ValueError(f"Unsupported method: {method}")
+        
         try:
             logger.info(f"Making {method} request to {endpoint}")
-            if method.lower() == "get":
-                response = requests.get(url, headers=headers, params=data)
-            elif method.lower() == "post":
-                response = requests.post(url, headers=headers, json=data)
-            else:
-                raise ValueError(f"Unsupported method: {method}")
-            
+            response = self._send(method, url, headers, data, stream=stream)
             response.raise_for_status()
-            return response.json()
+            return response if stream else response.json()
         except requests.exceptions.RequestException as e:
+            failure_count.incr()
             logger.error(f"Request error: {str(e)}")
+            status_code = getattr(e.response, 'status_code', None)
             if hasattr(e.response, 'text'):
                 logger.error(f"Response text: {e.response.text}")
                 try:
                     error_data = json.loads(e.response.text)
-                    raise ValueError(f"OpenAI API error: {error_data.get('error', {}).get('message', str(e))}")
+                    raise OpenAIError(
+                        f"OpenAI API error: {error_data.get('error', {}).get('message', str(e))}", status_code,
+                    )
                 except json.JSONDecodeError:
                     pass
-            raise ValueError(f"OpenAI API request failed: {str(e)}")
+            raise OpenAIError(f"OpenAI API request failed: {str(e)}", status_code)
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], data: Optional[Dict[str, Any]],
+              stream: bool = False) -> requests.Response:
+        """
+        Send the request, retrying 429/5xx responses and connection failures.
+        Returns the last response; raises the last connection error.
+        """
+        kwargs = {"params": data} if method.lower() == "get" else {"json": data}
+        attempt = 0
+        while True:
+            request_count.incr()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method.upper(), url, headers=headers, timeout=self.timeout, stream=stream, **kwargs,
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                latency.observe((time.perf_counter() - start) * 1000)
+                if isinstance(e, requests.exceptions.Timeout):
+                    timeout_count.incr()
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{method.upper()} {url} failed ({e}); retrying in {delay:.2f}s")
+            else:
+                latency.observe((time.perf_counter() - start) * 1000)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = backoff_delay(attempt, parse_retry_after(response.headers))
+                if delay is None:
+                    return response
+                logger.warning(f"{method.upper()} {url} returned {response.status_code}; retrying in {delay:.2f}s")
+                # Release the connection back to the pool before sleeping.
+                response.close()
+
+            retry_count.incr()
+            time.sleep(delay)
+            attempt += 1
+
+
+class ObjectWithDotNotation:
+    """Dot-notation access mirroring the OpenAI library's response objects."""
+
+    def __init__(self, data):
+        for key, value in data.items():
+            if isinstance(value, dict):
+                value = ObjectWithDotNotation(value)
+            elif isinstance(value, list):
+                value = [ObjectWithDotNotation(item) if isinstance(item, dict) else item for item in value]
+            setattr(self, key, value)
+
+
+def iter_stream(response: requests.Response) -> Iterator[ObjectWithDotNotation]:
+    """
+    Parse a streamed completion's server-sent events into chunk objects,
+    yielding each one as soon as its line arrives. Closes the response when
+    the stream ends or the caller stops iterating.
+    """
+    try:
+        # Lines are decoded one at a time so a multi-byte character split
+        # across network reads is never cut in half.
+        for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE):
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                return
+            chunk = json.loads(payload)
+            if "error" in chunk:
+                raise OpenAIError(f"OpenAI API error: {chunk['error'].get('message', chunk['error'])}")
+            yield ObjectWithDotNotation(chunk)
+    except requests.exceptions.RequestException as e:
+        failure_count.incr()
+        if isinstance(e, requests.exceptions.Timeout):
+            timeout_count.incr()
+        raise OpenAIError(f"OpenAI stream interrupted: {str(e)}")
+    finally:
+        response.close()
 
 
 class ChatCompletions:
@@ -92,7 +293,9 @@ class ChatCompletions:
                messages: List[Dict[str, str]], 
                max_tokens: Optional[int] = None,
                temperature: Optional[float] = None,
-               top_p: Optional[float] = None) -> Dict[str, Any]:
+               top_p: Optional[float] = None,
+               stream: bool = False,
+               stream_options: Optional[Dict[str, Any]] = None) -> Any:
         """
         Create a chat completion.
         
@@ -102,9 +305,11 @@ class ChatCompletions:
             max_tokens: Maximum number of tokens to generate
             temperature: Sampling temperature
             top_p: Nucleus sampling parameter
+            stream: Return an iterator of completion chunks as the server sends them
+            stream_options: e.g. {"include_usage": True} for a final chunk carrying `usage`
             
         Returns:
-            Chat completion response
+            Chat completion response, or an iterator of chunk objects when streaming
         """
         data = {
             "model": model,
@@ -119,21 +324,18 @@ class ChatCompletions:
             
         if top_p is not None:
             data["top_p"] = top_p
+
+        if stream:
+            data["stream"] = True
+            if stream_options:
+                data["stream_options"] = stream_options
+            # The request is sent (and retried) here; only the body is lazy.
+            return iter_stream(self.client._request("post", "chat/completions", data, stream=True))
             
         response = self.client._request("post", "chat/completions", data)
         
         # Format the response to match the structure expected by calling code
         try:
-            # Create an object with dot-notation access mirroring the OpenAI library's response
-            class ObjectWithDotNotation:
-                def __init__(self, data):
-                    for key, value in data.items():
-                        if isinstance(value, dict):
-                            value = ObjectWithDotNotation(value)
-                        elif isinstance(value, list):
-                            value = [ObjectWithDotNotation(item) if isinstance(item, dict) else item for item in value]
-                        setattr(self, key, value)
-            
             # Restructure the choices to match the OpenAI library's response structure
             for choice in response.get("choices", []):
                 if "message" in choice:
@@ -147,19 +349,24 @@ class ChatCompletions:
             return response
 
 
-def create_direct_client(api_key: Optional[str] = None) -> DirectOpenAI:
+def create_direct_client(api_key: Optional[str] = None, base_url: Optional[str] = None,
+                         timeout: Optional[Tuple[float, float]] = None,
+                         max_retries: Optional[int] = None) -> DirectOpenAI:
     """
     Create a direct OpenAI client that bypasses the official library.
     
     Args:
         api_key: OpenAI API key. If None, will be read from OPENAI_API_KEY environment variable.
+        base_url: API root. Defaults to OpenAI's.
+        timeout: (connect, read) timeout in seconds.
+        max_retries: Retries after a 429/5xx or connection failure.
         
     Returns:
         DirectOpenAI client
     """
     try:
         logger.info("Creating direct OpenAI client")
-        return DirectOpenAI(api_key=api_key)
+        return DirectOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=max_retries)
     except Exception as e:
         logger.error(f"Failed to create direct OpenAI client: {str(e)}")
         raise 
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Values-based fast path for read-only flight lists
+
+FlightSerializer(flights, many=True) builds a model instance and walks
+DRF's field machinery for every row. FlightValuesEncoder reads plain column
+values with QuerySet.values() and formats them with a handful of direct
+conversions, producing exactly what FlightSerializer would (the contract is
+checked in tests.py). Field names, order and sparse fieldsets still come
+from FlightSerializer, so adding a model field needs no change here.
+"""
+from django.utils import timezone
+from django.utils.duration import duration_string
+from rest_framework import fields as drf_fields, relations
+from rest_framework.settings import api_settings
+
+from .models import Flight
+from .serializers import FlightSerializer
+
+# Fields whose representation of a database value is the value itself.
+PASSTHROUGH_FIELDS = (
+    drf_fields.CharField,
+    drf_fields.IntegerField,
+    drf_fields.BooleanField,
+    drf_fields.ChoiceField,
+    relations.PrimaryKeyRelatedField,
+)
+
+# Columns the keyset paginator needs on every row.
+POSITION_COLUMNS = ('departure_time', 'id')
+
+
+class FlightValuesEncoder:
+    """
+    Read-only stand-in for FlightSerializer(many=True).
+
+    Usage:
+        encoder = FlightValuesEncoder(fields=['id', 'notes'])
+        data = encoder.encode(encoder.values(flights))
+    """
+
+    def __init__(self, fields=None, context=None):
+        serializer = FlightSerializer(fields=fields, context=context or {})
+        self.request = serializer.context.get('request')
+        self.timezone = timezone.get_current_timezone()
+
+        # (output name, column, formatter or None)
+        self.plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            column = Flight._meta.get_field(field.source).attname
+            self.plan.append((name, column, self.get_formatter(field)))
+        self.columns = list(dict.fromkeys([column for _, column, _ in self.plan] + list(POSITION_COLUMNS)))
+
+    def get_formatter(self, field):
+        if isinstance(field, drf_fields.DateTimeField):
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            if output_format is not None and output_format.lower() == drf_fields.ISO_8601 \
+                    and not hasattr(field, 'timezone'):
+                return self.format_datetime
+        elif isinstance(field, drf_fields.DurationField):
+            return duration_string
+        elif isinstance(field, drf_fields.FileField):
+            if getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+                storage = Flight._meta.get_field(field.source).storage
+                return lambda name: self.format_file_url(storage, name)
+        elif isinstance(field, PASSTHROUGH_FIELDS):
+            return None
+        # Anything else goes through DRF, which is still cheaper than
+        # building a model instance for it.
+        return field.to_representation
+
+    def format_datetime(self, value):
+        value = value.astimezone(self.timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    def format_file_url(self, storage, name):
+        if not name:
+            return None
+        url = storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+    def values(self, queryset):
+        """Restrict `queryset` to the columns the output needs, as dicts."""
+        return queryset.values(*self.columns)
+
+    def encode_row(self, row):
+        data = {}
+        for name, column, formatter in self.plan:
+            value = row[column]
+            data[name] = value if value is None or formatter is None else formatter(value)
+        return data
+
+    def encode(self, rows):
+        return [self.encode_row(row) for row in rows]
@@ -0,0 +1,74 @@
+"""
+Streaming logbook export
+
+Generators that turn a flight queryset into NDJSON or CSV bytes one
+database chunk at a time, so exporting a large logbook never holds more
+than `chunk_size` model instances (and one output block) in memory.
+"""
+import csv
+import zlib
+
+from AirFleet_api.renderers import dumps
+
+from .encoders import FlightValuesEncoder
+
+# Rows are joined into blocks of roughly this size before being handed to
+# the WSGI server, instead of writing one tiny chunk per flight.
+BLOCK_SIZE = 64 * 1024
+
+
+def flight_rows(queryset, chunk_size=2000):
+    """
+    Yield the FlightSerializer representation of every flight in `queryset`.
+    """
+    encoder = FlightValuesEncoder()
+    for row in encoder.values(queryset).iterator(chunk_size=chunk_size):
+        yield encoder.encode_row(row)
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield dumps(row) + b'\n'
+
+
+class _LineBuffer:
+    """File-like object that hands back whatever csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fieldnames):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(fieldnames).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(['' if row[name] is None else row[name] for name in fieldnames]).encode('utf-8')
+
+
+def blocks(lines, block_size=BLOCK_SIZE):
+    """
+    Join small byte strings into blocks of at least `block_size` bytes.
+    """
+    pending = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= block_size:
+            yield b''.join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Compress a byte stream into a gzip file on the fly.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,256 @@
+"""
+Local fake of the OpenAI chat completions API
+
+Used by the tests and benchmarks so narrative code can be exercised end to
+end over real HTTP without an API key or network access. Point
+OPENAI_BASE_URL at FakeOpenAIServer.base_url, or at the server started by
+`manage.py run_fake_openai`. Requests with "stream": true are answered word
+by word as server-sent events, like the real API.
+
+For load tests it can draw each answer's latency from a distribution, fail
+a random share of requests, and answer everything with 429 during periodic
+rate-limit bursts.
+"""
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def latency_sampler(spec, rng):
+    """
+    Return a function giving the seconds to wait before each answer.
+
+    `spec` is a number of seconds, 'uniform:LOW:HIGH', 'exponential:MEAN'
+    or 'lognormal:MEDIAN:SIGMA' (a long right tail, like real model
+    latency). Callables are returned as they are.
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda: spec
+
+    name, *args = str(spec).split(':')
+    try:
+        args = [float(arg) for arg in args]
+        if not args:
+            value = float(name)
+            return lambda: value
+        if name == 'uniform':
+            low, high = args
+            return lambda: rng.uniform(low, high)
+        if name == 'exponential':
+            mean, = args
+            rate = 1 / mean
+            return lambda: rng.expovariate(rate)
+        if name == 'lognormal':
+            median, sigma = args
+            return lambda: rng.lognormvariate(math.log(median), sigma)
+    except (TypeError, ValueError, ZeroDivisionError):
+        pass
+    raise ValueError(f"Invalid latency {spec!r}: expected SECONDS, uniform:LOW:HIGH, "
+                     "exponential:MEAN or lognormal:MEDIAN:SIGMA")
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up first, e.g. a read timeout under test.
+            pass
+
+    def send_response(self, code, message=None):
+        with self.server.lock:
+            self.server.responses[code] += 1
+        super().send_response(code, message)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, retry_after=None):
+        body = json.dumps({'error': {'message': 'Fake failure', 'type': 'server_error'}}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        retry_after = self.server.retry_after if retry_after is None else retry_after
+        if retry_after is not None:
+            self.send_header('Retry-After', str(retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def write_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def send_stream(self, model, content, usage=None):
+        """
+        Send `content` word by word as chat.completion.chunk events, then
+        `usage` in a final chunk without choices if given.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        words = content.split(' ')
+        deltas = [{'role': 'assistant', 'content': ''}]
+        deltas += [{'content': word if i == 0 else ' ' + word} for i, word in enumerate(words)]
+        for i, delta in enumerate(deltas + [{}]):
+            if i > 1 and self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            chunk = {
+                'id': 'chatcmpl-fake-stream',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': None if delta else 'stop'}],
+            }
+            self.write_chunk(b'data: ' + json.dumps(chunk).encode('utf-8') + b'\n\n')
+        if usage is not None:
+            chunk = {'id': 'chatcmpl-fake-stream', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model, 'choices': [], 'usage': usage}
+            self.write_chunk(b'data: ' + json.dumps(chunk).encode('utf-8') + b'\n\n')
+        self.write_chunk(b'data: [DONE]\n\n')
+        self.write_chunk(b'')
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        with server.lock:
+            server.requests.append(request)
+            server.connections.add(self.client_address)
+            failing = len(server.requests) <= server.fail_first
+            delay = server.latency()
+            erroring = server.error_rate and server.random.random() < server.error_rate
+
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            return self.send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+        burst_left = server.burst_remaining()
+        if burst_left:
+            # Rate limiting answers straight away, without the model's latency.
+            return self.send_error_json(429, retry_after=math.ceil(burst_left))
+        if delay:
+            time.sleep(delay)
+        if failing or server.status != 200:
+            return self.send_error_json(server.status if server.status != 200 else 429)
+        if erroring:
+            return self.send_error_json(server.error_status)
+
+        prompt = request['messages'][-1]['content']
+        content = f"Narrative #{len(server.requests)} from {request['model']}: {' '.join(prompt.split())[:80]}"
+        # Word counts stand in for tokens.
+        usage = {'prompt_tokens': len(prompt.split()), 'completion_tokens': len(content.split()),
+                 'total_tokens': len(prompt.split()) + len(content.split())}
+        if request.get('stream'):
+            include_usage = (request.get('stream_options') or {}).get('include_usage')
+            return self.send_stream(request['model'], content, usage if include_usage else None)
+        self.send_json(200, {
+            'id': f"chatcmpl-fake-{len(server.requests)}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request['model'],
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open hundreds of connections at once.
+    request_queue_size = 1024
+
+    def burst_remaining(self):
+        """Seconds left of the current 429 burst, or 0 outside one."""
+        if not self.burst_every or not self.burst_duration:
+            return 0
+        into_period = (time.monotonic() - self.started) % self.burst_every
+        return max(self.burst_duration - into_period, 0)
+
+
+class FakeOpenAIServer:
+    """
+    Context manager running the fake API on a free localhost port.
+
+    Args:
+        latency: Seconds to wait before answering each completion, or a
+            distribution to draw them from (see latency_sampler)
+        status: HTTP status to answer with (200 for a normal completion)
+        fail_first: Answer this many requests with 429 (or `status`) first
+        retry_after: Retry-After header value sent with failures
+        token_delay: Seconds between words of a streamed completion
+        error_rate: Share of requests (0-1) answered with `error_status`
+        error_status: HTTP status for those random failures
+        burst_every: Start a rate-limit burst every this many seconds
+        burst_duration: Seconds each burst lasts; requests arriving during
+            one get 429 with the burst's remaining seconds as Retry-After
+        seed: Seed for the latency and error draws
+        host, port: Address to listen on (port 0 picks a free one)
+    """
+
+    def __init__(self, latency=0.0, status=200, fail_first=0, retry_after=None, token_delay=0.0,
+                 error_rate=0.0, error_status=500, burst_every=0.0, burst_duration=0.0, seed=None,
+                 host='127.0.0.1', port=0):
+        self.httpd = FakeHTTPServer((host, port), FakeOpenAIHandler)
+        self.httpd.random = random.Random(seed)
+        self.httpd.latency = latency_sampler(latency, self.httpd.random)
+        self.httpd.status = status
+        self.httpd.fail_first = fail_first
+        self.httpd.retry_after = retry_after
+        self.httpd.token_delay = token_delay
+        self.httpd.error_rate = error_rate
+        self.httpd.error_status = error_status
+        self.httpd.burst_every = burst_every
+        self.httpd.burst_duration = burst_duration
+        self.httpd.started = time.monotonic()
+        self.httpd.requests = []
+        # Client (host, port) pairs seen, i.e. distinct TCP connections.
+        self.httpd.connections = set()
+        # Responses sent, by status code.
+        self.httpd.responses = Counter()
+        self.httpd.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def connections(self):
+        return self.httpd.connections
+
+    @property
+    def responses(self):
+        return self.httpd.responses
+
+    def __enter__(self):
+        self.httpd.started = time.monotonic()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
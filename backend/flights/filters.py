@@ -0,0 +1,74 @@
+"""
+Server-side filtering for flight lists.
+
+Every filter is an equality on an indexed column or a range on
+departure_time, so each combination is answered from one of the
+(user, <column>, -departure_time, -id) indexes on Flight.
+"""
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Flight
+
+# Query parameters understood by filter_flights.
+FILTER_PARAMS = (
+    'departure_airport', 'arrival_airport', 'registration_number',
+    'aircraft_condition', 'departure_after', 'departure_before', 'q',
+)
+
+
+def parse_bound(name, value, end_of_day=False):
+    """
+    Parse an ISO date or datetime query parameter into an aware datetime.
+    A bare date covers the whole day.
+    """
+    error = ValidationError({name: ['Expected an ISO 8601 date or datetime']})
+    try:
+        # Dates first: parse_datetime also accepts them, as midnight. Both
+        # return None for a malformed value and raise ValueError for a
+        # well-formed but impossible one (2020-02-30).
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else datetime.combine(
+            day, time.max if end_of_day else time.min,
+        )
+    except ValueError:
+        raise error
+    if parsed is None:
+        raise error
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_flights(queryset, params):
+    """
+    Apply the list filters present in `params` (a QueryDict) to `queryset`.
+    """
+    for name in ('departure_airport', 'arrival_airport'):
+        if params.get(name):
+            queryset = queryset.filter(**{name: params[name].upper()})
+
+    if params.get('registration_number'):
+        queryset = queryset.filter(registration_number=params['registration_number'])
+
+    condition = params.get('aircraft_condition')
+    if condition:
+        choices = [choice for choice, _ in Flight.CONDITION_CHOICES]
+        if condition not in choices:
+            raise ValidationError({'aircraft_condition': [f"Expected one of: {', '.join(choices)}"]})
+        queryset = queryset.filter(aircraft_condition=condition)
+
+    if params.get('departure_after'):
+        queryset = queryset.filter(departure_time__gte=parse_bound('departure_after', params['departure_after']))
+    if params.get('departure_before'):
+        queryset = queryset.filter(
+            departure_time__lte=parse_bound('departure_before', params['departure_before'], end_of_day=True)
+        )
+
+    if params.get('q'):
+        queryset = queryset.search(params['q'])
+
+    return queryset
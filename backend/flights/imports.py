@@ -0,0 +1,153 @@
+"""
+Background CSV logbook import
+
+The upload request only stores the file on a FlightImportJob; the
+process_flight_imports worker streams it in chunks, validates each chunk
+with FlightSerializer's rules (optionally in a process pool) and inserts
+the valid rows with bulk_create. A chunk's rows and the job's progress are
+committed together, so a job whose worker died is resumed after its last
+committed row without importing anything twice.
+"""
+import csv
+import io
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .bulk import create_flights, validate_flights
+from .models import FlightImportJob
+from .serializers import FlightSerializer
+
+# Columns read from the CSV. Anything else (id, user, photo, timestamps,
+# e.g. from our own CSV export) is ignored.
+IMPORT_FIELDS = tuple(
+    name for name, field in FlightSerializer().fields.items()
+    if not field.read_only and name != 'photo'
+)
+
+
+def read_chunks(fileobj, chunk_size, skip=0):
+    """
+    Yield (first_row_number, [row, ...]) chunks from a binary CSV file,
+    starting after the first `skip` data rows. Row numbers count data rows
+    from 1; empty cells are left out so model defaults apply.
+    """
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    missing = [name for name in ('departure_time', 'arrival_time') if name not in (reader.fieldnames or ())]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+
+    rows = (
+        {name: value for name, value in row.items() if name in IMPORT_FIELDS and value not in ('', None)}
+        for row in itertools.islice(reader, skip, None)
+    )
+    start = skip + 1
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def validate_chunk(chunk):
+    """Validate one (start, rows) chunk; runs in the worker's process pool."""
+    start, rows = chunk
+    return len(rows), validate_flights(rows, start=start)
+
+
+def pool_map(pool, func, items, window):
+    """
+    Like pool.map, but keeps at most `window` items in flight instead of
+    reading the whole input up front.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def claim_job():
+    """
+    Mark the oldest runnable job as running and return it, or None.
+    SKIP LOCKED lets several workers poll the queue without blocking. A
+    RUNNING job that has made no progress for FLIGHT_IMPORT_JOB_TIMEOUT
+    seconds belongs to a worker that died and is claimed again.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.FLIGHT_IMPORT_JOB_TIMEOUT)
+    with transaction.atomic():
+        job = (
+            FlightImportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='PENDING') | Q(status='RUNNING', updated_at__lt=stale))
+            .order_by('created_at').first()
+        )
+        if job is None:
+            return None
+        job.status = 'RUNNING'
+        job.started_at = job.started_at or timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+    return job
+
+
+def open_upload(job):
+    """The job's CSV as a binary file object."""
+    if job.content:
+        return io.BytesIO(job.content)
+    return job.file.open('rb')
+
+
+def run_import(job, processes=1, chunk_size=None):
+    """
+    Import a claimed job's file, resuming after the rows it already
+    processed. Each chunk is committed on its own, so a failure part way
+    through keeps the rows already imported and reports how far it got.
+    """
+    chunk_size = chunk_size or settings.FLIGHT_IMPORT_CHUNK_SIZE
+    max_rejected = settings.FLIGHT_IMPORT_MAX_REJECTED
+    pool = None
+    try:
+        with open_upload(job) as fileobj:
+            chunks = read_chunks(fileobj, chunk_size, skip=job.rows_processed)
+            if processes > 1:
+                # Forked children must not share this process's DB connections.
+                connections.close_all()
+                pool = ProcessPoolExecutor(max_workers=processes)
+                results = pool_map(pool, validate_chunk, chunks, window=processes * 2)
+            else:
+                results = map(validate_chunk, chunks)
+
+            for count, (valid, errors) in results:
+                with transaction.atomic():
+                    created = create_flights(job.user, valid) if valid else []
+                    job.rows_processed += count
+                    job.rows_created += len(created)
+                    job.rows_rejected += len(errors)
+                    room = max(0, max_rejected - len(job.rejected))
+                    job.rejected.extend(
+                        {'row': error['index'], 'errors': error['errors']} for error in errors[:room]
+                    )
+                    job.save(update_fields=[
+                        'rows_processed', 'rows_created', 'rows_rejected', 'rejected', 'updated_at',
+                    ])
+        job.status = 'DONE'
+    except Exception as e:
+        job.status = 'FAILED'
+        job.error = str(e)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        job.finished_at = timezone.now()
+        # The upload is no longer needed once the job is over.
+        job.content = b''
+        job.save(update_fields=['status', 'error', 'finished_at', 'content', 'updated_at'])
+    return job
@@ -0,0 +1,232 @@
+"""
+Process-wide LLM client
+
+FlightsConfig.ready() builds one DirectOpenAI client (and its async
+counterpart) from the OPENAI_* settings and every narrative call goes
+through it, so the pooled session is
+shared and nothing is constructed, patched or reloaded per request. Calls
+pass through a circuit breaker: after OPENAI_BREAKER_THRESHOLD consecutive
+upstream failures it opens and calls fail immediately with CircuitOpenError
+for OPENAI_BREAKER_RESET seconds, then a single probe call decides whether
+it closes again. The breaker is per process.
+
+RateLimiter keeps a worker's upstream calls within a per-minute budget.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .async_openai import AsyncDirectOpenAI
+from .direct_openai import OpenAIError, create_direct_client
+from .metrics import counter
+
+logger = logging.getLogger(__name__)
+
+trips = counter('openai_circuit_trips', 'Times the OpenAI circuit breaker opened')
+rejections = counter('openai_circuit_rejections', 'OpenAI calls refused while the circuit breaker was open')
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the breaker is open."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"OpenAI is unavailable; retry in {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Thread-safe closed -> open -> half-open breaker.
+
+    Usage:
+        breaker = CircuitBreaker(threshold=5, reset_timeout=30)
+        result = breaker.call(func, *args)
+        with breaker.guard():
+            ...
+
+    `is_failure(exc)` decides which exceptions count against the upstream;
+    any other outcome means the upstream answered and counts as a success.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold, reset_timeout, is_failure=lambda exc: True, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - self.clock()
+            if self.state == self.OPEN and remaining <= 0:
+                # Let this one call through as the probe.
+                self.state = self.HALF_OPEN
+                return
+        rejections.incr()
+        raise CircuitOpenError(max(remaining, 0.0))
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    trips.incr()
+                    logger.warning(f"OpenAI circuit breaker open after {self.failures} failure(s)")
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    @contextmanager
+    def guard(self):
+        """Run the block as one call through the breaker."""
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            if self.is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            # e.g. GeneratorExit when a stream's reader goes away: the
+            # upstream was answering, so a half-open probe succeeded.
+            self.record_success()
+            raise
+        self.record_success()
+
+    def call(self, func, *args, **kwargs):
+        with self.guard():
+            return func(*args, **kwargs)
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 60 / per_minute seconds apart across threads.
+    acquire() reserves the next slot and sleeps until it comes round.
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60.0 / per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = self.clock()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+
+def is_upstream_failure(exc):
+    """Timeouts, connection errors, 429s and 5xx count; our own bad requests don't."""
+    return not isinstance(exc, OpenAIError) or exc.upstream_fault
+
+
+def usage_tokens(response):
+    """total_tokens from a completion's (or a stream's final chunk's) usage, else 0."""
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', 0) if usage else 0
+
+
+class LLMClient:
+    """The sync and async API clients and the breaker they share."""
+
+    def __init__(self, client, breaker, async_client=None):
+        self.client = client
+        self.breaker = breaker
+        self.async_client = async_client
+
+    def complete(self, messages, model, **options):
+        """Return (text, tokens): the first choice's message text and the tokens used."""
+        response = self.breaker.call(self.client.chat.create, model=model, messages=messages, **options)
+        return response.choices[0].message.content.strip(), usage_tokens(response)
+
+    async def acomplete(self, messages, model, **options):
+        """complete() for async views: awaits the API without holding a thread."""
+        with self.breaker.guard():
+            response = await self.async_client.chat_completion(model=model, messages=messages, **options)
+        return response.choices[0].message.content.strip(), usage_tokens(response)
+
+    def stream(self, messages, model, on_usage=None, **options):
+        """
+        Yield the first choice's text piece by piece as it is generated.
+        on_usage(tokens) is called with the tokens used once the API
+        reports them at the end of the stream.
+        """
+        with self.breaker.guard():
+            chunks = self.client.chat.create(
+                model=model, messages=messages, stream=True, stream_options={'include_usage': True}, **options,
+            )
+            try:
+                for chunk in chunks:
+                    for choice in chunk.choices:
+                        text = getattr(choice.delta, 'content', None) if choice.index == 0 else None
+                        if text:
+                            yield text
+                    tokens = usage_tokens(chunk)
+                    if tokens and on_usage is not None:
+                        on_usage(tokens)
+            finally:
+                chunks.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def build_client():
+    """An LLMClient from the current settings, or None without an API key."""
+    if not settings.OPENAI_API_KEY:
+        return None
+    options = {
+        'api_key': settings.OPENAI_API_KEY,
+        'base_url': settings.OPENAI_BASE_URL,
+        'timeout': settings.OPENAI_TIMEOUT,
+        'max_retries': settings.OPENAI_MAX_RETRIES,
+    }
+    breaker = CircuitBreaker(
+        settings.OPENAI_BREAKER_THRESHOLD, settings.OPENAI_BREAKER_RESET, is_failure=is_upstream_failure,
+    )
+    return LLMClient(create_direct_client(**options), breaker, AsyncDirectOpenAI(**options))
+
+
+def configure():
+    """(Re)build the shared client; called from FlightsConfig.ready()."""
+    global _client
+    with _client_lock:
+        _client = build_client()
+    return _client
+
+
+def get_client():
+    if _client is None:
+        raise RuntimeError("OpenAI is not configured: set OPENAI_API_KEY")
+    return _client
+
+
+@receiver(setting_changed)
+def reconfigure(setting, **kwargs):
+    # Keeps override_settings(OPENAI_...) in tests working.
+    if setting.startswith('OPENAI_'):
+        configure()
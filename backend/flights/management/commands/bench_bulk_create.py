@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from flights.models import Flight
+from flights.synthetic import synthetic_flights, synthetic_user
+
+
+def payload(flight):
+    return {
+        'departure_airport': flight.departure_airport,
+        'arrival_airport': flight.arrival_airport,
+        'departure_time': flight.departure_time.isoformat(),
+        'arrival_time': flight.arrival_time.isoformat(),
+        'total_time': str(flight.total_time),
+        'flight_plan': flight.flight_plan,
+        'notes': flight.notes,
+        'aircraft_condition': flight.aircraft_condition,
+        'registration_number': flight.registration_number,
+        'distance': flight.distance,
+    }
+
+
+class Command(BaseCommand):
+    """Benchmark the bulk create endpoint against one POST per flight"""
+    help = 'Import a synthetic logbook through both create endpoints and report throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Flights per bulk request')
+
+    def handle(self, *args, **options):
+        count = options['flights']
+        batch_size = options['batch_size']
+        items = [payload(flight) for flight in synthetic_flights(None, count)]
+
+        with synthetic_user() as user:
+            client = APIClient(HTTP_HOST='localhost')
+            client.force_authenticate(user)
+
+            start = time.perf_counter()
+            for item in items:
+                response = client.post('/api/flights/', item, format='json')
+                assert response.status_code == 201, response.content
+            single = time.perf_counter() - start
+            Flight.objects.filter(user=user).delete()
+
+            start = time.perf_counter()
+            for offset in range(0, count, batch_size):
+                response = client.post('/api/flights/bulk/', items[offset:offset + batch_size], format='json')
+                assert response.status_code == 201, response.content
+            bulk = time.perf_counter() - start
+            assert Flight.objects.filter(user=user).count() == count
+
+        self.stdout.write(f"\n{'endpoint':>22} {'seconds':>9} {'flights/s':>10}")
+        for name, elapsed in (('POST /flights/', single), ('POST /flights/bulk/', bulk)):
+            self.stdout.write(f"{name:>22} {elapsed:>9.2f} {count / elapsed:>10.0f}")
+        self.stdout.write(f"Speedup: {single / bulk:.1f}x")
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
@@ -0,0 +1,90 @@
+import gzip
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, override_settings
+
+from AirFleet_api.middleware import CompressionMiddleware, available_compressors, brotli, zstandard
+from AirFleet_api.renderers import dumps
+from flights import export
+from flights.encoders import FlightValuesEncoder
+from flights.models import Flight
+from flights.synthetic import create_synthetic_flights, synthetic_user
+
+
+def decompress(encoding, data):
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'br':
+        return brotli.decompress(data)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+class Command(BaseCommand):
+    """Benchmark CompressionMiddleware: wire size saved and CPU spent per response"""
+    help = 'Compress flight list and export responses with every available encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--levels', nargs='*', default=[],
+                            help='Extra encoding:level pairs to try, e.g. gzip:1 br:11 zstd:19')
+
+    def handle(self, *args, **options):
+        variants = [(encoding, None) for encoding in available_compressors()]
+        for pair in options['levels']:
+            encoding, level = pair.split(':')
+            variants.append((encoding, int(level)))
+        factory = RequestFactory()
+
+        self.stdout.write(
+            f"{'payload':>16} {'encoding':>9} {'raw KB':>9} {'wire KB':>9} {'saved':>6} {'ms':>8} {'MB/s':>7}"
+        )
+        with synthetic_user() as user:
+            created = 0
+            for size in sorted(options['sizes']):
+                create_synthetic_flights(user, size - created, seed=created)
+                created = size
+                flights = Flight.objects.filter(user=user).order_by('-departure_time', '-id')
+                encoder = FlightValuesEncoder()
+                body = dumps(encoder.encode(encoder.values(flights)))
+                ndjson = list(export.blocks(export.ndjson_lines(export.flight_rows(flights))))
+
+                payloads = (
+                    (f"list {size}", lambda: HttpResponse(body, content_type='application/json')),
+                    (f"export {size}", lambda: StreamingHttpResponse(iter(ndjson), content_type='application/x-ndjson')),
+                )
+                for name, make_response in payloads:
+                    for encoding, level in variants:
+                        self.report(factory, name, make_response, encoding, level, options['repeat'])
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def report(self, factory, name, make_response, encoding, level, repeat):
+        levels = dict(settings.COMPRESSION_LEVELS)
+        if level is not None:
+            levels[encoding] = level
+        with override_settings(COMPRESSION_ENCODINGS=[encoding], COMPRESSION_LEVELS=levels):
+            middleware = CompressionMiddleware(lambda request: None)
+        request = factory.get('/', HTTP_ACCEPT_ENCODING=encoding)
+        raw = b''.join(make_response())
+
+        samples = []
+        for _ in range(repeat):
+            response = make_response()
+            start = time.perf_counter()
+            response = middleware.process_response(request, response)
+            wire = b''.join(response)
+            samples.append((time.perf_counter() - start) * 1000)
+        assert response['Content-Encoding'] == encoding
+        assert decompress(encoding, wire) == raw
+
+        ms = statistics.median(samples)
+        label = encoding if level is None else f"{encoding}:{level}"
+        self.stdout.write(
+            f"{name:>16} {label:>9} {len(raw) / 1024:>9.1f} {len(wire) / 1024:>9.1f} "
+            f"{1 - len(wire) / len(raw):>6.1%} {ms:>8.2f} {len(raw) / 1e6 / (ms / 1000):>7.1f}"
+        )
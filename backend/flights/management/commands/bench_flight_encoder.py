@@ -0,0 +1,54 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from flights.encoders import FlightValuesEncoder
+from flights.models import Flight
+from flights.serializers import FlightSerializer
+from flights.synthetic import create_synthetic_flights, synthetic_user
+
+
+class Command(BaseCommand):
+    """Benchmark FlightValuesEncoder against FlightSerializer(many=True)"""
+    help = 'Fetch and render synthetic logbooks with both list paths and report timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+
+        def serializer_path(flights):
+            return renderer.render(FlightSerializer(flights, many=True).data)
+
+        def encoder_path(flights):
+            encoder = FlightValuesEncoder()
+            return renderer.render(encoder.encode(encoder.values(flights)))
+
+        self.stdout.write(f"{'rows':>8} {'serializer ms':>14} {'values ms':>10} {'speedup':>8}")
+        with synthetic_user() as user:
+            created = 0
+            for size in sorted(options['sizes']):
+                create_synthetic_flights(user, size - created, seed=created)
+                created = size
+                flights = Flight.objects.filter(user=user).order_by('-departure_time', '-id')
+
+                assert serializer_path(flights) == encoder_path(flights)
+                serializer_ms = self.time(lambda: serializer_path(flights), options['repeat'])
+                encoder_ms = self.time(lambda: encoder_path(flights), options['repeat'])
+                self.stdout.write(
+                    f"{size:>8} {serializer_ms:>14.1f} {encoder_ms:>10.1f} {serializer_ms / encoder_ms:>7.1f}x"
+                )
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def time(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,96 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from flights.models import Flight
+from flights.synthetic import synthetic_flights, synthetic_users
+
+
+class Command(BaseCommand):
+    """Benchmark filtered and full-text flight list queries on a large table"""
+    help = 'Time each list filter on a synthetic flights table and report the index it uses'
+
+    scenarios = (
+        '',
+        'departure_airport=KJFK',
+        'arrival_airport=EGLL',
+        'registration_number=N120AF',
+        'aircraft_condition=GROUNDED',
+        'departure_after=2020-01-01&departure_before=2020-03-31',
+        'departure_airport=KJFK&aircraft_condition=GOOD&departure_after=2018-01-01',
+        'q=icing',
+        'q=crosswind gusts&departure_airport=KBOS',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=100,
+                            help='Rows are spread evenly across this many users')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('This benchmark needs PostgreSQL (tsvector search and EXPLAIN output)')
+            return
+
+        per_user = options['rows'] // options['users']
+        with synthetic_users(options['users'], prefix='bench-filters') as users:
+            self.stdout.write(f"Creating {per_user * len(users)} flights for {len(users)} users...")
+            start = time.perf_counter()
+            for seed, user in enumerate(users):
+                Flight.objects.bulk_create(synthetic_flights(user, per_user, seed=seed), batch_size=5000)
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM ANALYZE flights_flight')
+            self.stdout.write(f"Loaded in {time.perf_counter() - start:.1f}s\n")
+
+            client = APIClient(HTTP_HOST='localhost')
+            client.force_authenticate(users[0])
+
+            self.stdout.write(f"{'filter':<75} {'rows':>5} {'ms':>8}  indexes")
+            for query in self.scenarios:
+                url = f"/api/flights/?page_size={options['page_size']}&{query}"
+                samples = []
+                for _ in range(options['repeat']):
+                    begin = time.perf_counter()
+                    response = client.get(url)
+                    samples.append((time.perf_counter() - begin) * 1000)
+                assert response.status_code == 200, response.content
+                indexes = ', '.join(sorted(self.indexes_used(client, url))) or 'none'
+                self.stdout.write(
+                    f"{query or '(none)':<75} {len(response.data['results']):>5} "
+                    f"{statistics.median(samples):>8.2f}  {indexes}"
+                )
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def indexes_used(self, client, url):
+        with CaptureQueriesContext(connection) as captured:
+            client.get(url)
+        used = set()
+        for query in captured.captured_queries:
+            if 'flights_flight' not in query['sql']:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {query['sql']}")
+                plan = cursor.fetchone()[0]
+            used.update(self.find_indexes(plan if isinstance(plan, list) else json.loads(plan)))
+        return used
+
+    def find_indexes(self, node):
+        if isinstance(node, list):
+            for item in node:
+                yield from self.find_indexes(item)
+        elif isinstance(node, dict):
+            if 'Index Name' in node:
+                yield node['Index Name']
+            if node.get('Node Type') == 'Seq Scan':
+                yield f"seq scan on {node['Relation Name']}"
+            for value in node.values():
+                if isinstance(value, (list, dict)):
+                    yield from self.find_indexes(value)
@@ -0,0 +1,86 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from rest_framework.test import APIClient
+
+from flights.models import Flight
+from flights.synthetic import create_synthetic_flights, synthetic_user
+
+
+class Command(BaseCommand):
+    """Benchmark keyset pagination of the flight list against OFFSET paging"""
+    help = 'Walk a synthetic logbook page by page and report per-page latency'
+
+    checkpoints = (1, 10, 100, 1000)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed repetitions per checkpoint page')
+
+    def handle(self, *args, **options):
+        pages = options['pages']
+        page_size = options['page_size']
+        repeat = options['repeat']
+
+        with synthetic_user() as user:
+            self.stdout.write(f"Creating {pages * page_size} synthetic flights...")
+            create_synthetic_flights(user, pages * page_size)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE flights_flight')
+
+            client = APIClient(HTTP_HOST='localhost')
+            client.force_authenticate(user)
+
+            # Walk every page once, remembering the URL of each checkpoint page.
+            urls = {}
+            url = f"/api/flights/?page_size={page_size}"
+            walk_start = time.perf_counter()
+            for page in range(1, pages + 1):
+                if page in self.checkpoints:
+                    urls[page] = url
+                response = client.get(url)
+                assert response.status_code == 200, response.content
+                url = response.data['next']
+                if url is None:
+                    break
+            walk_elapsed = time.perf_counter() - walk_start
+            self.stdout.write(
+                f"Walked {page} pages in {walk_elapsed:.2f}s "
+                f"({walk_elapsed / page * 1000:.2f} ms/page)"
+            )
+
+            flights = Flight.objects.filter(user=user).order_by('-departure_time', '-id')
+            self.stdout.write(
+                f"\n{'page':>6} {'request ms':>11} {'keyset query ms':>16} {'offset query ms':>16}"
+            )
+            for page, page_url in sorted(urls.items()):
+                offset = (page - 1) * page_size
+                keyset_page = flights
+                if offset:
+                    last = flights[offset - 1]
+                    keyset_page = flights.filter(departure_time__lte=last.departure_time).filter(
+                        Q(departure_time__lt=last.departure_time) | Q(pk__lt=last.pk)
+                    )
+
+                request_ms = self.time(lambda: client.get(page_url), repeat)
+                keyset_ms = self.time(lambda: list(keyset_page[:page_size]), repeat)
+                offset_ms = self.time(lambda: list(flights[offset:offset + page_size]), repeat)
+                self.stdout.write(
+                    f"{page:>6} {request_ms:>11.2f} {keyset_ms:>16.2f} {offset_ms:>16.2f}"
+                )
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def time(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,78 @@
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from AirFleet_api.parsers import ORJSONParser
+from AirFleet_api.renderers import ORJSONRenderer, orjson
+from flights.encoders import FlightValuesEncoder
+from flights.models import Flight
+from flights.synthetic import create_synthetic_flights, synthetic_user, synthetic_users
+from users.rankings import compute_rankings
+
+
+class Command(BaseCommand):
+    """Benchmark the orjson renderer and parser against DRF's stdlib JSON"""
+    help = 'Render flight lists and rankings, and parse bulk payloads, with both JSON backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed; both columns use the stdlib'))
+        repeat = options['repeat']
+        stdlib, fast = JSONRenderer(), ORJSONRenderer()
+
+        self.stdout.write(f"{'payload':>22} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+        with synthetic_user() as user:
+            created = 0
+            for size in sorted(options['sizes']):
+                create_synthetic_flights(user, size - created, seed=created)
+                created = size
+                encoder = FlightValuesEncoder()
+                data = encoder.encode(encoder.values(Flight.objects.filter(user=user)))
+                assert stdlib.render(data) == fast.render(data)
+                self.report(f"render {size} flights", lambda: stdlib.render(data), lambda: fast.render(data), repeat)
+
+                body = stdlib.render(data)
+                self.report(
+                    f"parse {size} flights",
+                    lambda: JSONParser().parse(io.BytesIO(body)),
+                    lambda: ORJSONParser().parse(io.BytesIO(body)),
+                    repeat,
+                )
+
+        with synthetic_users(100) as users:
+            for seed, user in enumerate(users):
+                create_synthetic_flights(user, 20, seed=seed)
+            rankings = compute_rankings()
+            assert stdlib.render(rankings) == fast.render(rankings)
+            # Rankings are tiny, so time a batch of renders.
+            self.report(
+                'render rankings x1000',
+                lambda: [stdlib.render(rankings) for _ in range(1000)],
+                lambda: [fast.render(rankings) for _ in range(1000)],
+                repeat,
+            )
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def report(self, name, baseline, candidate, repeat):
+        baseline_ms = self.time(baseline, repeat)
+        candidate_ms = self.time(candidate, repeat)
+        self.stdout.write(
+            f"{name:>22} {baseline_ms:>10.2f} {candidate_ms:>10.2f} {baseline_ms / candidate_ms:>7.1f}x"
+        )
+
+    def time(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
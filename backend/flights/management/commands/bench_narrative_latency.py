@@ -0,0 +1,140 @@
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+import httpx
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from flights.benchmarks import bench_env, free_port, percentile, running, server_command, wait_for_port
+from flights.management.commands.run_fake_openai import add_fake_server_arguments, fake_server
+from flights.models import Flight
+from flights.serializers import FlightSerializer
+from flights.synthetic import create_synthetic_flights, synthetic_user
+
+
+async def narrative(client, payload, poll_interval, timeout):
+    """
+    POST one narrative request and poll its job until it finishes; returns
+    (outcome, seconds), outcome being 'ok', 'failed' (the job failed),
+    'timeout' or the HTTP status / exception name of a refused request.
+    """
+    start = time.perf_counter()
+    try:
+        response = await client.post('/api/generate-narrative/?regenerate=1', json=payload)
+        if response.status_code == 200:
+            return 'ok', time.perf_counter() - start
+        if response.status_code != 202:
+            return str(response.status_code), time.perf_counter() - start
+
+        url = response.json()['url']
+        while time.perf_counter() - start < timeout:
+            await asyncio.sleep(poll_interval)
+            job = (await client.get(url)).json()
+            if job['status'] in ('DONE', 'FAILED'):
+                return ('ok' if job['status'] == 'DONE' else 'failed'), time.perf_counter() - start
+        return 'timeout', time.perf_counter() - start
+    except httpx.HTTPError as e:
+        return type(e).__name__, time.perf_counter() - start
+
+
+async def load(base_url, token, payloads, concurrency, poll_interval, timeout):
+    """Run the payloads `concurrency` at a time; returns (seconds, [(outcome, seconds)])."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency)
+    headers = {'Authorization': f'Bearer {token}'}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits, headers=headers) as client:
+        async def one(payload):
+            async with semaphore:
+                return await narrative(client, payload, poll_interval, timeout)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(payload) for payload in payloads))
+        return time.perf_counter() - start, results
+
+
+class Command(BaseCommand):
+    """Benchmark end-to-end narrative latency against a fake OpenAI API"""
+    help = (
+        'Serve the app and run_narrative_worker against a local fake OpenAI API, drive '
+        '/api/generate-narrative/ at several concurrency levels (submit, then poll the job), '
+        'and report p50/p95/p99 latency and error rates'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 100])
+        parser.add_argument('--server', choices=['asgi', 'wsgi'], default='asgi')
+        parser.add_argument('--workers', type=int, default=2, help='App server processes')
+        parser.add_argument('--worker-threads', type=int, default=16,
+                            help='run_narrative_worker threads, i.e. concurrent LLM calls')
+        parser.add_argument('--poll-interval', type=float, default=0.1, help='Seconds between job polls')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Give up on a narrative after this long')
+        add_fake_server_arguments(parser)
+
+    def handle(self, *args, **options):
+        port = free_port()
+        worker_command = [
+            sys.executable, 'manage.py', 'run_narrative_worker',
+            '--threads', str(options['worker_threads']), '--poll-interval', '0.05',
+        ]
+
+        self.stdout.write(
+            f"{options['server']} ({options['workers']} workers), {options['worker_threads']} worker threads, "
+            f"fake latency {options['latency']}, error rate {options['error_rate']}, "
+            f"429 bursts {options['burst_duration']}s every {options['burst_every']}s\n"
+        )
+        self.stdout.write(
+            f"{'conc':>5} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7}"
+            f" {'upstream':>9} {'429s':>5} {'5xx':>5}  failures"
+        )
+        with synthetic_user() as user, fake_server(options) as fake:
+            create_synthetic_flights(user, 1)
+            flight = Flight.objects.get(user=user)
+            payload = FlightSerializer(flight).data
+            token = str(AccessToken.for_user(user))
+            env = bench_env(
+                fake,
+                DB_CONN_MAX_AGE='0' if options['server'] == 'asgi' else os.environ.get('DB_CONN_MAX_AGE', '600'),
+            )
+            server = server_command(options['server'], port, options['workers'])
+            # The worker logs every upstream retry; keep the table readable.
+            with running(server, env) as process, running(worker_command, env, quiet=True):
+                wait_for_port(port, process)
+                sent = 0
+                for concurrency in options['concurrency']:
+                    # A distinct distance per request, so no two share a job
+                    # or a coalesced LLM call.
+                    payloads = [
+                        {**payload, 'distance': sent + i} for i in range(options['requests'])
+                    ]
+                    sent += options['requests']
+                    upstream_before, responses_before = len(fake.requests), Counter(fake.responses)
+                    elapsed, results = asyncio.run(load(
+                        f'http://127.0.0.1:{port}', token, payloads, concurrency,
+                        options['poll_interval'], options['timeout'],
+                    ))
+                    upstream = Counter(fake.responses)
+                    upstream.subtract(responses_before)
+                    self.report(concurrency, elapsed, results, len(fake.requests) - upstream_before, upstream)
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def report(self, concurrency, elapsed, results, upstream_requests, upstream):
+        latencies = [seconds for outcome, seconds in results if outcome == 'ok']
+        failures = Counter(outcome for outcome, _ in results if outcome != 'ok')
+        error_rate = f"{100 * sum(failures.values()) / len(results):.1f}%"
+        server_errors = sum(count for status, count in upstream.items() if status >= 500)
+        if latencies:
+            timings = (f"{len(latencies) / elapsed:>7.1f} {statistics.median(latencies):>7.2f} "
+                       f"{percentile(latencies, 95):>7.2f} {percentile(latencies, 99):>7.2f}")
+        else:
+            timings = f"{'-':>7} {'-':>7} {'-':>7} {'-':>7}"
+        breakdown = ', '.join(f"{outcome}: {count}" for outcome, count in failures.most_common()) or '-'
+        self.stdout.write(
+            f"{concurrency:>5} {timings} {error_rate:>7} {upstream_requests:>9} "
+            f"{upstream[429]:>5} {server_errors:>5}  {breakdown}"
+        )
@@ -0,0 +1,93 @@
+import asyncio
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from flights.benchmarks import bench_env, free_port, percentile, running, server_command, wait_for_port
+from flights.fake_openai import FakeOpenAIServer
+from flights.models import Flight
+from flights.serializers import FlightSerializer
+from flights.synthetic import create_synthetic_flights, synthetic_user
+
+
+async def load(url, token, payload, total, concurrency):
+    """POST `total` requests, `concurrency` at a time; returns (seconds, latencies, errors)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits, headers={'Authorization': f'Bearer {token}'}) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=payload)
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return time.perf_counter() - start, latencies, errors
+
+
+class Command(BaseCommand):
+    """Benchmark concurrent narrative generation under WSGI (Gunicorn) and ASGI (Uvicorn)"""
+    help = (
+        'Serve the app with Gunicorn and with Uvicorn against a fake OpenAI API, and compare '
+        'throughput and latency of concurrent /api/generate-narrative/async/ requests'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+        parser.add_argument('--latency', type=float, default=1.0, help='Fake model latency in seconds')
+        parser.add_argument('--workers', type=int, default=2, help='Server processes (both servers)')
+        parser.add_argument('--threads', type=int, default=2, help='Threads per Gunicorn worker (as in start.sh)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"model latency {options['latency']}s, {options['requests']} requests, "
+            f"{options['workers']} workers (Gunicorn: {options['threads']} threads each)\n"
+        )
+        self.stdout.write(
+            f"{'server':>6} {'conc':>5} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'errors':>7}"
+        )
+        with synthetic_user() as user, FakeOpenAIServer(latency=options['latency']) as fake:
+            create_synthetic_flights(user, 1)
+            flight = Flight.objects.get(user=user)
+            payload = {'flight_id': flight.pk, **FlightSerializer(flight).data}
+            token = str(AccessToken.for_user(user))
+            # See start.sh: no persistent connections under ASGI.
+            env = bench_env(fake, OPENAI_BREAKER_THRESHOLD='1000000', DB_CONN_MAX_AGE='0')
+
+            for name in ('wsgi', 'asgi'):
+                port = free_port()
+                command = server_command(name, port, options['workers'], threads=options['threads'])
+                with running(command, env) as process:
+                    wait_for_port(port, process)
+                    # regenerate=1: every request calls the model.
+                    url = f"http://127.0.0.1:{port}/api/generate-narrative/async/?regenerate=1"
+                    for concurrency in options['concurrency']:
+                        elapsed, latencies, errors = asyncio.run(
+                            load(url, token, payload, options['requests'], concurrency)
+                        )
+                        self.report(name, concurrency, options['requests'] - errors, elapsed, latencies, errors)
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark complete'))
+
+    def report(self, name, concurrency, done, elapsed, latencies, errors):
+        if not latencies:
+            self.stdout.write(f"{name:>6} {concurrency:>5} {'-':>8} {'-':>7} {'-':>7} {'-':>7} {errors:>7}")
+            return
+        self.stdout.write(
+            f"{name:>6} {concurrency:>5} {done / elapsed:>8.1f} {statistics.median(latencies):>7.2f} "
+            f"{percentile(latencies, 95):>7.2f} {percentile(latencies, 99):>7.2f} {errors:>7}"
+        )
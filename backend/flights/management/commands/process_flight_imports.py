@@ -0,0 +1,43 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from flights.imports import claim_job, run_import
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Worker that runs queued CSV logbook imports"""
+    help = 'Process pending FlightImportJobs, polling for new ones unless --once is given'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no pending jobs')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Validate chunks in a pool of this many processes')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows per chunk (default: FLIGHT_IMPORT_CHUNK_SIZE)')
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Importing job {job.pk} for user {job.user_id}...")
+            try:
+                run_import(job, processes=options['processes'], chunk_size=options['chunk_size'])
+            except Exception:
+                logger.exception(f"Import job {job.pk} failed")
+                self.stdout.write(self.style.ERROR(f"Job {job.pk} failed: {job.error}"))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"Job {job.pk}: {job.rows_created} created, {job.rows_rejected} rejected "
+                f"of {job.rows_processed} rows ({job.throughput} rows/s)"
+            ))
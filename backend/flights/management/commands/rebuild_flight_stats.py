@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.models import UserFlightStats
+
+
+class Command(BaseCommand):
+    """Django command to rebuild or verify the per-user flight totals"""
+    help = 'Recompute UserFlightStats from flights_flight, or check it with --verify'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare stored totals with flights_flight; exit non-zero on drift')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='Limit to this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if not options['verify']:
+            written = UserFlightStats.objects.rebuild(user_ids=user_ids)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt flight stats for {written} users"))
+            return
+
+        expected = UserFlightStats.objects.compute(user_ids)
+        stored = UserFlightStats.objects.all()
+        if user_ids is not None:
+            stored = stored.filter(user_id__in=user_ids)
+        stored = {
+            row.user_id: (row.flight_count, row.total_time, row.total_distance)
+            for row in stored
+        }
+
+        empty = (0, timedelta(0), 0)
+        mismatches = 0
+        for user_id in sorted(set(expected) | set(stored)):
+            want = expected.get(user_id, empty)
+            want = (want[0], want[1] or timedelta(0), want[2] or 0)
+            have = stored.get(user_id)
+            if have is None and user_id in expected:
+                self.stdout.write(self.style.ERROR(f"user {user_id}: missing row, expected {want}"))
+                mismatches += 1
+            elif have is not None and have != want:
+                self.stdout.write(self.style.ERROR(f"user {user_id}: stored {have}, expected {want}"))
+                mismatches += 1
+
+        if mismatches:
+            raise CommandError(f"{mismatches} users have drifted flight stats; run rebuild_flight_stats")
+        self.stdout.write(self.style.SUCCESS(f"Flight stats match for {len(expected)} users"))
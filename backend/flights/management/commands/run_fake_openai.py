@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.fake_openai import FakeOpenAIServer
+
+
+def add_fake_server_arguments(parser):
+    """The FakeOpenAIServer options shared with bench_narrative_latency."""
+    parser.add_argument('--latency', default='0.5',
+                        help='Seconds per completion: SECONDS, uniform:LOW:HIGH, exponential:MEAN '
+                             'or lognormal:MEDIAN:SIGMA (default: 0.5)')
+    parser.add_argument('--token-delay', type=float, default=0.0,
+                        help='Seconds between words of a streamed completion')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Share of completions (0-1) answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--burst-every', type=float, default=0.0,
+                        help='Answer everything with 429 for --burst-duration seconds this often')
+    parser.add_argument('--burst-duration', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def fake_server(options, **kwargs):
+    try:
+        return FakeOpenAIServer(
+            latency=options['latency'], token_delay=options['token_delay'],
+            error_rate=options['error_rate'], error_status=options['error_status'],
+            burst_every=options['burst_every'], burst_duration=options['burst_duration'],
+            seed=options['seed'], **kwargs,
+        )
+    except ValueError as e:
+        raise CommandError(str(e))
+
+
+class Command(BaseCommand):
+    """Stand-in for the OpenAI API, for load testing narratives without cost"""
+    help = (
+        'Serve a fake /v1/chat/completions (normal and streaming) with configurable latency, '
+        'errors and 429 bursts; point OPENAI_BASE_URL at the printed URL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        add_fake_server_arguments(parser)
+
+    def handle(self, *args, **options):
+        with fake_server(options, host=options['host'], port=options['port']) as server:
+            self.stdout.write(f"Fake OpenAI API at {server.base_url} (Ctrl-C to stop)")
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+            self.stdout.write(f"\n{len(server.requests)} requests, responses by status: {dict(server.responses)}")
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from flights.llm import RateLimiter
+from flights.narrative import claim_jobs, run_job
+
+
+def run_in_thread(job, limiter=None):
+    try:
+        if limiter is not None:
+            limiter.acquire()
+        return run_job(job)
+    finally:
+        # Each pool thread has its own connection; don't leave it open
+        # between jobs where the server could time it out.
+        connection.close()
+
+
+class Command(BaseCommand):
+    """Worker that generates queued flight narratives"""
+    help = (
+        'Run NarrativeJobs with a bounded pool of threads and an optional rate limit, '
+        'polling for new ones unless --once is given'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=None,
+                            help='Concurrent LLM calls (default: NARRATIVE_WORKER_THREADS)')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no runnable jobs left')
+        parser.add_argument('--rate-limit', type=float, default=None,
+                            help='Upstream calls per minute, 0 for no limit (default: NARRATIVE_RATE_LIMIT)')
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        threads = options['threads'] or settings.NARRATIVE_WORKER_THREADS
+        rate_limit = settings.NARRATIVE_RATE_LIMIT if options['rate_limit'] is None else options['rate_limit']
+        limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+        running = set()
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='narrative') as pool:
+            while True:
+                close_old_connections()
+                jobs = claim_jobs(threads - len(running)) if len(running) < threads else []
+                for job in jobs:
+                    self.stdout.write(f"Running narrative job {job.pk}")
+                    running.add(pool.submit(run_in_thread, job, limiter))
+
+                if not running:
+                    if options['once']:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = future.result()
+                    self.stdout.write(f"Narrative job {job.pk}: {job.status}")
@@ -0,0 +1,97 @@
+"""
+Application counters
+
+Counters and histograms live in the Django cache, so with a shared cache
+backend every gunicorn worker adds to the same totals (with the default
+per-process cache they are per worker). They are exposed to staff at
+/api/metrics/.
+"""
+from django.core.cache import cache
+
+PREFIX = 'metrics:'
+
+# name -> Counter or Histogram, in registration order
+registry = {}
+
+
+class Counter:
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.key = f"{PREFIX}{name}"
+
+    def incr(self, amount=1):
+        try:
+            cache.incr(self.key, amount)
+        except ValueError:
+            # Missing (first use, or evicted): create it, then add.
+            cache.add(self.key, 0, timeout=None)
+            cache.incr(self.key, amount)
+
+    def value(self):
+        return cache.get(self.key, 0)
+
+    def keys(self):
+        return [self.key]
+
+    def render(self, values):
+        return values.get(self.key, 0)
+
+
+class Histogram:
+    """
+    Bucketed observations (e.g. latencies in ms) kept as one cache counter
+    per bucket, plus the observation count and sum.
+    """
+
+    def __init__(self, name, buckets, description=''):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.count = Counter(f"{name}:count", '')
+        self.sum = Counter(f"{name}:sum", '')
+        self.bucket_counters = [Counter(f"{name}:le:{bound}", '') for bound in self.buckets]
+        self.overflow = Counter(f"{name}:le:inf", '')
+
+    def observe(self, value):
+        self.count.incr()
+        self.sum.incr(int(round(value)))
+        for bound, bucket in zip(self.buckets, self.bucket_counters):
+            if value <= bound:
+                bucket.incr()
+                return
+        self.overflow.incr()
+
+    def keys(self):
+        return [self.count.key, self.sum.key, self.overflow.key] + [bucket.key for bucket in self.bucket_counters]
+
+    def render(self, values):
+        count = values.get(self.count.key, 0)
+        buckets = {str(bound): values.get(bucket.key, 0) for bound, bucket in zip(self.buckets, self.bucket_counters)}
+        buckets['inf'] = values.get(self.overflow.key, 0)
+        return {
+            'count': count,
+            'sum': values.get(self.sum.key, 0),
+            'mean': round(values.get(self.sum.key, 0) / count, 1) if count else None,
+            'buckets': buckets,
+        }
+
+
+def counter(name, description=''):
+    """Return the counter called `name`, registering it on first use."""
+    if name not in registry:
+        registry[name] = Counter(name, description)
+    return registry[name]
+
+
+def histogram(name, buckets, description=''):
+    """Return the histogram called `name`, registering it on first use."""
+    if name not in registry:
+        registry[name] = Histogram(name, buckets, description)
+    return registry[name]
+
+
+def snapshot():
+    """{name: value} for every registered counter and histogram."""
+    values = cache.get_many([key for item in registry.values() for key in item.keys()])
+    return {name: item.render(values) for name, item in registry.items()}
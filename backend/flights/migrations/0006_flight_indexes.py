@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-17 02:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flights', '0005_alter_flight_distance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flight',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='flights', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['user', '-departure_time', '-id'], include=('total_time', 'distance'), name='flight_user_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0006_flight_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='flight',
+            name='flight_user_departure_idx',
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['user', '-departure_time', '-id'], include=('total_time', 'distance', 'updated_at'), name='flight_user_departure_idx'),
+        ),
+    ]
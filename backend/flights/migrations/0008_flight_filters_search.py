@@ -0,0 +1,72 @@
+# Generated by Django 4.2 on 2026-10-17 03:00
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+# Recompute the vector on insert and whenever the searched text changes, so
+# bulk_create and QuerySet.update() stay in sync without any Python code.
+SEARCH_VECTOR_TRIGGER = """
+CREATE OR REPLACE FUNCTION flights_flight_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT'
+        OR NEW.search_vector IS NULL
+        OR NEW.notes IS DISTINCT FROM OLD.notes
+        OR NEW.flight_plan IS DISTINCT FROM OLD.flight_plan
+    THEN
+        NEW.search_vector :=
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.notes, '')), 'A') ||
+            setweight(to_tsvector('pg_catalog.english', coalesce(NEW.flight_plan, '')), 'B');
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER flights_flight_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON flights_flight
+    FOR EACH ROW EXECUTE FUNCTION flights_flight_search_vector_update();
+
+UPDATE flights_flight SET search_vector = NULL;
+"""
+
+DROP_SEARCH_VECTOR_TRIGGER = """
+DROP TRIGGER IF EXISTS flights_flight_search_vector_trigger ON flights_flight;
+DROP FUNCTION IF EXISTS flights_flight_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0007_flight_index_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['user', 'departure_airport', '-departure_time', '-id'], name='flight_user_dep_airport_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['user', 'arrival_airport', '-departure_time', '-id'], name='flight_user_arr_airport_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['user', 'registration_number', '-departure_time', '-id'], name='flight_user_registration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['user', 'aircraft_condition', '-departure_time', '-id'], name='flight_user_condition_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='flight_search_idx'),
+        ),
+        migrations.RunSQL(SEARCH_VECTOR_TRIGGER, DROP_SEARCH_VECTOR_TRIGGER),
+    ]
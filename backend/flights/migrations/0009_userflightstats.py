@@ -0,0 +1,49 @@
+# Generated by Django 4.2 on 2026-10-17 03:04
+
+import datetime
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def backfill_user_flight_stats(apps, schema_editor):
+    Flight = apps.get_model('flights', 'Flight')
+    UserFlightStats = apps.get_model('flights', 'UserFlightStats')
+    totals = Flight.objects.order_by().values('user_id').annotate(
+        flights=Count('id'), time=Sum('total_time'), km=Sum('distance'),
+    )
+    UserFlightStats.objects.bulk_create([
+        UserFlightStats(
+            user_id=row['user_id'],
+            flight_count=row['flights'],
+            total_time=row['time'] or datetime.timedelta(0),
+            total_distance=row['km'] or 0,
+        )
+        for row in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flights', '0008_flight_filters_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserFlightStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='flight_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('flight_count', models.IntegerField(default=0)),
+                ('total_time', models.DurationField(default=datetime.timedelta(0))),
+                ('total_distance', models.BigIntegerField(default=0, help_text='Distance in nautical miles')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user flight stats',
+            },
+        ),
+        migrations.RunPython(backfill_user_flight_stats, migrations.RunPython.noop),
+    ]
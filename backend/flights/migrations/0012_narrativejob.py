@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-17 03:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flights', '0011_flightnarrative'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NarrativeJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inputs', models.JSONField()),
+                ('model', models.CharField(max_length=100)),
+                ('key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('flight', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='narrative_jobs', to='flights.flight')),
+                ('narrative', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='flights.flightnarrative')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='narrative_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='narrativejob',
+            index=models.Index(fields=['status', 'created_at'], name='narrative_job_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='narrativejob',
+            index=models.Index(fields=['user', 'key'], name='narrative_job_user_key_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-17 03:37
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flights', '0012_narrativejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NarrativeBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('jobs', models.ManyToManyField(related_name='batches', to='flights.narrativejob')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='narrative_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0013_narrativebatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NarrativeLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
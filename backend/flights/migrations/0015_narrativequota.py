@@ -0,0 +1,27 @@
+# Generated by Django 4.2 on 2026-10-17 03:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('flights', '0014_narrativelease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NarrativeQuota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requests', models.FloatField()),
+                ('refilled_at', models.DateTimeField()),
+                ('day', models.DateField()),
+                ('tokens_used', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='narrative_quota', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
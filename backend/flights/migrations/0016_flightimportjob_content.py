@@ -0,0 +1,28 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0015_narrativequota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightimportjob',
+            name='content',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='flightimportjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='flightimportjob',
+            name='file',
+            field=models.FileField(blank=True, upload_to='flight_imports/'),
+        ),
+    ]
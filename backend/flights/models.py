@@ -1,12 +1,123 @@
-from django.db import models
+import itertools
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Sum
 from django.core.validators import MinLengthValidator
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchVectorField
+from django.utils import timezone
+
+# Flight columns that feed UserFlightStats.
+STATS_FIELDS = ('user_id', 'total_time', 'distance')
+# Rows re-totalled per statement by a tracked FlightQuerySet.update().
+STATS_UPDATE_CHUNK_SIZE = 1000
+
+
+class StatsDelta:
+    """
+    Per-user changes to (flight_count, total_time, total_distance),
+    accumulated by a write and applied to UserFlightStats in one go.
+    """
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: [0, timedelta(0), 0])
+
+    def add(self, user_id, count, total_time, distance, sign=1):
+        change = self.changes[user_id]
+        change[0] += sign * count
+        change[1] += sign * (total_time or timedelta(0))
+        change[2] += sign * (distance or 0)
+
+    def add_totals(self, totals, sign=1):
+        for user_id, (count, total_time, distance) in totals.items():
+            self.add(user_id, count, total_time, distance, sign=sign)
+
+    def items(self):
+        for user_id, (count, total_time, distance) in self.changes.items():
+            if count or total_time or distance:
+                yield user_id, count, total_time, distance
+
+
+class FlightQuerySet(models.QuerySet):
+    def search(self, text):
+        """Full-text search over notes and flight_plan."""
+        return self.filter(search_vector=SearchQuery(text, config='english', search_type='websearch'))
+
+    def totals_by_user(self):
+        """Return {user_id: (flight_count, total_time, total_distance)}."""
+        rows = self.order_by().values('user_id').annotate(
+            flights=Count('id'), time=Sum('total_time'), km=Sum('distance'),
+        )
+        return {row['user_id']: (row['flights'], row['time'], row['km']) for row in rows}
+
+    # The bulk write paths below keep UserFlightStats in step. Rows are locked
+    # before their totals are read so concurrent writers cannot slip between
+    # the read and the write.
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            created = super().bulk_create(objs, *args, **kwargs)
+            delta = StatsDelta()
+            for flight in created:
+                delta.add(flight.user_id, 1, flight.total_time, flight.distance)
+            UserFlightStats.objects.apply(delta)
+        return created
+
+    def update(self, **kwargs):
+        tracked = {'user', *STATS_FIELDS}
+        if not tracked & set(kwargs):
+            return super().update(**kwargs)
+
+        # The update may move rows out of this queryset's filter, so the
+        # rows are pinned by pk, a chunk at a time to bound the IN lists.
+        with transaction.atomic(using=self.db):
+            locked = self.select_for_update().order_by('pk').values_list('pk', flat=True)
+            pks = locked.iterator(chunk_size=STATS_UPDATE_CHUNK_SIZE)
+            delta = StatsDelta()
+            updated = 0
+            while True:
+                chunk = list(itertools.islice(pks, STATS_UPDATE_CHUNK_SIZE))
+                if not chunk:
+                    break
+                rows = Flight.objects.filter(pk__in=chunk)
+                delta.add_totals(rows.totals_by_user(), sign=-1)
+                updated += super(FlightQuerySet, rows).update(**kwargs)
+                delta.add_totals(rows.totals_by_user())
+            UserFlightStats.objects.apply(delta)
+        return updated
+
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            pks = list(self.select_for_update().order_by().values_list('pk', flat=True))
+            rows = Flight.objects.filter(pk__in=pks)
+            delta = StatsDelta()
+            delta.add_totals(rows.totals_by_user(), sign=-1)
+            deleted = super(FlightQuerySet, rows).delete()
+            UserFlightStats.objects.apply(delta)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class FlightManager(models.Manager.from_queryset(FlightQuerySet)):
+    def get_queryset(self):
+        # The tsvector is maintained and read by Postgres alone; never ship it.
+        return super().get_queryset().defer('search_vector')
+
 
 class Flight(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
-        related_name='flights'
+        related_name='flights',
+        # Covered by the leading column of flight_user_departure_idx.
+        db_index=False,
     )
 
     CONDITION_CHOICES = [
@@ -39,9 +150,373 @@ class Flight(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Kept in sync with notes/flight_plan by a database trigger (migration 0008).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = FlightManager()
 
     class Meta:
         ordering = ['-departure_time']
+        indexes = [
+            # Serves filter(user=...) ordered by -departure_time, including
+            # the (departure_time, id) keyset used by FlightKeysetPagination.
+            # The included columns let per-user totals (rankings) and the
+            # conditional GET aggregate run as index-only scans.
+            models.Index(
+                fields=['user', '-departure_time', '-id'],
+                include=['total_time', 'distance', 'updated_at'],
+                name='flight_user_departure_idx',
+            ),
+            # One index per list filter, each ending in the list ordering so a
+            # filtered page is still read in index order without a sort.
+            models.Index(
+                fields=['user', 'departure_airport', '-departure_time', '-id'],
+                name='flight_user_dep_airport_idx',
+            ),
+            models.Index(
+                fields=['user', 'arrival_airport', '-departure_time', '-id'],
+                name='flight_user_arr_airport_idx',
+            ),
+            models.Index(
+                fields=['user', 'registration_number', '-departure_time', '-id'],
+                name='flight_user_registration_idx',
+            ),
+            models.Index(
+                fields=['user', 'aircraft_condition', '-departure_time', '-id'],
+                name='flight_user_condition_idx',
+            ),
+            # Text matches are combined with the user's rows via a bitmap AND.
+            GinIndex(fields=['search_vector'], name='flight_search_idx'),
+        ]
 
     def __str__(self):
         return f"{self.departure_airport} → {self.arrival_airport} ({self.departure_time.date()})"
+
+    def locked_stats_values(self):
+        """Lock this flight's row and return its stored STATS_FIELDS, if any."""
+        rows = Flight.objects.filter(pk=self.pk).select_for_update().values_list(*STATS_FIELDS)
+        return rows.order_by().first()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'user', *STATS_FIELDS} & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            previous = None if self._state.adding else self.locked_stats_values()
+            super().save(*args, **kwargs)
+            delta = StatsDelta()
+            if previous is not None:
+                delta.add(previous[0], 1, previous[1], previous[2], sign=-1)
+            delta.add(self.user_id, 1, self.total_time, self.distance)
+            UserFlightStats.objects.apply(delta)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = self.locked_stats_values()
+            deleted = super().delete(*args, **kwargs)
+            if previous is not None:
+                delta = StatsDelta()
+                delta.add(previous[0], 1, previous[1], previous[2], sign=-1)
+                UserFlightStats.objects.apply(delta)
+        return deleted
+
+
+class UserFlightStatsManager(models.Manager):
+    def apply(self, delta):
+        """
+        Apply a StatsDelta with F() expressions, so concurrent writers add up
+        instead of overwriting each other.
+        """
+        changed = False
+        for user_id, count, total_time, distance in delta.items():
+            changed = True
+            updated = self.filter(user_id=user_id).update(
+                flight_count=F('flight_count') + count,
+                total_time=F('total_time') + total_time,
+                total_distance=F('total_distance') + distance,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                self.create_from_flights(user_id, count, total_time, distance)
+        if changed:
+            self.changed()
+
+    def create_from_flights(self, user_id, count, total_time, distance):
+        """
+        Create a user's missing row from the full aggregate, which includes
+        this transaction's own write. A concurrent first write for the same
+        user blocks on the primary key until we commit, then finds the row
+        and adds its change (and vice versa), so neither is lost.
+        """
+        totals = self.compute([user_id]).get(user_id, (0, None, None))
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(
+                    user_id=user_id, flight_count=totals[0],
+                    total_time=totals[1] or timedelta(0), total_distance=totals[2] or 0,
+                )
+        except IntegrityError:
+            self.filter(user_id=user_id).update(
+                flight_count=F('flight_count') + count,
+                total_time=F('total_time') + total_time,
+                total_distance=F('total_distance') + distance,
+                updated_at=timezone.now(),
+            )
+
+    def changed(self):
+        # Imported here: users.rankings reads this module's models.
+        from users.rankings import invalidate_rankings
+        transaction.on_commit(invalidate_rankings, using=self.db)
+
+    def compute(self, user_ids=None):
+        """Aggregate flights_flight into {user_id: (count, total_time, distance)}."""
+        flights = Flight.objects.all()
+        if user_ids is not None:
+            flights = flights.filter(user_id__in=user_ids)
+        return flights.totals_by_user()
+
+    def rebuild(self, user_ids=None):
+        """
+        Recompute rows from flights_flight. Returns the number of rows written.
+        """
+        totals = self.compute(user_ids)
+        if user_ids is not None:
+            for user_id in user_ids:
+                totals.setdefault(user_id, (0, timedelta(0), 0))
+
+        with transaction.atomic(using=self.db):
+            for user_id, (count, total_time, distance) in totals.items():
+                self.update_or_create(user_id=user_id, defaults={
+                    'flight_count': count,
+                    'total_time': total_time or timedelta(0),
+                    'total_distance': distance or 0,
+                })
+            if user_ids is None:
+                self.exclude(user_id__in=totals.keys()).update(
+                    flight_count=0, total_time=timedelta(0), total_distance=0, updated_at=timezone.now(),
+                )
+        self.changed()
+        return len(totals)
+
+
+class UserFlightStats(models.Model):
+    """
+    Running per-user totals over Flight.
+
+    Maintained by the Flight/FlightQuerySet write paths, so anything that
+    needs per-user totals reads one row instead of aggregating flights_flight.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='flight_stats',
+    )
+    flight_count = models.IntegerField(default=0)
+    total_time = models.DurationField(default=timedelta(0))
+    total_distance = models.BigIntegerField(
+        default=0,
+        help_text="Distance in nautical miles"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UserFlightStatsManager()
+
+    class Meta:
+        verbose_name_plural = 'user flight stats'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.flight_count} flights"
+
+
+class FlightImportJob(models.Model):
+    """
+    An uploaded CSV logbook, parsed and inserted in the background by the
+    process_flight_imports command. The counters are updated after every
+    chunk so the status endpoint can report progress while it runs.
+
+    The upload is kept in the database (`content`) rather than in MEDIA, so
+    a worker on another machine can read it; it is dropped once the job
+    finishes.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='flight_imports',
+    )
+    # Uploads made before `content` existed.
+    file = models.FileField(upload_to='flight_imports/', blank=True)
+    content = models.BinaryField(default=b'')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    rows_processed = models.IntegerField(default=0)
+    rows_created = models.IntegerField(default=0)
+    rows_rejected = models.IntegerField(default=0)
+    # [{'row': <1-based data row>, 'errors': {...}}], capped at
+    # FLIGHT_IMPORT_MAX_REJECTED entries; rows_rejected has the full count.
+    rejected = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Bumped with every chunk's progress; a RUNNING job that stops moving
+    # belongs to a worker that died.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker claims the oldest pending job.
+            models.Index(fields=['status', 'created_at'], name='flight_import_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
+
+    @property
+    def throughput(self):
+        """Rows processed per second so far, or None before the job starts."""
+        if self.started_at is None:
+            return None
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else None
+
+
+class FlightNarrative(models.Model):
+    """
+    A generated flight narrative, addressed by a hash of the prompt inputs
+    and the model that wrote it (see flights.narrative.narrative_key), so a
+    repeat request for unchanged flight data is a single indexed read.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    flight = models.ForeignKey(
+        Flight,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='narratives',
+    )
+    model = models.CharField(max_length=100)
+    narrative = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Narrative {self.key[:12]} ({self.model})"
+
+
+class NarrativeJob(models.Model):
+    """
+    A queued narrative generation, run by the run_narrative_worker command so
+    the request thread never waits on the LLM.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='narrative_jobs',
+    )
+    flight = models.ForeignKey(
+        Flight,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='narrative_jobs',
+    )
+    # Normalised prompt inputs (flights.narrative.prompt_inputs) and the key
+    # the result will be stored under.
+    inputs = models.JSONField()
+    model = models.CharField(max_length=100)
+    key = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    narrative = models.ForeignKey(
+        FlightNarrative,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='jobs',
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker claims the oldest pending jobs.
+            models.Index(fields=['status', 'created_at'], name='narrative_job_status_idx'),
+            # Finds a user's in-flight job for the same narrative.
+            models.Index(fields=['user', 'key'], name='narrative_job_user_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"Narrative job {self.pk} ({self.status})"
+
+
+class NarrativeBatch(models.Model):
+    """
+    Narratives requested for many flights at once. Each flight has its own
+    NarrativeJob, so one failure doesn't affect the rest; a job already
+    in flight for the same narrative is shared rather than duplicated.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='narrative_batches',
+    )
+    jobs = models.ManyToManyField(NarrativeJob, related_name='batches')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Narrative batch {self.pk}"
+
+
+class NarrativeLease(models.Model):
+    """
+    Marks a narrative key as being generated, so identical requests in other
+    worker processes wait for that result instead of calling the LLM again
+    (see flights.coalesce). Expired leases belong to a worker that died.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Lease {self.key[:12]} until {self.expires_at}"
+
+
+class NarrativeQuota(models.Model):
+    """
+    A user's narrative allowance (see flights.quota): a token bucket of
+    requests, refilled continuously, and the LLM tokens used today. Rows are
+    updated under SELECT ... FOR UPDATE, so every worker sees one state.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='narrative_quota',
+    )
+    # Requests left in the bucket as of `refilled_at`.
+    requests = models.FloatField()
+    refilled_at = models.DateTimeField()
+    day = models.DateField()
+    tokens_used = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Quota for {self.user} ({self.tokens_used} tokens on {self.day})"
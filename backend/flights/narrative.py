@@ -0,0 +1,322 @@
+"""
+Flight narratives
+
+Builds the narrative prompt from the flight fields the frontend posts, and
+stores every generated narrative under a hash of those inputs plus the
+model name. A repeat request for unchanged flight data is answered from the
+database; anything else is queued as a NarrativeJob for the
+run_narrative_worker command, so no request thread waits on the LLM. The
+streaming endpoint instead relays the completion as it is generated, and
+the async endpoint awaits it without holding a thread under ASGI. Identical
+generations running at the same time share one LLM call (flights.coalesce),
+and the tokens each call uses count against its user's daily budget
+(flights.quota).
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import llm
+from .coalesce import asingle_flight, lease_lifetime, single_flight
+from .encoders import FlightValuesEncoder
+from .metrics import counter
+from .models import Flight, FlightNarrative, NarrativeBatch, NarrativeJob
+from .quota import check_budget, record_usage, take_request, take_requests
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt wording or generation parameters change, so stored
+# narratives written with the old prompt are no longer served.
+PROMPT_VERSION = 1
+
+PROMPT_FIELDS = (
+    'departure_airport', 'departure_time', 'arrival_airport', 'arrival_time',
+    'total_time', 'distance', 'registration_number', 'aircraft_condition',
+)
+
+SYSTEM_PROMPT = "You are a helpful assistant that creates engaging flight narratives based on flight data."
+
+cache_hits = counter('narrative_cache_hits', 'Narratives served from the database')
+cache_misses = counter('narrative_cache_misses', 'Narratives generated because none was stored')
+regenerations = counter('narrative_regenerations', 'Narratives regenerated on request (?regenerate=1)')
+
+
+def prompt_inputs(flight_data):
+    """
+    Pick and normalise the prompt inputs from the posted flight data.
+    """
+    missing = [name for name in PROMPT_FIELDS if flight_data.get(name) in (None, '')]
+    if missing:
+        raise ValidationError({name: ['This field is required.'] for name in missing})
+
+    inputs = {name: str(flight_data[name]).strip() for name in PROMPT_FIELDS}
+    inputs['weather_conditions'] = str(flight_data.get('weather_conditions') or 'Unknown').strip()
+    return inputs
+
+
+def build_prompt(inputs):
+    return f"""
+        Generate a concise, focused narrative about this flight:
+        - Departure: {inputs['departure_airport']} at {inputs['departure_time']}
+        - Arrival: {inputs['arrival_airport']} at {inputs['arrival_time']}
+        - Duration: {inputs['total_time']}
+        - Distance: {inputs['distance']} nautical miles
+        - Aircraft: {inputs['registration_number']}
+        - Conditions: {inputs['aircraft_condition']}
+        - Weather: {inputs['weather_conditions']}
+
+        Create a human-friendly summary that captures the highlights and any challenges of this flight.
+        Keep it concise (2-3 sentences) but informative.
+        """
+
+
+def narrative_key(inputs, model):
+    """sha256 over the prompt inputs, model name and prompt version."""
+    payload = json.dumps(
+        {'inputs': inputs, 'model': model, 'version': PROMPT_VERSION},
+        sort_keys=True, separators=(',', ':'),
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def owned_flight(flight_id, user):
+    """The user's flight with id `flight_id`, or None."""
+    try:
+        return Flight.objects.only('id').get(pk=int(flight_id), user=user)
+    except (Flight.DoesNotExist, TypeError, ValueError):
+        return None
+
+
+def build_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def request_narrative(prompt, model):
+    """
+    Ask the LLM for a narrative; returns (narrative, tokens used). Raises
+    CircuitOpenError without calling it while the upstream is failing.
+    """
+    return llm.get_client().complete(build_messages(prompt), model, max_tokens=250, temperature=0.7)
+
+
+def find_narrative(inputs, model, flight=None):
+    """
+    Return the stored narrative for these inputs, or None. Counts the
+    lookup as a cache hit or miss.
+    """
+    stored = FlightNarrative.objects.filter(key=narrative_key(inputs, model)).first()
+    if stored is None:
+        cache_misses.incr()
+        return None
+
+    cache_hits.incr()
+    return attach_flight(stored, flight)
+
+
+def attach_flight(stored, flight):
+    """Link a stored narrative written for anonymous inputs to `flight`."""
+    if flight is not None and stored.flight_id is None:
+        stored.flight = flight
+        stored.save(update_fields=['flight', 'updated_at'])
+    return stored
+
+
+def store_narrative(inputs, model, narrative, flight=None):
+    """
+    Store (or replace) the narrative for these inputs. Identical inputs
+    share one row, possibly between users, so replacing the text of an
+    existing row leaves its flight alone; it is only linked to `flight` if
+    it has none yet.
+    """
+    with transaction.atomic():
+        stored, created = FlightNarrative.objects.select_for_update().get_or_create(
+            key=narrative_key(inputs, model), defaults={'model': model, 'narrative': narrative, 'flight': flight},
+        )
+        if not created:
+            stored.model, stored.narrative = model, narrative
+            stored.save(update_fields=['model', 'narrative', 'updated_at'])
+    return attach_flight(stored, flight)
+
+
+def generate_narrative(inputs, model, flight=None, user=None):
+    """
+    Call the LLM and store (or replace) the narrative for these inputs, or
+    share the result of an identical call already running. The tokens used
+    are charged to `user`.
+    """
+    with single_flight(narrative_key(inputs, model)) as stored:
+        if stored is not None:
+            return attach_flight(stored, flight)
+        narrative, tokens = request_narrative(build_prompt(inputs), model)
+        record_usage(user, tokens)
+        return store_narrative(inputs, model, narrative, flight)
+
+
+async def agenerate_narrative(inputs, model, flight=None, user=None):
+    """generate_narrative() for async views."""
+    async with asingle_flight(narrative_key(inputs, model)) as stored:
+        if stored is not None:
+            return await sync_to_async(attach_flight)(stored, flight)
+        narrative, tokens = await llm.get_client().acomplete(
+            build_messages(build_prompt(inputs)), model, max_tokens=250, temperature=0.7,
+        )
+        await sync_to_async(record_usage)(user, tokens)
+        return await sync_to_async(store_narrative)(inputs, model, narrative, flight)
+
+
+def stream_narrative(inputs, model, flight=None, user=None):
+    """
+    Yield the narrative text as the LLM generates it, storing the whole
+    narrative once the stream completes. A stream abandoned part way (e.g.
+    the client disconnected) stores nothing. If an identical request is
+    already generating, its narrative is yielded whole once it is stored.
+    """
+    with single_flight(narrative_key(inputs, model)) as stored:
+        if stored is not None:
+            yield attach_flight(stored, flight).narrative
+            return
+        parts = []
+        messages = build_messages(build_prompt(inputs))
+        stream = llm.get_client().stream(
+            messages, model, on_usage=lambda tokens: record_usage(user, tokens), max_tokens=250, temperature=0.7,
+        )
+        for text in stream:
+            parts.append(text)
+            yield text
+        store_narrative(inputs, model, ''.join(parts).strip(), flight)
+
+
+def lookup_narrative(flight_data, user, regenerate=False):
+    """
+    Validate a narrative request. Returns (inputs, model, flight, stored),
+    where `stored` is the narrative that already answers it, if any.
+    """
+    model = settings.OPENAI_NARRATIVE_MODEL
+    inputs = prompt_inputs(flight_data)
+    flight = owned_flight(flight_data.get('flight_id'), user) if flight_data.get('flight_id') else None
+
+    if regenerate:
+        regenerations.incr()
+        return inputs, model, flight, None
+    return inputs, model, flight, find_narrative(inputs, model, flight)
+
+
+def enqueue_narrative(flight_data, user, regenerate=False):
+    """
+    Return (FlightNarrative, None) when a stored narrative answers the
+    request, otherwise (None, NarrativeJob) for a queued generation. A
+    user's identical in-flight job is reused instead of queueing another;
+    a new one takes a request from the user's quota (429 when it's spent).
+    """
+    inputs, model, flight, stored = lookup_narrative(flight_data, user, regenerate)
+    if stored is not None:
+        return stored, None
+
+    key = narrative_key(inputs, model)
+    job = NarrativeJob.objects.filter(user=user, key=key, status__in=['PENDING', 'RUNNING']).first()
+    if job is None:
+        take_request(user)
+        job = NarrativeJob.objects.create(user=user, flight=flight, inputs=inputs, model=model, key=key)
+    return None, job
+
+
+def enqueue_batch(flights, user, regenerate=False):
+    """
+    Queue narratives for the flights in the queryset and return
+    (NarrativeBatch, deferred flight ids). Flights whose narrative is
+    stored get a finished job straight away; the rest share in-flight jobs
+    where possible. Each new generation takes a request from the user's
+    quota: flights beyond what the bucket holds are left out of the batch
+    and returned as deferred (429 if none fit). Inputs are built from the
+    API representation of each flight, so they match what the frontend
+    posts for the same flight.
+    """
+    model = settings.OPENAI_NARRATIVE_MODEL
+    encoder = FlightValuesEncoder(fields=['id', *PROMPT_FIELDS])
+    wanted = []
+    for row in encoder.encode(encoder.values(flights)):
+        inputs = prompt_inputs(row)
+        wanted.append((row['id'], inputs, narrative_key(inputs, model)))
+    keys = {key for _, _, key in wanted}
+
+    stored = {} if regenerate else FlightNarrative.objects.in_bulk(keys, field_name='key')
+    jobs = {
+        job.key: job
+        for job in NarrativeJob.objects.filter(user=user, key__in=keys, status__in=['PENDING', 'RUNNING'])
+    }
+    now = timezone.now()
+    new_jobs = []
+    for flight_id, inputs, key in wanted:
+        if key in jobs:
+            continue
+        job = NarrativeJob(user=user, flight_id=flight_id, inputs=inputs, model=model, key=key)
+        if key in stored:
+            job.status, job.narrative, job.started_at, job.finished_at = 'DONE', stored[key], now, now
+        jobs[key] = job
+        new_jobs.append(job)
+
+    with transaction.atomic():
+        generations = [job for job in new_jobs if job.status == 'PENDING']
+        granted = take_requests(user, len(generations))
+        deferred_keys = {job.key for job in generations[granted:]}
+        new_jobs = [job for job in new_jobs if job.key not in deferred_keys]
+        NarrativeJob.objects.bulk_create(new_jobs)
+        batch = NarrativeBatch.objects.create(user=user)
+        batch.jobs.add(*(job for key, job in jobs.items() if key not in deferred_keys))
+
+    (regenerations if regenerate else cache_misses).incr(granted)
+    cache_hits.incr(len(stored))
+    deferred = [flight_id for flight_id, _, key in wanted if key in deferred_keys]
+    return batch, deferred
+
+
+def claim_jobs(limit):
+    """
+    Mark up to `limit` of the oldest runnable jobs as running and return
+    them. Jobs left RUNNING by a worker that died are picked up again after
+    NARRATIVE_JOB_TIMEOUT seconds, or once the slowest possible generation
+    would have finished (coalesce.lease_lifetime()) if that is later, so a
+    job still retrying upstream is never run twice.
+    """
+    timeout = max(settings.NARRATIVE_JOB_TIMEOUT, lease_lifetime())
+    stale = timezone.now() - timedelta(seconds=timeout)
+    with transaction.atomic():
+        jobs = list(
+            NarrativeJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='PENDING') | Q(status='RUNNING', started_at__lt=stale))
+            .order_by('created_at')[:limit]
+        )
+        now = timezone.now()
+        NarrativeJob.objects.filter(pk__in=[job.pk for job in jobs]).update(status='RUNNING', started_at=now)
+    for job in jobs:
+        job.status, job.started_at = 'RUNNING', now
+    return jobs
+
+
+def run_job(job):
+    """
+    Generate a claimed job's narrative and record the outcome. A job whose
+    user has used up today's token budget since it was queued fails.
+    """
+    try:
+        check_budget(job.user)
+        job.narrative = generate_narrative(job.inputs, job.model, job.flight, job.user)
+        job.status = 'DONE'
+    except Exception as e:
+        logger.error(f"Narrative job {job.pk} failed: {str(e)}")
+        job.status = 'FAILED'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['narrative', 'status', 'error', 'finished_at'])
+    return job
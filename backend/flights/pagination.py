@@ -0,0 +1,105 @@
+"""
+Keyset (cursor) pagination for flight lists.
+
+Pages are addressed by the (departure_time, id) of the last row on the
+previous page instead of an OFFSET, so fetching page 1000 costs the same
+index range scan as fetching page 1.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class FlightKeysetPagination(BasePagination):
+    """
+    Paginate flights newest first, using `id` to break departure time ties.
+
+    Pagination is opt-in: it only applies when the request carries a
+    `cursor` or `page_size` query parameter, so clients that expect the
+    plain list keep working.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 500
+    ordering = ('-departure_time', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            departure_time, pk = position
+            # The `lte` bound gives Postgres an index range condition; the OR
+            # only has to discard rows that share the boundary departure time.
+            queryset = queryset.filter(departure_time__lte=departure_time).filter(
+                Q(departure_time__lt=departure_time) | Q(pk__lt=pk)
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_position(self, row):
+        # Rows are model instances, or dicts from FlightValuesEncoder.values().
+        if isinstance(row, dict):
+            return row['departure_time'], row['id']
+        return row.departure_time, row.pk
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            decoded = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            timestamp, pk = decoded.rsplit('|', 1)
+            departure_time = parse_datetime(timestamp)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if departure_time is None:
+            raise NotFound(self.invalid_cursor_message)
+        return departure_time, pk
+
+    def encode_cursor(self, position):
+        departure_time, pk = position
+        token = f"{departure_time.isoformat()}|{pk}"
+        return urlsafe_b64encode(token.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,114 @@
+"""
+Per-user narrative quotas
+
+Every narrative request that will call the LLM takes one request from the
+user's token bucket (NARRATIVE_USER_RATE per minute, up to
+NARRATIVE_USER_BURST at once), and is refused while the user has used up
+NARRATIVE_USER_DAILY_TOKENS LLM tokens today. A batch takes one request
+per generation it queues and queues no more than the bucket holds; queued
+jobs check the budget again when the worker runs them. Token use is taken
+from the `usage` the completions API reports. Refusals are DRF Throttled
+errors: 429 with Retry-After.
+
+State is a NarrativeQuota row per user, read and written under SELECT ...
+FOR UPDATE, so all workers share it. The budget is checked before a call
+and charged after it, so requests already in flight can overshoot it by
+one narrative each.
+"""
+import math
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+
+from .metrics import counter
+from .models import NarrativeQuota
+
+rejections = counter('narrative_quota_rejections', 'Narrative requests refused by a per-user rate limit or budget')
+tokens_used = counter('openai_tokens', 'Tokens used by OpenAI completions (prompt and completion)')
+
+
+def locked_quota(user, now):
+    """The user's NarrativeQuota, locked for the current transaction and reset if a new day began."""
+    quota, _ = NarrativeQuota.objects.select_for_update().get_or_create(
+        user=user,
+        defaults={'requests': settings.NARRATIVE_USER_BURST, 'refilled_at': now, 'day': timezone.localdate(now)},
+    )
+    if quota.day != timezone.localdate(now):
+        quota.day = timezone.localdate(now)
+        quota.tokens_used = 0
+    return quota
+
+
+def seconds_until_tomorrow(now):
+    tomorrow = datetime.combine(timezone.localdate(now) + timedelta(days=1), time.min)
+    return (timezone.make_aware(tomorrow) - now).total_seconds()
+
+
+def throttled(detail, wait):
+    rejections.incr()
+    # Whole seconds, rounded up: Retry-After is an integer.
+    return Throttled(wait=math.ceil(wait), detail=detail)
+
+
+def check_budget(user):
+    """Raise Throttled if the user has no LLM tokens left today."""
+    budget = settings.NARRATIVE_USER_DAILY_TOKENS
+    if not budget:
+        return
+    now = timezone.now()
+    used = NarrativeQuota.objects.filter(user=user, day=timezone.localdate(now)).values_list('tokens_used', flat=True)
+    if used and used[0] >= budget:
+        raise throttled("Daily narrative budget used up.", seconds_until_tomorrow(now))
+
+
+def take_request(user):
+    """
+    Take one request from the user's bucket. Raises Throttled when the
+    bucket is empty or the daily token budget is used up.
+    """
+    take_requests(user, 1)
+
+
+def take_requests(user, count):
+    """
+    Take up to `count` requests from the user's bucket and return how many
+    were taken. Raises Throttled when not even one is left, or the daily
+    token budget is used up.
+    """
+    rate, burst, budget = (
+        settings.NARRATIVE_USER_RATE, settings.NARRATIVE_USER_BURST, settings.NARRATIVE_USER_DAILY_TOKENS,
+    )
+    if count < 1 or (not rate and not budget):
+        return count
+
+    with transaction.atomic():
+        now = timezone.now()
+        quota = locked_quota(user, now)
+        if budget and quota.tokens_used >= budget:
+            raise throttled("Daily narrative budget used up.", seconds_until_tomorrow(now))
+        if rate:
+            elapsed = max((now - quota.refilled_at).total_seconds(), 0)
+            quota.requests = min(burst, quota.requests + elapsed * rate / 60)
+            quota.refilled_at = now
+            if quota.requests < 1:
+                raise throttled("Narrative rate limit exceeded.", (1 - quota.requests) * 60 / rate)
+            count = min(count, int(quota.requests))
+            quota.requests -= count
+        quota.save()
+    return count
+
+
+def record_usage(user, tokens):
+    """Charge `tokens` LLM tokens to the user's daily budget."""
+    if not tokens:
+        return
+    tokens_used.incr(tokens)
+    if user is None:
+        return
+    with transaction.atomic():
+        quota = locked_quota(user, timezone.now())
+        quota.tokens_used += tokens
+        quota.save()
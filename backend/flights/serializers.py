@@ -1,12 +1,22 @@
 from rest_framework import serializers
-from .models import Flight
+from collections import Counter
+from .models import Flight, FlightImportJob, NarrativeBatch, NarrativeJob
 from datetime import datetime, timedelta
 
 class FlightSerializer(serializers.ModelSerializer):
     class Meta:
         model = Flight
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('user',)  # Make user field read-only
+
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, e.g. FlightSerializer(flights, fields=['id', 'notes'])
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
     
     def validate(self, data):
         """
@@ -20,7 +30,40 @@ class FlightSerializer(serializers.ModelSerializer):
         if abs((duration - data['total_time']).total_seconds()) > 1:
             raise serializers.ValidationError("Total time does not match departure and arrival times")
         
-        if data['distance'] < 0:
+        # Optional (the model defaults it to 0), so it may be absent.
+        if data.get('distance', 0) < 0:
             raise serializers.ValidationError("Distance cannot be negative")
         
-        return data 
\ No newline at end of file
+        return data
+
+
+class FlightImportJobSerializer(serializers.ModelSerializer):
+    throughput = serializers.ReadOnlyField(help_text="Rows processed per second")
+
+    class Meta:
+        model = FlightImportJob
+        exclude = ('user', 'file', 'content')
+        read_only_fields = [field.name for field in FlightImportJob._meta.fields]
+
+
+class NarrativeJobSerializer(serializers.ModelSerializer):
+    narrative = serializers.CharField(source='narrative.narrative', default=None, read_only=True)
+
+    class Meta:
+        model = NarrativeJob
+        fields = ('id', 'status', 'flight', 'narrative', 'error', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+
+class NarrativeBatchSerializer(serializers.ModelSerializer):
+    counts = serializers.SerializerMethodField(help_text="Jobs per status")
+    jobs = NarrativeJobSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = NarrativeBatch
+        fields = ('id', 'created_at', 'counts', 'jobs')
+        read_only_fields = fields
+
+    def get_counts(self, batch):
+        counts = Counter(job.status for job in batch.jobs.all())
+        return {status.lower(): counts[status] for status, _ in NarrativeJob.STATUS_CHOICES}
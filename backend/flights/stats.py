@@ -0,0 +1,97 @@
+"""
+Per-user logbook statistics
+
+All totals and breakdowns come from a single GROUPING SETS query, so the
+cost is one pass over the user's rows and the response size depends on
+the breakdown limits, not on the size of the logbook.
+"""
+from django.db import connection
+
+STATS_SQL = """
+SELECT
+    CASE
+        WHEN GROUPING(registration_number) = 0 THEN 'aircraft'
+        WHEN GROUPING(departure_airport, arrival_airport) = 0 THEN 'route'
+        WHEN GROUPING(date_trunc('month', departure_time AT TIME ZONE 'UTC')) = 0 THEN 'month'
+        ELSE 'total'
+    END AS breakdown,
+    registration_number,
+    departure_airport,
+    arrival_airport,
+    date_trunc('month', departure_time AT TIME ZONE 'UTC') AS month,
+    COUNT(*) AS flights,
+    COALESCE(SUM(total_time), INTERVAL '0') AS total_time,
+    COALESCE(SUM(distance), 0) AS distance
+FROM flights_flight
+WHERE user_id = %s
+GROUP BY GROUPING SETS (
+    (),
+    (registration_number),
+    (departure_airport, arrival_airport),
+    (date_trunc('month', departure_time AT TIME ZONE 'UTC'))
+)
+"""
+
+
+def hours(duration):
+    return round(duration.total_seconds() / 3600, 1)
+
+
+def most_flown(row):
+    return -row['flights'], -row['total_time']
+
+
+def totals(row):
+    return {
+        'flights': row['flights'],
+        'hours': hours(row['total_time']),
+        'distance': row['distance'],
+    }
+
+
+def flight_stats(user, limit=5, months=12):
+    """
+    Summarise a user's logbook.
+
+    Args:
+        user: Owner of the flights
+        limit: Number of aircraft and routes to include (most flown first)
+        months: Number of most recent months to include
+
+    Returns:
+        Dictionary with overall totals and per-aircraft, per-route and
+        per-month breakdowns
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(STATS_SQL, [user.pk])
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, values)) for values in cursor.fetchall()]
+
+    groups = {'total': [], 'aircraft': [], 'route': [], 'month': []}
+    for row in rows:
+        groups[row['breakdown']].append(row)
+
+    # GROUPING SETS always yields the grand total row, even with no flights.
+    overall = groups['total'][0]
+
+    return {
+        'total_flights': overall['flights'],
+        'total_hours': hours(overall['total_time']),
+        'total_distance': overall['distance'],
+        'by_aircraft': [
+            {'registration_number': row['registration_number'], **totals(row)}
+            for row in sorted(groups['aircraft'], key=most_flown)[:limit]
+        ],
+        'by_route': [
+            {
+                'departure_airport': row['departure_airport'],
+                'arrival_airport': row['arrival_airport'],
+                **totals(row),
+            }
+            for row in sorted(groups['route'], key=most_flown)[:limit]
+        ],
+        'by_month': [
+            {'month': row['month'].strftime('%Y-%m'), **totals(row)}
+            for row in sorted(groups['month'], key=lambda row: row['month'], reverse=True)[:months]
+        ],
+    }
@@ -0,0 +1,110 @@
+"""
+Synthetic flight data
+
+Generates deterministic, realistic-looking logbooks for the benchmark
+commands and the query-plan tests. Nothing here is used on the request path.
+"""
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+
+from .models import Flight
+
+AIRPORTS = [
+    'KJFK', 'KLAX', 'KSFO', 'KORD', 'KBOS', 'KSEA', 'KDEN', 'KATL',
+    'KMIA', 'KDFW', 'EGLL', 'LFPG', 'EDDF', 'EHAM', 'RJTT', 'YSSY',
+]
+REGISTRATIONS = [f"N{number}AF" for number in range(100, 140)]
+CONDITIONS = [choice for choice, _ in Flight.CONDITION_CHOICES]
+WAYPOINTS = [
+    'GREKI', 'JUDDS', 'MERIT', 'HFD', 'PUT', 'BOSOX', 'SAX', 'PARKE',
+    'LANNA', 'BIGGY', 'ROBBS', 'DYLIN', 'CAMRN', 'SHIPP', 'WAVEY', 'BETTE',
+]
+NOTES = [
+    'Smooth ride, light chop on descent.',
+    'Holding pattern for 15 minutes due to traffic.',
+    'Crosswind landing, gusts up to 25 knots.',
+    'Fuel stop added because of headwinds.',
+    'Bird strike reported on climb out, inspection clean.',
+    'Runway change on arrival, vectored for the ILS.',
+    'Icing in the climb, anti-ice on through FL180.',
+    'Passenger medical issue, met by paramedics on arrival.',
+]
+
+
+def synthetic_flights(user, count, seed=0, start=None):
+    """
+    Yield `count` unsaved Flight instances for `user`.
+
+    Args:
+        user: Owner of the generated flights
+        count: Number of flights to generate
+        seed: Random seed, so repeated runs produce the same logbook
+        start: Earliest departure time (defaults to 2015-01-01 UTC)
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2015, 1, 1, tzinfo=timezone.utc)
+    span_minutes = 10 * 365 * 24 * 60
+
+    for _ in range(count):
+        departure_time = start + timedelta(minutes=rng.randrange(span_minutes))
+        total_time = timedelta(minutes=rng.randrange(30, 900))
+        departure_airport, arrival_airport = rng.sample(AIRPORTS, 2)
+        route = ' '.join(rng.sample(WAYPOINTS, rng.randrange(2, 10)))
+        yield Flight(
+            user=user,
+            departure_airport=departure_airport,
+            arrival_airport=arrival_airport,
+            departure_time=departure_time,
+            arrival_time=departure_time + total_time,
+            total_time=total_time,
+            flight_plan=f"{departure_airport} {route} {arrival_airport}",
+            notes=' '.join(rng.sample(NOTES, rng.randrange(0, 4))),
+            aircraft_condition=rng.choice(CONDITIONS),
+            registration_number=rng.choice(REGISTRATIONS),
+            distance=rng.randrange(50, 6000),
+        )
+
+
+def create_synthetic_flights(user, count, seed=0, batch_size=5000):
+    """
+    Insert `count` synthetic flights for `user` in batches and return the count.
+    """
+    batch = []
+    for flight in synthetic_flights(user, count, seed=seed):
+        batch.append(flight)
+        if len(batch) >= batch_size:
+            Flight.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Flight.objects.bulk_create(batch)
+    return count
+
+
+@contextmanager
+def synthetic_users(count, prefix='bench'):
+    """
+    Create `count` throwaway users and delete them (and their flights) afterwards.
+    """
+    User = get_user_model()
+    batch = uuid.uuid4().hex[:10]
+    users = User.objects.bulk_create([
+        User(username=f"{prefix}-{batch}-{i}", email=f"{prefix}-{batch}-{i}@example.com", password='!')
+        for i in range(count)
+    ])
+    try:
+        yield users
+    finally:
+        User.objects.filter(username__startswith=f"{prefix}-{batch}-").delete()
+
+
+@contextmanager
+def synthetic_user(prefix='bench'):
+    """
+    Create a throwaway user and delete it (and its flights) afterwards.
+    """
+    with synthetic_users(1, prefix=prefix) as users:
+        yield users[0]
@@ -1,3 +1,1668 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+import zlib
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import httpx
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.http import HttpResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from AirFleet_api.middleware import CompressionMiddleware, negotiate
+from AirFleet_api.parsers import ORJSONParser
+from AirFleet_api.renderers import ORJSONRenderer
+from . import coalesce, direct_openai, export, llm
+from .direct_openai import DirectOpenAI, backoff_delay, parse_retry_after
+from .encoders import FlightValuesEncoder
+from .llm import CircuitBreaker, CircuitOpenError, RateLimiter
+from .fake_openai import FakeOpenAIServer, latency_sampler
+from .models import (
+    Flight, FlightImportJob, FlightNarrative, NarrativeJob, NarrativeLease, NarrativeQuota,
+    StatsDelta, UserFlightStats,
+)
+from .serializers import FlightSerializer
+from .stats import flight_stats
+from .narrative import claim_jobs, generate_narrative, narrative_key, prompt_inputs, store_narrative
+from .pagination import FlightKeysetPagination
+from .synthetic import synthetic_flights
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are checked against PostgreSQL')
+class FlightQueryPlanTests(SimpleTestCase):
+    """
+    Run the key flight queries against a large synthetic dataset and fail if
+    Postgres has to fall back to a sequential scan or an explicit sort.
+
+    The dataset is committed and vacuumed (so the visibility map is as it would
+    be in production) rather than wrapped in a test transaction.
+    """
+    databases = {'default'}
+    heavy_flights = 10000
+    light_users = 400
+    light_flights = 100
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='heavy', email='heavy@example.com', password='pw')
+        users = User.objects.bulk_create([
+            User(username=f"light{i}", email=f"light{i}@example.com", password='!')
+            for i in range(cls.light_users)
+        ])
+
+        flights = list(synthetic_flights(cls.user, cls.heavy_flights))
+        for seed, user in enumerate(users, start=1):
+            flights.extend(synthetic_flights(user, cls.light_flights, seed=seed))
+        Flight.objects.bulk_create(flights, batch_size=5000)
+        cls.flight = Flight.objects.filter(user=cls.user).first()
+        cls.light_user = users[0]
+
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE flights_flight')
+            cursor.execute('VACUUM ANALYZE users_customuser')
+
+    @classmethod
+    def tearDownClass(cls):
+        get_user_model().objects.all().delete()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def capture_plans(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        plans = []
+        for query in captured.captured_queries:
+            if 'flights_flight' not in query['sql']:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {query['sql']}")
+                plans.append((query['sql'], cursor.fetchone()[0][0]['Plan']))
+        self.assertTrue(plans, f"No flight queries captured for {url}")
+        return plans
+
+    def walk(self, node):
+        yield node
+        for child in node.get('Plans', []):
+            yield from self.walk(child)
+
+    def assertIndexedPlan(self, url, allow_sort=False):
+        """
+        Fail on a seq scan or sort of flight rows. `allow_sort` permits ordering
+        a set that was already narrowed down through an index (full-text matches).
+        """
+        for sql, plan in self.capture_plans(url):
+            for node in self.walk(plan):
+                if node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == 'flights_flight':
+                    self.fail(f"Sequential scan on flights_flight for {url}:\n{sql}")
+                if node['Node Type'] in ('Sort', 'Incremental Sort') and not allow_sort:
+                    self.fail(f"Explicit sort on {node.get('Sort Key')} for {url}:\n{sql}")
+
+    def test_list_uses_index_order(self):
+        # Dumping a heavy user's entire logbook is legitimately cheaper as a
+        # seq scan plus sort; large logbooks are expected to paginate.
+        self.client.force_authenticate(self.light_user)
+        self.assertIndexedPlan('/api/flights/')
+
+    def test_paginated_list_uses_index_order(self):
+        first = self.client.get('/api/flights/?page_size=50')
+        self.assertIndexedPlan('/api/flights/?page_size=50')
+        self.assertIndexedPlan(first.data['next'])
+
+    def test_filters_use_indexes(self):
+        for query in (
+            'departure_airport=KJFK',
+            'arrival_airport=EGLL',
+            'registration_number=N120AF',
+            'aircraft_condition=GROUNDED',
+            'departure_after=2020-01-01&departure_before=2020-03-31',
+            'departure_airport=KJFK&aircraft_condition=GOOD&departure_after=2018-01-01',
+        ):
+            with self.subTest(query=query):
+                self.assertIndexedPlan(f"/api/flights/?page_size=50&{query}")
+
+    def test_text_search_uses_gin_index(self):
+        self.assertIndexedPlan('/api/flights/?page_size=50&q=volcanic ash', allow_sort=True)
+        self.assertIndexedPlan('/api/flights/?page_size=50&q=icing&departure_airport=KBOS', allow_sort=True)
+
+    def test_detail_uses_primary_key(self):
+        self.assertIndexedPlan(f"/api/flights/{self.flight.pk}/")
+
+    def test_rankings_read_user_totals(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/rankings/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), 1)
+        self.assertNotIn('"flights_flight"', captured.captured_queries[0]['sql'])
+        self.assertEqual(response.data['flights'][0]['total_flights'], self.heavy_flights)
+
+        # Served from cache (RankingsTests covers invalidation).
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get('/api/rankings/')
+        self.assertEqual(len(captured), 0)
+
+
+class RankingsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.many, self.long, self.none = (
+            User.objects.create_user(username=name, email=f'{name}@example.com', password='pw')
+            for name in ('many', 'long', 'none')
+        )
+        flights = list(synthetic_flights(self.many, 3))
+        for flight in flights:
+            flight.total_time, flight.distance = timedelta(hours=1), 100
+        self.long_flight = next(synthetic_flights(self.long, 1, seed=1))
+        self.long_flight.total_time, self.long_flight.distance = timedelta(hours=10), 5000
+        with self.captureOnCommitCallbacks(execute=True):
+            Flight.objects.bulk_create([*flights, self.long_flight])
+        self.client = APIClient()
+
+    def rankings(self):
+        response = self.client.get('/api/rankings/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ordering_and_shape(self):
+        self.assertEqual(self.rankings(), {
+            'flights': [{'username': 'many', 'total_flights': 3}, {'username': 'long', 'total_flights': 1}],
+            'time': [{'username': 'long', 'total_time': '10:00:00'}, {'username': 'many', 'total_time': '3:00:00'}],
+            'distance': [{'username': 'long', 'total_distance': 5000}, {'username': 'many', 'total_distance': 300}],
+        })
+
+    def test_limit_and_ties(self):
+        # Users without flights are not ranked; ties go to the older account.
+        tied = next(synthetic_flights(self.none, 1, seed=2))
+        tied.total_time, tied.distance = timedelta(hours=10), 5000
+        with self.captureOnCommitCallbacks(execute=True):
+            tied.save()
+        with mock.patch('users.rankings.LIMIT', 2):
+            rankings = self.rankings()
+        self.assertEqual([row['username'] for row in rankings['flights']], ['many', 'long'])
+        self.assertEqual([row['username'] for row in rankings['time']], ['long', 'none'])
+
+    def test_flight_writes_invalidate_cache(self):
+        self.rankings()
+        flight = next(synthetic_flights(self.none, 1, seed=2))
+        flight.total_time, flight.distance = timedelta(hours=20), 1
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.save()
+        self.assertEqual(self.rankings()['time'][0], {'username': 'none', 'total_time': '20:00:00'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Flight.objects.filter(pk=flight.pk).update(distance=9000)
+        self.assertEqual(self.rankings()['distance'][0], {'username': 'none', 'total_distance': 9000})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.delete()
+        self.assertNotIn('none', [row['username'] for row in self.rankings()['time']])
+
+        # Writes that leave the totals alone keep the cached copy.
+        with self.captureOnCommitCallbacks(execute=True):
+            Flight.objects.filter(user=self.many).update(notes='Checked')
+        with CaptureQueriesContext(connection) as captured:
+            self.rankings()
+        self.assertEqual(len(captured), 0)
+
+
+class FlightValuesEncoderContractTests(TestCase):
+    """
+    FlightValuesEncoder must render byte for byte what FlightSerializer does,
+    for every field and for sparse fieldsets.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        flights = list(synthetic_flights(cls.user, 20))
+        departure = datetime(2024, 2, 29, 23, 59, 59, 123456, tzinfo=dt_timezone.utc)
+        flights[0].departure_time = departure
+        flights[0].arrival_time = departure + timedelta(days=1, hours=2, microseconds=5)
+        flights[0].total_time = flights[0].arrival_time - departure
+        flights[0].notes = 'Überflug — “smooth” ✈ 雲'
+        flights[0].departure_gate = 'B12'
+        flights[0].photo = 'flight_photos/tail number.jpg'
+        flights[1].distance = 0
+        Flight.objects.bulk_create(flights)
+        cls.flights = Flight.objects.filter(user=cls.user).order_by('-departure_time', '-id')
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def assertSameOutput(self, fields=None, context=None):
+        expected = FlightSerializer(self.flights, many=True, fields=fields, context=context or {}).data
+        encoder = FlightValuesEncoder(fields=fields, context=context)
+        self.assertEqual(self.render(encoder.encode(encoder.values(self.flights))), self.render(expected))
+
+    def test_full_representation(self):
+        self.assertSameOutput()
+
+    def test_sparse_fieldsets(self):
+        for name in FlightSerializer().fields:
+            with self.subTest(field=name):
+                self.assertSameOutput(fields=[name])
+        self.assertSameOutput(fields=['notes', 'id', 'photo', 'total_time'])
+
+    def test_absolute_photo_urls_with_request(self):
+        request = APIRequestFactory().get('/api/flights/', HTTP_HOST='testserver')
+        self.assertSameOutput(context={'request': request})
+
+    def test_list_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for url in ('/api/flights/', '/api/flights/?page_size=7', '/api/flights/?fields=id,photo,created_at'):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200)
+                results = response.data['results'] if 'page_size' in url else response.data
+                fields = ['id', 'photo', 'created_at'] if 'fields' in url else None
+                expected = FlightSerializer(self.flights[:len(results)], many=True, fields=fields).data
+                self.assertEqual(self.render(results), self.render(expected))
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class FlightFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        flights = list(synthetic_flights(cls.user, 3))
+        for flight, day in zip(flights, (1, 2, 3)):
+            flight.departure_time = utc(2020, 2, day, 12)
+            flight.arrival_time = flight.departure_time + flight.total_time
+        flights[0].departure_airport = 'KJFK'
+        flights[1].departure_airport = flights[2].departure_airport = 'KBOS'
+        Flight.objects.bulk_create(flights)
+        cls.flights = flights
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, query):
+        response = self.client.get(f'/api/flights/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {flight['id'] for flight in response.data}
+
+    def test_filters(self):
+        first, second, third = (flight.pk for flight in self.flights)
+        self.assertEqual(self.ids('departure_airport=kbos'), {second, third})
+        self.assertEqual(self.ids('departure_after=2020-02-02'), {second, third})
+        # A bare date as the upper bound covers that whole day.
+        self.assertEqual(self.ids('departure_before=2020-02-02'), {first, second})
+        self.assertEqual(self.ids('departure_after=2020-02-02T13:00&departure_before=2020-02-03T12:00'), {third})
+
+    def test_invalid_bounds_are_400(self):
+        for value in ('yesterday', '2020-13-01', '2020-02-30', '2020-02-30T00:00', '2020-01-01T25:00'):
+            for name in ('departure_after', 'departure_before'):
+                with self.subTest(name=name, value=value):
+                    response = self.client.get('/api/flights/', {name: value})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn(name, response.data)
+
+        self.assertEqual(self.client.get('/api/flights/?aircraft_condition=SHINY').status_code, 400)
+
+    def test_invalid_bounds_in_bulk_selection(self):
+        patch = self.client.patch('/api/flights/bulk/?departure_after=2020-02-30', {'notes': 'x'}, format='json')
+        delete = self.client.delete('/api/flights/bulk/?departure_before=2020-13-01')
+        self.assertEqual((patch.status_code, delete.status_code), (400, 400))
+        self.assertEqual(Flight.objects.filter(user=self.user).count(), 3)
+        self.assertFalse(Flight.objects.filter(notes='x').exists())
+
+
+class FlightConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.flights = list(synthetic_flights(self.user, 3))
+        Flight.objects.bulk_create(self.flights)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_etag(self):
+        response = self.client.get('/api/flights/')
+        etag = response['ETag']
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(self.client.get('/api/flights/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Another query string is another representation.
+        self.assertEqual(self.client.get('/api/flights/?limit=1', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # A deletion leaves Max(updated_at) alone but changes the ETag.
+        Flight.objects.filter(pk=self.flights[0].pk).delete()
+        response = self.client.get('/api/flights/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        # If-Modified-Since alone never yields a stale 304.
+        future = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        self.assertEqual(self.client.get('/api/flights/', HTTP_IF_MODIFIED_SINCE=future).status_code, 200)
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_revalidating_compressed_list(self):
+        client = APIClient(HTTP_ACCEPT_ENCODING='gzip')
+        client.force_authenticate(self.user)
+        response = client.get('/api/flights/')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        not_modified = client.get('/api/flights/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+    def test_etag_varies_on_accept(self):
+        as_json = self.client.get('/api/flights/', HTTP_ACCEPT='application/json')
+        as_html = self.client.get('/api/flights/', HTTP_ACCEPT='text/html')
+        self.assertNotEqual(as_json['ETag'], as_html['ETag'])
+        response = self.client.get('/api/flights/', HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=as_json['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_validators(self):
+        flight = self.flights[0]
+        url = f'/api/flights/{flight.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        flight.notes = 'Changed'
+        flight.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['notes'], 'Changed')
+
+
+class FlightPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        flights = list(synthetic_flights(self.user, 10))
+        # Ties on departure_time must be split by id across page boundaries.
+        for flight in flights[:5]:
+            flight.departure_time = utc(2021, 6, 1, 9)
+            flight.arrival_time = flight.departure_time + flight.total_time
+        Flight.objects.bulk_create(flights)
+        self.expected = list(
+            Flight.objects.filter(user=self.user).order_by('-departure_time', '-id').values_list('pk', flat=True)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [flight['id'] for flight in response.data['results']]
+            url, pages = response.data['next'], pages + 1
+        return ids, pages
+
+    def test_walks_every_flight_once(self):
+        for page_size in (1, 2, 3, 4, 10, 11):
+            with self.subTest(page_size=page_size):
+                ids, pages = self.walk(f'/api/flights/?page_size={page_size}')
+                self.assertEqual(ids, self.expected)
+                self.assertEqual(pages, -(-len(self.expected) // page_size))
+
+    def test_page_size_and_plain_list(self):
+        self.assertIsInstance(self.client.get('/api/flights/').data, list)
+        for value, expected in (('0', 10), ('x', 10), ('-1', 10), ('4', 4)):
+            with self.subTest(page_size=value):
+                response = self.client.get('/api/flights/', {'page_size': value})
+                self.assertEqual(len(response.data['results']), expected)
+        with mock.patch.object(FlightKeysetPagination, 'max_page_size', 2):
+            self.assertEqual(len(self.client.get('/api/flights/?page_size=5').data['results']), 2)
+
+    def test_invalid_cursor(self):
+        for cursor in ('!!!', 'bm90LWEtY3Vyc29y', urlsafe_b64encode(b'yesterday|5').decode(),
+                       urlsafe_b64encode(b'2021-06-01T09:00:00+00:00|x').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/flights/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.flights = list(synthetic_flights(self.user, 3))
+        Flight.objects.bulk_create(self.flights)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # The last query reads the rows; the ones before it check validators.
+        return response, queries[-1]['sql']
+
+    def test_list_selects_requested_columns(self):
+        response, sql = self.get('/api/flights/?fields=id, ,notes')
+        self.assertEqual([set(flight) for flight in response.data], [{'id', 'notes'}] * 3)
+        self.assertIn('"flights_flight"."notes"', sql)
+        self.assertNotIn('"flights_flight"."flight_plan"', sql)
+
+        # The keyset column is read even when it isn't returned.
+        response, _ = self.get('/api/flights/?fields=id&page_size=2')
+        self.assertEqual(set(response.data['results'][0]), {'id'})
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_detail_defers_unrequested_columns(self):
+        response, sql = self.get(f'/api/flights/{self.flights[0].pk}/?fields=departure_airport,distance')
+        self.assertEqual(response.data, {
+            'departure_airport': self.flights[0].departure_airport, 'distance': self.flights[0].distance,
+        })
+        self.assertNotIn('"flights_flight"."notes"', sql)
+        self.assertNotIn('"flights_flight"."flight_plan"', sql)
+
+        # Without ?fields= the whole representation comes back.
+        response, _ = self.get(f'/api/flights/{self.flights[0].pk}/')
+        self.assertEqual(set(response.data), set(FlightSerializer().fields))
+
+    def test_unknown_fields(self):
+        for url in ('/api/flights/?fields=id,wings,rotor', f'/api/flights/{self.flights[0].pk}/?fields=id,wings,rotor'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'fields': ['Unknown field(s): rotor, wings']})
+
+def flight_payload(**fields):
+    departure = utc(2024, 5, 1, 8)
+    payload = {
+        'departure_airport': 'KJFK', 'arrival_airport': 'KBOS',
+        'departure_time': departure.isoformat(), 'arrival_time': (departure + timedelta(hours=1)).isoformat(),
+        'total_time': '01:00:00', 'registration_number': 'N123AF', 'distance': 160,
+    }
+    payload.update(fields)
+    return {name: value for name, value in payload.items() if value is not None}
+
+
+class FlightBulkCreateTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, items, mode=None):
+        url = '/api/flights/bulk/' + (f'?mode={mode}' if mode else '')
+        return self.client.post(url, items, format='json')
+
+    def test_creates_all(self):
+        # distance is optional and defaults to 0.
+        response = self.post([flight_payload(), flight_payload(distance=None, notes='No distance')])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['errors'], [])
+        self.assertEqual([flight['distance'] for flight in response.data['created']], [160, 0])
+        self.assertEqual(Flight.objects.filter(user=self.user).count(), 2)
+
+    def test_atomic_rejects_everything(self):
+        items = [flight_payload(), flight_payload(distance=-5), flight_payload(total_time='03:00:00'), 'junk']
+        response = self.post(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertEqual(response.data['errors'][0]['errors'], {'non_field_errors': ['Distance cannot be negative']})
+        self.assertFalse(Flight.objects.exists())
+
+    def test_partial_creates_valid_items(self):
+        items = [flight_payload(distance=-5), flight_payload(), flight_payload(departure_airport=None)]
+        response = self.post(items, mode='partial')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 1)
+        self.assertEqual(response.data['errors'], [
+            {'index': 0, 'errors': {'non_field_errors': ['Distance cannot be negative']}},
+            {'index': 2, 'errors': {'departure_airport': ['This field is required.']}},
+        ])
+        self.assertEqual(Flight.objects.filter(user=self.user).count(), 1)
+
+        # Nothing valid at all is still a 400.
+        self.assertEqual(self.post([flight_payload(distance=-1)], mode='partial').status_code, 400)
+
+    def test_request_shape_and_size(self):
+        self.assertEqual(self.post(flight_payload()).status_code, 400)
+        self.assertEqual(self.post([flight_payload()], mode='sometimes').status_code, 400)
+        with override_settings(FLIGHT_BULK_MAX_ITEMS=2):
+            response = self.post([flight_payload()] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 2', response.data['non_field_errors'][0])
+        self.assertFalse(Flight.objects.exists())
+
+
+class FlightBulkEditTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        self.flights = list(synthetic_flights(self.user, 5))
+        for flight in self.flights:
+            flight.departure_airport = 'KJFK'
+        self.flights[0].departure_airport = 'KBOS'
+        self.theirs = next(synthetic_flights(self.other, 1))
+        self.theirs.departure_airport = 'KJFK'
+        Flight.objects.bulk_create([*self.flights, self.theirs])
+        self.long_ago = utc(2020, 1, 1)
+        Flight.objects.update(updated_at=self.long_ago)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_patch_updates_selection_only(self):
+        response = self.client.patch('/api/flights/bulk/?departure_airport=KJFK', {'notes': 'Bulk'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 4})
+        changed = Flight.objects.filter(notes='Bulk')
+        self.assertEqual(set(changed.values_list('user', flat=True)), {self.user.pk})
+        self.assertEqual(changed.count(), 4)
+        # updated_at moves with the change, so ETags and Last-Modified do too.
+        self.assertFalse(changed.filter(updated_at=self.long_ago).exists())
+        self.assertEqual(Flight.objects.filter(updated_at=self.long_ago).count(), 2)
+
+        # Another user's flight is never selected, even by id.
+        url = f'/api/flights/bulk/?ids={self.flights[0].pk},{self.theirs.pk}'
+        self.assertEqual(self.client.patch(url, {'distance': 7}, format='json').data, {'updated': 1})
+        self.assertNotEqual(Flight.objects.get(pk=self.theirs.pk).distance, 7)
+        call_command('rebuild_flight_stats', verify=True, stdout=io.StringIO())
+
+    def test_patch_validation_and_dry_run(self):
+        for query, data in (
+            ('', {'notes': 'x'}),
+            ('?ids=1,x', {'notes': 'x'}),
+            ('?departure_airport=KJFK', {}),
+            ('?departure_airport=KJFK', {'departure_time': '2024-01-01T00:00:00Z'}),
+            ('?departure_airport=KJFK', {'distance': -1}),
+            ('?departure_airport=KJFK', {'aircraft_condition': 'SHINY'}),
+        ):
+            with self.subTest(query=query, data=data):
+                self.assertEqual(self.client.patch(f'/api/flights/bulk/{query}', data, format='json').status_code, 400)
+
+        response = self.client.patch('/api/flights/bulk/?departure_airport=KJFK&dry_run=1', {'notes': 'x'}, format='json')
+        self.assertEqual(response.data, {'dry_run': True, 'matched': 4})
+        self.assertFalse(Flight.objects.filter(notes='x').exists())
+
+    def test_delete_in_chunks(self):
+        self.assertEqual(self.client.delete('/api/flights/bulk/').status_code, 400)
+        response = self.client.delete('/api/flights/bulk/?departure_airport=KJFK&dry_run=1')
+        self.assertEqual(response.data, {'dry_run': True, 'matched': 4})
+
+        with override_settings(FLIGHT_BULK_DELETE_CHUNK_SIZE=3), CaptureQueriesContext(connection) as queries:
+            response = self.client.delete('/api/flights/bulk/?departure_airport=KJFK')
+        self.assertEqual(response.data, {'deleted': 4})
+        deletes = [query for query in queries if query['sql'].startswith('DELETE FROM "flights_flight"')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(set(Flight.objects.values_list('pk', flat=True)), {self.flights[0].pk, self.theirs.pk})
+        call_command('rebuild_flight_stats', verify=True, stdout=io.StringIO())
+
+
+class FlightExportTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        Flight.objects.bulk_create([*synthetic_flights(self.user, 5), *synthetic_flights(other, 2)])
+        self.flights = list(Flight.objects.filter(user=self.user).order_by('-departure_time', '-id'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/flights/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="logbook.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        expected = json.loads(JSONRenderer().render(FlightSerializer(self.flights, many=True).data))
+        self.assertEqual(rows, expected)
+
+    def test_csv(self):
+        response, body = self.export('?type=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        reader = csv.DictReader(io.StringIO(body.decode()))
+        self.assertEqual(reader.fieldnames, list(FlightSerializer().fields))
+        rows = list(reader)
+        self.assertEqual([int(row['id']) for row in rows], [flight.pk for flight in self.flights])
+        first = rows[0]
+        self.assertEqual(first['departure_airport'], self.flights[0].departure_airport)
+        self.assertEqual(int(first['distance']), self.flights[0].distance)
+        self.assertEqual(first['photo'], '')
+
+    async def test_stream_under_asgi(self):
+        produced = []
+
+        def one_block_per_row(lines):
+            for line in lines:
+                produced.append(line)
+                yield line
+
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.user)))()
+        with mock.patch.object(export, 'blocks', one_block_per_row):
+            response = await AsyncClient().get(
+                '/api/flights/export/', headers={'Authorization': f'Bearer {token}'},
+            )
+            self.assertTrue(response.is_async)
+            arrivals = []
+            async for chunk in response.streaming_content:
+                arrivals.append((len(produced), chunk))
+        # Each block is sent as soon as it is produced, not after the last one.
+        self.assertEqual([count for count, _ in arrivals], list(range(1, len(self.flights) + 1)))
+        self.assertEqual(
+            [json.loads(chunk)['id'] for _, chunk in arrivals], [flight.pk for flight in self.flights],
+        )
+
+    def test_gzip_and_filters(self):
+        _, plain = self.export('?type=csv')
+        response, body = self.export('?type=csv&gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="logbook.csv.gz"')
+        self.assertEqual(gzip.decompress(body), plain)
+
+        airport = self.flights[0].departure_airport
+        _, body = self.export(f'?departure_airport={airport}')
+        self.assertEqual(
+            [json.loads(line)['id'] for line in body.splitlines()],
+            [flight.pk for flight in self.flights if flight.departure_airport == airport],
+        )
+        self.assertEqual(self.client.get('/api/flights/export/?type=xml').status_code, 400)
+
+
+class FlightStatsQueryTests(TestCase):
+    """The GROUPING SETS query must agree with the same totals computed by the ORM."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        Flight.objects.bulk_create([*synthetic_flights(self.user, 200), *synthetic_flights(other, 20, seed=1)])
+
+    def breakdown(self, *fields, **expressions):
+        """{group: (flights, hours, distance)} for the user's flights, from the ORM."""
+        rows = (
+            Flight.objects.filter(user=self.user).annotate(**expressions).order_by().values(*fields)
+            .annotate(flights=Count('id'), time=Sum('total_time'), km=Sum('distance'))
+        )
+        return {
+            tuple(row[name] for name in fields): (row['flights'], round(row['time'].total_seconds() / 3600, 1), row['km'])
+            for row in rows
+        }
+
+    def test_matches_orm(self):
+        stats = flight_stats(self.user, limit=1000, months=1000)
+        total = Flight.objects.filter(user=self.user).aggregate(
+            flights=Count('id'), time=Sum('total_time'), km=Sum('distance'),
+        )
+        self.assertEqual(
+            (stats['total_flights'], stats['total_hours'], stats['total_distance']),
+            (total['flights'], round(total['time'].total_seconds() / 3600, 1), total['km']),
+        )
+
+        def grouped(rows, *fields):
+            return {tuple(row[name] for name in fields): (row['flights'], row['hours'], row['distance']) for row in rows}
+
+        self.assertEqual(
+            grouped(stats['by_aircraft'], 'registration_number'), self.breakdown('registration_number'),
+        )
+        self.assertEqual(
+            grouped(stats['by_route'], 'departure_airport', 'arrival_airport'),
+            self.breakdown('departure_airport', 'arrival_airport'),
+        )
+        months = self.breakdown('month', month=TruncMonth('departure_time', tzinfo=dt_timezone.utc))
+        self.assertEqual(
+            grouped(stats['by_month'], 'month'),
+            {(month.strftime('%Y-%m'),): values for (month,), values in months.items()},
+        )
+
+    def test_limits_and_order(self):
+        stats = flight_stats(self.user, limit=3, months=2)
+        self.assertEqual(len(stats['by_aircraft']), 3)
+        flights = [row['flights'] for row in stats['by_route']]
+        self.assertEqual(flights, sorted(flights, reverse=True))
+        self.assertEqual(len(stats['by_month']), 2)
+        self.assertGreater(stats['by_month'][0]['month'], stats['by_month'][1]['month'])
+
+    def test_empty_logbook(self):
+        nobody = get_user_model().objects.create_user(username='new', email='new@example.com', password='pw')
+        self.assertEqual(flight_stats(nobody), {
+            'total_flights': 0, 'total_hours': 0.0, 'total_distance': 0,
+            'by_aircraft': [], 'by_route': [], 'by_month': [],
+        })
+
+def import_csv(*rows):
+    """A CSV upload with a header row for `rows` of flight_payload() dicts."""
+    header = list(dict.fromkeys(name for row in rows for name in row))
+    lines = [','.join(header)] + [','.join(str(row.get(name, '')) for name in header) for row in rows]
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+class FlightImportTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, fileobj):
+        fileobj.name = 'logbook.csv'
+        response = self.client.post('/api/flights/import/', {'file': fileobj}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        return response.data['id']
+
+    def process(self, job_id, **options):
+        call_command('process_flight_imports', once=True, stdout=io.StringIO(), **options)
+        return self.client.get(f'/api/flights/import/{job_id}/').data
+
+    def test_imports_rows_and_reports_rejects(self):
+        job_id = self.upload(import_csv(
+            flight_payload(), flight_payload(distance=None), flight_payload(distance=-5), flight_payload(),
+        ))
+        self.assertEqual(FlightImportJob.objects.get(pk=job_id).status, 'PENDING')
+
+        job = self.process(job_id, chunk_size=3)
+        self.assertEqual(job['status'], 'DONE')
+        self.assertEqual((job['rows_processed'], job['rows_created'], job['rows_rejected']), (4, 3, 1))
+        self.assertEqual(job['rejected'], [{'row': 3, 'errors': {'non_field_errors': ['Distance cannot be negative']}}])
+        # An empty cell falls back to the model default.
+        self.assertEqual(sorted(Flight.objects.filter(user=self.user).values_list('distance', flat=True)), [0, 160, 160])
+        # The upload is dropped once the job is over.
+        self.assertEqual(bytes(FlightImportJob.objects.get(pk=job_id).content), b'')
+
+    def test_missing_columns_fail_the_job(self):
+        job_id = self.upload(io.BytesIO(b'departure_airport,arrival_airport\nKJFK,KBOS\n'))
+        with self.assertLogs('flights.management.commands.process_flight_imports', 'ERROR'):
+            job = self.process(job_id)
+        self.assertEqual(job['status'], 'FAILED')
+        self.assertIn('departure_time', job['error'])
+        self.assertFalse(Flight.objects.exists())
+
+    def test_stale_running_job_is_resumed(self):
+        rows = [flight_payload(notes=str(i)) for i in range(5)]
+        # A worker died after committing the first two rows.
+        Flight.objects.bulk_create(Flight(user=self.user, **FlightSerializer().to_internal_value(row)) for row in rows[:2])
+        job = FlightImportJob.objects.create(
+            user=self.user, content=import_csv(*rows).getvalue(), status='RUNNING',
+            rows_processed=2, rows_created=2, started_at=timezone.now(),
+        )
+
+        # Not yet stale: left alone.
+        self.assertEqual(self.process(job.pk)['status'], 'RUNNING')
+
+        FlightImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        data = self.process(job.pk)
+        self.assertEqual(data['status'], 'DONE')
+        self.assertEqual((data['rows_processed'], data['rows_created']), (5, 5))
+        self.assertEqual(
+            sorted(Flight.objects.filter(user=self.user).values_list('notes', flat=True)), ['0', '1', '2', '3', '4'],
+        )
+
+
+class FlightStatsTests(TransactionTestCase):
+    """UserFlightStats must match a rebuild from flights_flight after every write path."""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+
+    def assertStatsMatch(self):
+        call_command('rebuild_flight_stats', verify=True, stdout=io.StringIO())
+        stored = {row.user_id: (row.flight_count, row.total_time, row.total_distance)
+                  for row in UserFlightStats.objects.all()}
+        for user_id, (count, total_time, distance) in UserFlightStats.objects.compute().items():
+            self.assertEqual(stored[user_id], (count, total_time, distance))
+
+    def test_stats_delta(self):
+        delta = StatsDelta()
+        delta.add(1, 1, timedelta(hours=2), 100)
+        delta.add(1, 1, timedelta(hours=2), 100, sign=-1)
+        delta.add_totals({2: (3, timedelta(hours=1), None)})
+        self.assertEqual(list(delta.items()), [(2, 3, timedelta(hours=1), 0)])
+
+    def test_write_paths_match_rebuild(self):
+        flight = next(synthetic_flights(self.user, 1))
+        flight.save()
+        self.assertStatsMatch()
+        Flight.objects.bulk_create(list(synthetic_flights(self.user, 5, seed=1)) + list(synthetic_flights(self.other, 3)))
+        self.assertStatsMatch()
+
+        flight.distance += 50
+        flight.save()
+        flight.notes = 'Untracked'
+        flight.save(update_fields=['notes'])
+        self.assertStatsMatch()
+
+        flights = Flight.objects.filter(user=self.user)
+        flights.update(distance=F('distance') + 10)
+        self.assertStatsMatch()
+        with mock.patch('flights.models.STATS_UPDATE_CHUNK_SIZE', 2):
+            # Moves rows out of the queryset's own filter, chunk by chunk.
+            self.assertEqual(flights.filter(distance__gt=0).update(user=self.other), 6)
+        self.assertStatsMatch()
+        self.assertEqual(UserFlightStats.objects.get(user=self.user).flight_count, 0)
+
+        Flight.objects.filter(user=self.other)[:1].get().delete()
+        self.assertStatsMatch()
+        Flight.objects.filter(user=self.other, distance__gt=300).delete()
+        self.assertStatsMatch()
+        Flight.objects.all().delete()
+        self.assertStatsMatch()
+        self.assertEqual(UserFlightStats.objects.get(user=self.other).flight_count, 0)
+
+    def test_missing_row_is_built_from_all_flights(self):
+        Flight.objects.bulk_create(synthetic_flights(self.user, 3))
+        UserFlightStats.objects.all().delete()
+        next(synthetic_flights(self.user, 1, seed=2)).save()
+        self.assertEqual(UserFlightStats.objects.get(user=self.user).flight_count, 4)
+        self.assertStatsMatch()
+
+    def test_concurrent_first_flights(self):
+        first, second = synthetic_flights(self.user, 2)
+        created = threading.Event()
+
+        def save_first():
+            with transaction.atomic():
+                first.save()
+                created.set()
+                # Hold the new stats row uncommitted while the second write
+                # looks for it.
+                time.sleep(0.5)
+            connection.close()
+
+        thread = threading.Thread(target=save_first)
+        thread.start()
+        created.wait()
+        second.save()
+        thread.join()
+        self.assertEqual(UserFlightStats.objects.get(user=self.user).flight_count, 2)
+        self.assertStatsMatch()
+
+
+class ORJSONTests(SimpleTestCase):
+    """The orjson renderer and parser must be interchangeable with DRF's."""
+
+    payload = {
+        'departure_time': datetime(2024, 2, 29, 23, 59, 59, 123456, tzinfo=dt_timezone.utc),
+        'naive': datetime(2024, 1, 1, 8, 30),
+        'date': datetime(2024, 1, 1).date(),
+        'total_time': timedelta(hours=1, minutes=30),
+        'fuel': Decimal('12.50'),
+        'id': uuid.UUID(int=1),
+        'notes': 'Überflug “smooth” ✈ 雲 \u2028 \u2029',
+        'nested': [{1: None, 'ok': True}, (1.5, -2)],
+    }
+
+    def test_renders_like_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+
+    def test_indented_output_uses_drf(self):
+        media_type = 'application/json; indent=4'
+        self.assertEqual(
+            ORJSONRenderer().render(self.payload, media_type),
+            JSONRenderer().render(self.payload, media_type),
+        )
+
+    def test_parses_like_drf(self):
+        body = JSONRenderer().render(self.payload)
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body)),
+        )
+        for invalid in (b'{"a": NaN}', b'{"a": 1', b'\xff'):
+            with self.subTest(body=invalid), self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(invalid))
+
+    def test_parses_integers_wider_than_64_bits(self):
+        body = b'{"n": 123456789012345678901234567890, "m": -18446744073709551616}'
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(body)),
+            {'n': 123456789012345678901234567890, 'm': -18446744073709551616},
+        )
+
+
+@override_settings(COMPRESSION_ENCODINGS=['gzip'], COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(SimpleTestCase):
+    body = b'{"departure_airport":"KJFK","aircraft_condition":"AIRWORTHY"}' * 50
+
+    def process(self, response, accept_encoding='gzip, deflate'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_negotiation(self):
+        encodings = ['zstd', 'br', 'gzip']
+        self.assertEqual(negotiate('gzip, br, zstd', encodings), 'zstd')
+        self.assertEqual(negotiate('gzip;q=1.0, br;q=0.5', encodings), 'gzip')
+        self.assertEqual(negotiate('*;q=0.1, zstd;q=0', encodings), 'br')
+        self.assertIsNone(negotiate('identity', encodings))
+        self.assertIsNone(negotiate('', encodings))
+
+    def test_compresses_large_json(self):
+        response = HttpResponse(self.body, content_type='application/json')
+        response['ETag'] = '"abc"'
+        response = self.process(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+
+    def test_streaming_chunks_are_flushed(self):
+        chunks = [self.body[:1000], self.body[1000:]]
+        response = self.process(StreamingHttpResponse(iter(chunks), content_type='application/x-ndjson'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        compressed = list(response.streaming_content)
+        # Every input chunk produces decodable output before the next arrives.
+        self.assertEqual(zlib_decompress_prefix(compressed[0]), chunks[0])
+        self.assertEqual(gzip.decompress(b''.join(compressed)), self.body)
+
+    def test_not_modified_matches_compressed_etag(self):
+        compressed = self.process(HttpResponse(self.body, content_type='application/json', headers={'ETag': '"abc"'}))
+        not_modified = self.process(HttpResponse(status=304, headers={'ETag': '"abc"'}))
+        self.assertEqual(not_modified['ETag'], compressed['ETag'])
+        self.assertIn('Accept-Encoding', not_modified['Vary'])
+        self.assertFalse(not_modified.has_header('Content-Encoding'))
+        # Nothing would have been compressed: the ETag stays strong.
+        self.assertEqual(self.process(HttpResponse(status=304, headers={'ETag': '"abc"'}), 'identity')['ETag'], '"abc"')
+
+    def test_skips(self):
+        cases = [
+            (HttpResponse(b'{}', content_type='application/json'), 'gzip'),
+            (HttpResponse(self.body, content_type='application/json'), 'identity'),
+            (HttpResponse(self.body, content_type='image/png'), 'gzip'),
+            (HttpResponse(self.body, content_type='application/gzip'), 'gzip'),
+        ]
+        for response, accept_encoding in cases:
+            with self.subTest(content_type=response['Content-Type'], accept_encoding=accept_encoding):
+                self.assertFalse(self.process(response, accept_encoding).has_header('Content-Encoding'))
+
+
+def zlib_decompress_prefix(data):
+    """Decompress a gzip stream that has been flushed but not finished."""
+    return zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(data)
+
+
+def parse_sse(body):
+    """[(event, data), ...] from a text/event-stream body with JSON data."""
+    events = []
+    for block in body.decode('utf-8').split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@override_settings(NARRATIVE_USER_RATE=0, NARRATIVE_USER_DAILY_TOKENS=0)
+class NarrativeJobTests(TransactionTestCase):
+    """
+    Queue narratives through the API and run them with the worker command
+    against a local fake OpenAI server. The worker's pool threads use their
+    own connections, hence TransactionTestCase. Quotas are off here; see
+    NarrativeQuotaTests.
+    """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.flight = next(synthetic_flights(self.user, 1))
+        self.flight.save()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.payload = {
+            'flight_id': self.flight.pk,
+            **{name: str(getattr(self.flight, name)) for name in (
+                'departure_airport', 'arrival_airport', 'departure_time', 'arrival_time',
+                'total_time', 'distance', 'registration_number', 'aircraft_condition',
+            )},
+        }
+
+    def run_worker(self, server, **options):
+        with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+            call_command('run_narrative_worker', once=True, stdout=io.StringIO(), **options)
+
+    def test_queue_poll_and_cache(self):
+        response = self.client.post('/api/generate-narrative/', self.payload, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'PENDING')
+        url = response.data['url']
+
+        # Asking again while it is queued reuses the same job.
+        again = self.client.post('/api/generate-narrative/', self.payload, format='json')
+        self.assertEqual(again.data['id'], response.data['id'])
+
+        with FakeOpenAIServer() as server:
+            self.run_worker(server, threads=2)
+        self.assertEqual(len(server.requests), 1)
+        self.assertIn(self.flight.departure_airport, server.requests[0]['messages'][-1]['content'])
+
+        job = self.client.get(url).data
+        self.assertEqual(job['status'], 'DONE')
+        self.assertTrue(job['narrative'].startswith('Narrative #1'))
+        self.assertEqual(FlightNarrative.objects.get().flight_id, self.flight.pk)
+
+        cached = self.client.post('/api/generate-narrative/', self.payload, format='json')
+        self.assertEqual(cached.status_code, 200)
+        self.assertEqual(cached.data, {'narrative': job['narrative'], 'cached': True})
+
+        regenerate = self.client.post('/api/generate-narrative/?regenerate=1', self.payload, format='json')
+        self.assertEqual(regenerate.status_code, 202)
+
+    def stream(self, server, payload, query=''):
+        with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+            response = self.client.post(f'/api/generate-narrative/stream/{query}', payload, format='json')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            return parse_sse(b''.join(response.streaming_content))
+
+    def test_stream(self):
+        with FakeOpenAIServer() as server:
+            events = self.stream(server, self.payload)
+            self.assertEqual(len(server.requests), 1)
+            self.assertTrue(server.requests[0]['stream'])
+
+            tokens = [data['text'] for event, data in events if event == 'token']
+            self.assertGreater(len(tokens), 3)
+            self.assertEqual(events[-1], ('done', {'narrative': ''.join(tokens), 'cached': False}))
+            self.assertEqual(FlightNarrative.objects.get().narrative, ''.join(tokens))
+
+            # Stored now, so the next request is answered without the LLM...
+            self.assertEqual(self.stream(server, self.payload), [('done', {'narrative': ''.join(tokens), 'cached': True})])
+            # ...and the non-streaming endpoint shares the same store.
+            cached = self.client.post('/api/generate-narrative/', self.payload, format='json')
+            self.assertEqual(cached.data['narrative'], ''.join(tokens))
+            self.assertEqual(len(server.requests), 1)
+
+    async def test_stream_under_asgi(self):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.user)))()
+        with FakeOpenAIServer(token_delay=0.1) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                response = await AsyncClient().post(
+                    '/api/generate-narrative/stream/', self.payload, content_type='application/json',
+                    headers={'Authorization': f'Bearer {token}'},
+                )
+                self.assertTrue(response.is_async)
+                arrivals = []
+                async for chunk in response.streaming_content:
+                    arrivals.append((time.perf_counter(), parse_sse(chunk)))
+        events = [event for _, chunk_events in arrivals for event in chunk_events]
+        self.assertEqual([event for event, _ in events[-1:]], ['done'])
+        # One event per chunk, sent as the model writes rather than all at the end.
+        self.assertEqual(len(arrivals), len(events))
+        self.assertGreater(len(arrivals), 3)
+        self.assertGreater(arrivals[-1][0] - arrivals[0][0], 0.1 * (len(arrivals) - 3))
+
+    def test_stream_errors(self):
+        response = self.client.post('/api/generate-narrative/stream/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        with FakeOpenAIServer(status=400) as server:
+            events = self.stream(server, self.payload)
+        self.assertEqual([event for event, _ in events], ['error'])
+        self.assertIn('Fake failure', events[0][1]['detail'])
+        self.assertFalse(FlightNarrative.objects.exists())
+
+    def test_store_keeps_existing_flight(self):
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='pw')
+        copy = next(synthetic_flights(other, 1))
+        copy.save()
+        inputs = prompt_inputs(FlightSerializer(self.flight).data)
+
+        store_narrative(inputs, 'gpt-4o-mini', 'First', self.flight)
+        # Another user's identical flight replaces the text but not the link.
+        stored = store_narrative(inputs, 'gpt-4o-mini', 'Second', copy)
+        self.assertEqual((stored.narrative, stored.flight_id), ('Second', self.flight.pk))
+
+        # A row written without a flight is linked by the next store.
+        FlightNarrative.objects.update(flight=None)
+        self.assertEqual(store_narrative(inputs, 'gpt-4o-mini', 'Third', copy).flight_id, copy.pk)
+        self.assertEqual(FlightNarrative.objects.count(), 1)
+
+    def test_batch(self):
+        flights = [self.flight] + list(synthetic_flights(self.user, 3, seed=1))
+        for flight in flights[1:]:
+            flight.save()
+        # The first flight's narrative is stored already, keyed by the
+        # inputs the frontend posts: the flight's API representation.
+        inputs = prompt_inputs(FlightSerializer(self.flight).data)
+        store_narrative(inputs, 'gpt-4o-mini', 'Stored narrative', self.flight)
+
+        self.assertEqual(self.client.post('/api/generate-narrative/batch/').status_code, 400)
+        response = self.client.post('/api/generate-narrative/batch/?all=1')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['counts'], {'pending': 3, 'running': 0, 'done': 1, 'failed': 0})
+        jobs = {job['flight']: job for job in response.data['jobs']}
+        self.assertEqual(jobs[self.flight.pk]['narrative'], 'Stored narrative')
+
+        # A second batch shares the jobs still in flight.
+        again = self.client.post(f'/api/generate-narrative/batch/?ids={flights[1].pk},{flights[2].pk}')
+        self.assertEqual({job['id'] for job in again.data['jobs']},
+                         {jobs[flights[1].pk]['id'], jobs[flights[2].pk]['id']})
+
+        # The first upstream call fails and isn't retried; the others succeed.
+        with FakeOpenAIServer(latency=0.1, fail_first=1) as server:
+            with override_settings(OPENAI_MAX_RETRIES=0):
+                self.run_worker(server, threads=3)
+        self.assertEqual(len(server.requests), 3)
+
+        batch = self.client.get(response.data['url']).data
+        self.assertEqual(batch['counts'], {'pending': 0, 'running': 0, 'done': 3, 'failed': 1})
+        for job in batch['jobs']:
+            self.assertEqual(job['narrative'] is None, job['status'] == 'FAILED')
+
+    async def test_async_view(self):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.user)))()
+        client = AsyncClient()
+        url = '/api/generate-narrative/async/'
+
+        def post(payload, path=url):
+            return client.post(path, payload, content_type='application/json',
+                               headers={'Authorization': f'Bearer {token}'})
+
+        with FakeOpenAIServer(latency=0.3) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                start = time.perf_counter()
+                responses = await asyncio.gather(*(
+                    post({**self.payload, 'distance': distance})
+                    for distance in range(10)
+                ))
+                elapsed = time.perf_counter() - start
+                self.assertEqual([response.status_code for response in responses], [200] * 10)
+                self.assertEqual(len(server.requests), 10)
+                # The calls overlap instead of running back to back.
+                self.assertLess(elapsed, 10 * 0.3 / 2)
+
+                again = await post({**self.payload, 'distance': 0})
+                self.assertEqual(again.json(), {'narrative': responses[0].json()['narrative'], 'cached': True})
+                self.assertEqual(await sync_to_async(FlightNarrative.objects.count)(), 10)
+
+                self.assertEqual((await post({})).status_code, 400)
+                self.assertEqual((await client.post(url, self.payload, content_type='application/json')).status_code, 401)
+
+        with FakeOpenAIServer(status=400) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                failed = await post(self.payload, path=f'{url}?regenerate=1')
+        self.assertEqual(failed.status_code, 502)
+        self.assertIn('Fake failure', failed.json()['detail'])
+
+        # A 200 whose body isn't JSON (e.g. a proxy's error page) is a 502 too.
+        with FakeOpenAIServer() as server, mock.patch.object(httpx.Response, 'json', side_effect=ValueError):
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                garbled = await post(self.payload, path=f'{url}?regenerate=1')
+        self.assertEqual(garbled.status_code, 502)
+        self.assertIn('not JSON', garbled.json()['detail'])
+
+    def test_async_view_under_wsgi(self):
+        with FakeOpenAIServer() as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                response = self.client.post('/api/generate-narrative/async/', self.payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['cached'])
+        self.assertEqual(len(server.requests), 1)
+
+    def test_concurrent_jobs_and_failures(self):
+        for distance in range(4):
+            self.client.post('/api/generate-narrative/', {**self.payload, 'distance': distance}, format='json')
+
+        with FakeOpenAIServer(latency=0.2) as server:
+            self.run_worker(server, threads=4)
+        self.assertEqual(len(server.requests), 4)
+        self.assertEqual(NarrativeJob.objects.filter(status='DONE').count(), 4)
+
+        response = self.client.post('/api/generate-narrative/', {**self.payload, 'distance': 99}, format='json')
+        with FakeOpenAIServer(status=400) as server:
+            self.run_worker(server)
+        job = self.client.get(response.data['url']).data
+        self.assertEqual(job['status'], 'FAILED')
+        self.assertTrue(job['error'])
+
+    async def test_async_requests_coalesce(self):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.user)))()
+        client = AsyncClient()
+        saved = coalesce.saved_in_process.value()
+
+        with FakeOpenAIServer(latency=0.3) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                responses = await asyncio.gather(*(
+                    client.post('/api/generate-narrative/async/?regenerate=1', self.payload,
+                                content_type='application/json', headers={'Authorization': f'Bearer {token}'})
+                    for _ in range(5)
+                ))
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(len({response.json()['narrative'] for response in responses}), 1)
+        self.assertEqual(coalesce.saved_in_process.value() - saved, 4)
+
+    def test_identical_jobs_coalesce(self):
+        # Two users queue the same inputs; the worker's threads share one call.
+        other = get_user_model().objects.create_user(username='copilot', email='copilot@example.com', password='pw')
+        self.client.post('/api/generate-narrative/', self.payload, format='json')
+        self.client.force_authenticate(other)
+        self.client.post('/api/generate-narrative/', {**self.payload, 'flight_id': None}, format='json')
+
+        with FakeOpenAIServer(latency=0.3) as server:
+            self.run_worker(server, threads=2)
+        self.assertEqual(len(server.requests), 1)
+        narratives = NarrativeJob.objects.values_list('status', 'narrative')
+        self.assertEqual(len(set(narratives)), 1)
+        self.assertEqual(narratives[0][0], 'DONE')
+
+    def test_waits_for_other_worker(self):
+        inputs = prompt_inputs(FlightSerializer(self.flight).data)
+        key = narrative_key(inputs, 'gpt-4o-mini')
+        NarrativeLease.objects.create(key=key, expires_at=datetime.now(dt_timezone.utc) + timedelta(minutes=1))
+        saved = coalesce.saved_across_workers.value()
+        results = []
+
+        def request():
+            results.append(generate_narrative(inputs, 'gpt-4o-mini', self.flight))
+            connection.close()
+
+        with FakeOpenAIServer() as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                thread = threading.Thread(target=request)
+                thread.start()
+                # "Another worker" finishes the narrative and lets go of the lease.
+                time.sleep(0.2)
+                store_narrative(inputs, 'gpt-4o-mini', 'From the other worker')
+                NarrativeLease.objects.filter(key=key).delete()
+                thread.join()
+
+                self.assertEqual(len(server.requests), 0)
+                self.assertEqual(results[0].narrative, 'From the other worker')
+                self.assertEqual(results[0].flight_id, self.flight.pk)
+                self.assertEqual(coalesce.saved_across_workers.value() - saved, 1)
+
+                # An expired lease (its worker died) is taken over.
+                NarrativeLease.objects.create(key=key, expires_at=datetime.now(dt_timezone.utc))
+                self.assertTrue(generate_narrative(inputs, 'gpt-4o-mini').narrative.startswith('Narrative #1'))
+                self.assertFalse(NarrativeLease.objects.exists())
+
+    @override_settings(OPENAI_TIMEOUT=(5, 60), OPENAI_MAX_RETRIES=3, NARRATIVE_JOB_TIMEOUT=300)
+    def test_running_job_is_reclaimed_only_after_slowest_call(self):
+        inputs = prompt_inputs(FlightSerializer(self.flight).data)
+        job = NarrativeJob.objects.create(
+            user=self.user, flight=self.flight, inputs=inputs, model='gpt-4o-mini',
+            key=narrative_key(inputs, 'gpt-4o-mini'), status='RUNNING',
+            started_at=timezone.now() - timedelta(seconds=330),
+        )
+        # Four 65 s attempts and three backoffs can still be running.
+        self.assertEqual(claim_jobs(10), [])
+
+        NarrativeJob.objects.filter(pk=job.pk).update(
+            started_at=timezone.now() - timedelta(seconds=coalesce.lease_lifetime() + 1),
+        )
+        self.assertEqual([claimed.pk for claimed in claim_jobs(10)], [job.pk])
+
+    def test_lease_outlives_slowest_call_and_is_released_by_its_owner(self):
+        with override_settings(OPENAI_TIMEOUT=(5, 60), OPENAI_MAX_RETRIES=3, NARRATIVE_COALESCE_TIMEOUT=120):
+            # Four attempts of 65 s and three backoffs of up to 20 s.
+            self.assertGreater(coalesce.lease_lifetime(), 4 * 65 + 3 * 20)
+            lease = coalesce.acquire_lease('k')
+        self.assertIsNotNone(lease)
+        self.assertIsNone(coalesce.acquire_lease('k'))
+
+        # Our lease expired and another worker took it over: releasing ours
+        # must not drop theirs.
+        NarrativeLease.objects.filter(key='k').update(expires_at=timezone.now())
+        theirs = coalesce.acquire_lease('k')
+        self.assertIsNotNone(theirs)
+        coalesce.release_lease('k', lease)
+        self.assertTrue(coalesce.lease_held('k'))
+        coalesce.release_lease('k', theirs)
+        self.assertFalse(NarrativeLease.objects.exists())
+
+    def test_waiter_takes_over_failed_call(self):
+        inputs = prompt_inputs(FlightSerializer(self.flight).data)
+        outcomes = []
+
+        def request():
+            try:
+                outcomes.append(generate_narrative(inputs, 'gpt-4o-mini').narrative[:11])
+            except Exception as e:
+                outcomes.append(type(e).__name__)
+            connection.close()
+
+        with FakeOpenAIServer(latency=0.2, fail_first=1) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url, OPENAI_MAX_RETRIES=0):
+                threads = [threading.Thread(target=request) for _ in range(2)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        self.assertEqual(len(server.requests), 2)
+        self.assertEqual(sorted(outcomes), ['Narrative #', 'OpenAIError'])
+
+
+@override_settings(NARRATIVE_USER_RATE=60, NARRATIVE_USER_BURST=2, NARRATIVE_USER_DAILY_TOKENS=0)
+class NarrativeQuotaTests(TransactionTestCase):
+    """The async view closes the database connection, hence TransactionTestCase."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='pilot', email='pilot@example.com', password='pw')
+        self.flight = next(synthetic_flights(self.user, 1))
+        self.flight.save()
+        self.payload = {'flight_id': self.flight.pk, **FlightSerializer(self.flight).data}
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_request_bucket(self):
+        for distance in range(2):
+            response = self.client.post('/api/generate-narrative/', {**self.payload, 'distance': distance}, format='json')
+            self.assertEqual(response.status_code, 202)
+        # Asking again for a queued narrative costs nothing...
+        again = self.client.post('/api/generate-narrative/', {**self.payload, 'distance': 0}, format='json')
+        self.assertEqual(again.status_code, 202)
+        # ...but the bucket is empty for new ones: one refills per second.
+        limited = self.client.post('/api/generate-narrative/', {**self.payload, 'distance': 2}, format='json')
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited['Retry-After'], '1')
+
+        other = get_user_model().objects.create_user(username='copilot', email='copilot@example.com', password='pw')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.post('/api/generate-narrative/', self.payload, format='json').status_code, 202)
+
+        NarrativeQuota.objects.filter(user=self.user).update(refilled_at=F('refilled_at') - timedelta(seconds=1))
+        self.client.force_authenticate(self.user)
+        refilled = self.client.post('/api/generate-narrative/', {**self.payload, 'distance': 2}, format='json')
+        self.assertEqual(refilled.status_code, 202)
+
+    def test_batch_takes_a_request_per_generation(self):
+        flights = [self.flight]
+        for flight in synthetic_flights(self.user, 3, seed=1):
+            flight.save()
+            flights.append(flight)
+
+        response = self.client.post('/api/generate-narrative/batch/?all=1')
+        self.assertEqual(response.status_code, 202)
+        # The bucket holds two: the other flights wait for a later request.
+        self.assertEqual(response.data['counts']['pending'], 2)
+        self.assertEqual(len(response.data['deferred']), 2)
+        queued = {job['flight'] for job in response.data['jobs']}
+        self.assertEqual(queued | set(response.data['deferred']), {flight.pk for flight in flights})
+        self.assertEqual(NarrativeJob.objects.count(), 2)
+
+        deferred = ','.join(str(pk) for pk in response.data['deferred'])
+        limited = self.client.post(f'/api/generate-narrative/batch/?ids={deferred}')
+        self.assertEqual(limited.status_code, 429)
+        self.assertEqual(limited['Retry-After'], '1')
+        # Flights already queued cost nothing.
+        again = self.client.post('/api/generate-narrative/batch/?ids=' + ','.join(str(pk) for pk in queued))
+        self.assertEqual((again.status_code, again.data['deferred']), (202, []))
+
+        NarrativeQuota.objects.filter(user=self.user).update(refilled_at=F('refilled_at') - timedelta(seconds=1))
+        refilled = self.client.post(f'/api/generate-narrative/batch/?ids={deferred}')
+        self.assertEqual((refilled.status_code, len(refilled.data['deferred'])), (202, 1))
+        self.assertEqual(NarrativeJob.objects.count(), 3)
+
+    @override_settings(NARRATIVE_USER_RATE=0, NARRATIVE_USER_DAILY_TOKENS=100)
+    def test_queued_jobs_fail_once_budget_is_spent(self):
+        for flight in synthetic_flights(self.user, 2, seed=1):
+            flight.save()
+        response = self.client.post('/api/generate-narrative/batch/?all=1')
+        self.assertEqual(response.data['counts']['pending'], 3)
+
+        # Other requests use up the budget before the worker gets to the jobs.
+        NarrativeQuota.objects.update_or_create(
+            user=self.user, defaults={'tokens_used': 100, 'day': timezone.localdate(), 'requests': 0,
+                                      'refilled_at': timezone.now()},
+        )
+        with FakeOpenAIServer() as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                call_command('run_narrative_worker', once=True, stdout=io.StringIO())
+        self.assertEqual(len(server.requests), 0)
+        for status_, error in NarrativeJob.objects.values_list('status', 'error'):
+            self.assertEqual(status_, 'FAILED')
+            self.assertTrue(error.startswith('Daily narrative budget used up.'), error)
+
+    @override_settings(NARRATIVE_USER_RATE=0, NARRATIVE_USER_DAILY_TOKENS=100)
+    def test_daily_token_budget(self):
+        with FakeOpenAIServer() as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url):
+                events = parse_sse(b''.join(self.client.post(
+                    '/api/generate-narrative/stream/', self.payload, format='json',
+                ).streaming_content))
+                self.assertEqual(events[-1][0], 'done')
+                self.assertEqual(server.requests[0]['stream_options'], {'include_usage': True})
+                tokens = NarrativeQuota.objects.get(user=self.user).tokens_used
+                self.assertGreater(tokens, 0)
+
+                # Stored narratives are still served once the budget is gone.
+                with override_settings(NARRATIVE_USER_DAILY_TOKENS=tokens):
+                    cached = self.client.post('/api/generate-narrative/', self.payload, format='json')
+                    self.assertEqual(cached.status_code, 200)
+                    for path in ('/api/generate-narrative/?regenerate=1', '/api/generate-narrative/stream/?regenerate=1',
+                                 '/api/generate-narrative/async/?regenerate=1',
+                                 '/api/generate-narrative/batch/?all=1&regenerate=1'):
+                        response = self.client.post(path, self.payload, format='json')
+                        self.assertEqual(response.status_code, 429, path)
+                        self.assertGreater(int(response['Retry-After']), 0)
+
+                    # A new day starts a new budget.
+                    NarrativeQuota.objects.update(day=F('day') - timedelta(days=1))
+                    response = self.client.post('/api/generate-narrative/async/?regenerate=1', self.payload, format='json')
+                    self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(server.requests), 2)
+        quota = NarrativeQuota.objects.get(user=self.user)
+        self.assertEqual(quota.day, timezone.localdate())
+        self.assertEqual(quota.tokens_used, tokens)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DirectOpenAITests(SimpleTestCase):
+    """Pooling, timeouts and retries of the direct client against the fake server."""
+
+    messages = [{'role': 'user', 'content': 'Describe a flight'}]
+
+    def setUp(self):
+        cache.clear()
+
+    def skip_backoff(self):
+        # Patches time.sleep process-wide, so not for tests relying on the
+        # fake server's latency.
+        patcher = mock.patch.object(direct_openai.time, 'sleep')
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def client_for(self, server, **options):
+        return DirectOpenAI(api_key='test-key', base_url=server.base_url, **options)
+
+    def test_reuses_keep_alive_connection(self):
+        with FakeOpenAIServer() as server:
+            client = self.client_for(server)
+            for _ in range(3):
+                client.chat.create(model='gpt-test', messages=self.messages)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(server.connections), 1)
+
+    def test_retries_429_honouring_retry_after(self):
+        sleep = self.skip_backoff()
+        with FakeOpenAIServer(fail_first=2, retry_after=3) as server:
+            response = self.client_for(server).chat.create(model='gpt-test', messages=self.messages)
+        self.assertTrue(response.choices[0].message.content.startswith('Narrative #3'))
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [3.0, 3.0])
+        self.assertEqual(direct_openai.retry_count.value(), 2)
+        self.assertEqual(direct_openai.request_count.value(), 3)
+        self.assertEqual(direct_openai.latency.render(cache.get_many(direct_openai.latency.keys()))['count'], 3)
+
+    def test_gives_up_after_max_retries(self):
+        self.skip_backoff()
+        with FakeOpenAIServer(status=503) as server:
+            with self.assertRaises(ValueError):
+                self.client_for(server, max_retries=2).chat.create(model='gpt-test', messages=self.messages)
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(direct_openai.failure_count.value(), 1)
+
+    def test_client_errors_are_not_retried(self):
+        with FakeOpenAIServer(status=400) as server:
+            with self.assertRaises(ValueError):
+                self.client_for(server).chat.create(model='gpt-test', messages=self.messages)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_read_timeout(self):
+        with FakeOpenAIServer(latency=0.5) as server:
+            client = self.client_for(server, timeout=(1, 0.1), max_retries=1)
+            with self.assertRaises(ValueError):
+                client.chat.create(model='gpt-test', messages=self.messages)
+        self.assertEqual(direct_openai.timeout_count.value(), 2)
+
+    def test_stream_arrives_incrementally(self):
+        with FakeOpenAIServer(token_delay=0.05) as server:
+            start = time.perf_counter()
+            chunks = self.client_for(server).chat.create(model='gpt-test', messages=self.messages, stream=True)
+            arrivals, text = [], ''
+            for chunk in chunks:
+                content = getattr(chunk.choices[0].delta, 'content', None)
+                if content:
+                    arrivals.append(time.perf_counter() - start)
+                    text += content
+        self.assertEqual(text, 'Narrative #1 from gpt-test: Describe a flight')
+        # The first words are read long before the last one is sent.
+        self.assertGreater(len(arrivals), 4)
+        self.assertLess(arrivals[0], arrivals[-1] - 0.1)
+
+    def test_backoff(self):
+        self.assertIsNone(backoff_delay(0, retry_after=direct_openai.BACKOFF_MAX + 1))
+        self.assertLessEqual(backoff_delay(10), direct_openai.BACKOFF_MAX)
+        self.assertEqual(parse_retry_after({'retry-after-ms': '1500'}), 1.5)
+        self.assertEqual(parse_retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}), 0.0)
+        self.assertIsNone(parse_retry_after({}))
+
+
+class FakeOpenAIServerTests(SimpleTestCase):
+    messages = [{'role': 'user', 'content': 'Describe a flight'}]
+
+    def test_latency_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(latency_sampler(0.25, rng)(), 0.25)
+        self.assertEqual(latency_sampler('0.25', rng)(), 0.25)
+        samples = [latency_sampler('uniform:0.1:0.2', rng)() for _ in range(100)]
+        self.assertTrue(all(0.1 <= sample <= 0.2 for sample in samples))
+        samples = [latency_sampler('lognormal:0.5:0.5', rng)() for _ in range(1000)]
+        self.assertAlmostEqual(statistics.median(samples), 0.5, delta=0.05)
+        self.assertGreater(max(samples), 1.0)
+        self.assertAlmostEqual(statistics.mean(latency_sampler('exponential:0.2', rng)() for _ in range(1000)),
+                               0.2, delta=0.03)
+        for spec in ('uniform:1', 'gamma:1:2', 'fast', 'exponential:0'):
+            with self.assertRaises(ValueError):
+                latency_sampler(spec, rng)
+
+    def test_error_rate(self):
+        with FakeOpenAIServer(error_rate=0.3, seed=1) as server:
+            client = DirectOpenAI(api_key='test-key', base_url=server.base_url, max_retries=0)
+            for _ in range(50):
+                try:
+                    client.chat.create(model='gpt-4o-mini', messages=self.messages)
+                except direct_openai.OpenAIError as e:
+                    self.assertEqual(e.status_code, 500)
+        self.assertEqual(sum(server.responses.values()), 50)
+        self.assertTrue(5 <= server.responses[500] <= 25, server.responses)
+
+    def test_rate_limit_bursts(self):
+        with FakeOpenAIServer(latency=5, burst_every=60, burst_duration=10) as server:
+            start = time.perf_counter()
+            response = requests.post(f"{server.base_url}/chat/completions",
+                                     json={'model': 'gpt-4o-mini', 'messages': self.messages})
+            # Refused at once, not after the model's latency.
+            self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '10')
+        self.assertEqual(server.responses, {429: 1})
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(threshold=2, reset_timeout=10, clock=lambda: self.now)
+
+    def fail(self):
+        raise ConnectionError('upstream down')
+
+    def test_opens_and_probes(self):
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                self.breaker.call(self.fail)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'ok')
+
+        # After the reset timeout one failing probe reopens it at once...
+        self.now = 10
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(self.fail)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: 'ok')
+
+        # ...and a successful probe closes it.
+        self.now = 20
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_success_resets_failure_count(self):
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(self.fail)
+        self.breaker.call(lambda: 'ok')
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_rate_limiter(self):
+        sleeps = []
+        limiter = RateLimiter(per_minute=120, clock=lambda: self.now, sleep=sleeps.append)
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(sleeps, [0.5, 1.0])
+
+        # Unused time isn't saved up into a burst.
+        self.now = 100
+        limiter.acquire()
+        self.assertEqual(len(sleeps), 2)
+
+    def test_shared_client_fails_fast(self):
+        messages = [{'role': 'user', 'content': 'Describe a flight'}]
+        with FakeOpenAIServer(status=503) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url,
+                                   OPENAI_MAX_RETRIES=0, OPENAI_BREAKER_THRESHOLD=2):
+                client = llm.get_client()
+                for _ in range(2):
+                    with self.assertRaises(ValueError):
+                        client.complete(messages, 'gpt-test')
+                with self.assertRaises(CircuitOpenError):
+                    client.complete(messages, 'gpt-test')
+        self.assertEqual(len(server.requests), 2)
+
+        # A rejected request (4xx) is not the upstream's fault.
+        with FakeOpenAIServer(status=400) as server:
+            with override_settings(OPENAI_API_KEY='test-key', OPENAI_BASE_URL=server.base_url,
+                                   OPENAI_BREAKER_THRESHOLD=1):
+                client = llm.get_client()
+                for _ in range(2):
+                    with self.assertRaises(ValueError):
+                        client.complete(messages, 'gpt-test')
+        self.assertEqual(len(server.requests), 2)
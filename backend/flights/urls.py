@@ -1,9 +1,22 @@
 from django.urls import path
-from .views import FlightListView, FlightDetailView
+from .views import FlightListView, FlightDetailView, FlightExportView, FlightStatsView, FlightBulkView
+from .views import FlightImportView, FlightImportDetailView, MetricsView, NarrativeJobView, NarrativeStreamView
+from .views import NarrativeBatchView, NarrativeBatchDetailView
 from . import views
 
 urlpatterns = [
     path('flights/', FlightListView.as_view(), name='flight-list'),
+    path('flights/bulk/', FlightBulkView.as_view(), name='flight-bulk'),
+    path('flights/import/', FlightImportView.as_view(), name='flight-import'),
+    path('flights/import/<int:pk>/', FlightImportDetailView.as_view(), name='flight-import-detail'),
+    path('flights/export/', FlightExportView.as_view(), name='flight-export'),
+    path('flights/stats/', FlightStatsView.as_view(), name='flight-stats'),
     path('flights/<int:pk>/', FlightDetailView.as_view(), name='flight-detail'),
     path('generate-narrative/', views.generate_narrative, name='generate-narrative'),
+    path('generate-narrative/async/', views.generate_narrative_async, name='generate-narrative-async'),
+    path('generate-narrative/stream/', NarrativeStreamView.as_view(), name='generate-narrative-stream'),
+    path('generate-narrative/batch/', NarrativeBatchView.as_view(), name='generate-narrative-batch'),
+    path('narrative-batches/<int:pk>/', NarrativeBatchDetailView.as_view(), name='narrative-batch'),
+    path('narrative-jobs/<int:pk>/', NarrativeJobView.as_view(), name='narrative-job'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
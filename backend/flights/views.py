@@ -1,40 +1,97 @@
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Flight
-from .serializers import FlightSerializer
-from rest_framework.permissions import IsAuthenticated
-from django.http import Http404
+from .models import Flight, FlightImportJob, NarrativeBatch, NarrativeJob
+from .serializers import FlightSerializer, FlightImportJobSerializer, NarrativeBatchSerializer, NarrativeJobSerializer
+from .pagination import FlightKeysetPagination
+from .encoders import FlightValuesEncoder
+from .conditional import conditional_response, make_etag, set_validators
+from django.db.models import Count, Max
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.urls import reverse
+from . import export
+from .filters import FILTER_PARAMS, filter_flights
+from .stats import flight_stats
+from .narrative import generate_narrative as generate_narrative_now
+from .narrative import agenerate_narrative, enqueue_batch, enqueue_narrative, lookup_narrative, stream_narrative
+from . import metrics
+from .bulk import create_flights, delete_flights, update_flights, validate_changes, validate_flights
+from rest_framework.exceptions import APIException, NotAuthenticated, ValidationError
 import logging
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.conf import settings
-import openai
-import inspect
-from .openai_patch import create_safe_openai_client
-from .direct_openai import create_direct_client
+from AirFleet_api.renderers import dumps
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .direct_openai import OpenAIError
+from .llm import CircuitOpenError
+from .quota import take_request
 
 logger = logging.getLogger(__name__)
 
-# Apply our OpenAI patches early
-try:
-    from .openai_patch import apply_openai_patches, clean_openai_environment
-    # First clean environment
-    clean_openai_environment()
-    # Then apply patches
-    apply_openai_patches()
-    logger.info("Applied OpenAI patches at module level")
-except Exception as e:
-    logger.error(f"Failed to apply OpenAI patches: {e}")
+def get_sparse_fields(request):
+    """
+    Parse `?fields=a,b,c` into a list of serializer field names, or None when
+    the full representation was requested.
+    """
+    requested = request.query_params.get('fields')
+    if not requested:
+        return None
+
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = sorted(set(fields) - set(FlightSerializer().fields))
+    if unknown:
+        raise ValidationError({'fields': [f"Unknown field(s): {', '.join(unknown)}"]})
+    return fields
+
+
+def defer_unrequested(queryset, fields):
+    """
+    Restrict the SELECT to the requested columns so unread TextFields never
+    leave the database. departure_time is always loaded because it is the
+    ordering and keyset column.
+    """
+    if fields is None:
+        return queryset
+    return queryset.only('departure_time', *fields)
+
 
 class FlightListView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        flights = Flight.objects.filter(user=request.user)
-        serializer = FlightSerializer(flights, many=True)
-        return Response(serializer.data)
+        fields = get_sparse_fields(request)
+        flights = filter_flights(Flight.objects.filter(user=request.user), request.query_params)
+
+        # One aggregate query decides whether the client's copy is current.
+        # The count catches deletions, which leave Max('updated_at') alone,
+        # so lists send only the ETag: a Last-Modified would answer
+        # If-Modified-Since with 304 after a deletion.
+        state = flights.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+        etag = make_etag(
+            request.user.pk, state['count'], state['last_modified'],
+            request.accepted_media_type, request.get_full_path(),
+        )
+        not_modified = conditional_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        # Read-only, so rows skip model instances and DRF fields entirely;
+        # the SELECT only carries the requested columns.
+        encoder = FlightValuesEncoder(fields=fields)
+        flights = encoder.values(flights)
+        paginator = FlightKeysetPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(flights, request, view=self)
+            response = paginator.get_paginated_response(encoder.encode(page))
+        else:
+            response = Response(encoder.encode(flights))
+        return set_validators(response, etag)
 
     def post(self, request):
         logger.info(f"Received flight data: {request.data}")
@@ -54,19 +111,156 @@ class FlightListView(APIView):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+def select_flights(request, allow_all=False):
+    """
+    The user's flights selected by the list filters and/or `?ids=1,2,3`.
+    A selection is required, so an empty query string can't act on the
+    whole logbook by accident; `allow_all` accepts `?all=1` for that.
+    """
+    params = request.query_params
+    names = (*FILTER_PARAMS, 'ids', 'all') if allow_all else (*FILTER_PARAMS, 'ids')
+    if not any(params.get(name) for name in names):
+        raise ValidationError({'non_field_errors': [
+            f"At least one filter is required: {', '.join(names)}"
+        ]})
+
+    flights = filter_flights(Flight.objects.filter(user=request.user), params)
+    if params.get('ids'):
+        try:
+            ids = [int(pk) for pk in params['ids'].split(',')]
+        except ValueError:
+            raise ValidationError({'ids': ['Expected a comma-separated list of flight ids']})
+        flights = flights.filter(pk__in=ids)
+    return flights
+
+
+class FlightBulkView(APIView):
+    """
+    Create, update or delete many flights in one request.
+
+    POST takes a JSON array. `?mode=atomic` (default) creates nothing if any
+    item is invalid; `?mode=partial` creates the valid items and reports the
+    rest. Errors are reported per array index.
+
+    PATCH and DELETE act on the user's flights selected by the list filters
+    (or `?ids=1,2,3`); at least one is required. PATCH sets the given fields
+    with a single UPDATE; DELETE removes the selection in chunks.
+    `?dry_run=1` only returns how many flights would be affected.
+    """
+    permission_classes = [IsAuthenticated]
+    modes = ('atomic', 'partial')
+
+    def get_selection(self, request):
+        return select_flights(request)
+
+    def is_dry_run(self, request):
+        return request.query_params.get('dry_run') in ('1', 'true')
+
+    def post(self, request):
+        mode = request.query_params.get('mode', 'atomic')
+        if mode not in self.modes:
+            raise ValidationError({'mode': [f"Expected one of: {', '.join(self.modes)}"]})
+
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of flights']})
+        max_items = settings.FLIGHT_BULK_MAX_ITEMS
+        if len(items) > max_items:
+            raise ValidationError({'non_field_errors': [f"At most {max_items} flights per request"]})
+
+        valid, errors = validate_flights(items)
+        if errors and (mode == 'atomic' or not valid):
+            logger.error(f"Bulk create rejected {len(errors)} of {len(items)} flights")
+            return Response(
+                {
+                    'status': 'error',
+                    'errors': errors,
+                    'message': 'Invalid flight data'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        created = create_flights(request.user, valid)
+        return Response(
+            {
+                'created': FlightSerializer(created, many=True).data,
+                'errors': errors,
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+    def patch(self, request):
+        flights = self.get_selection(request)
+        changes = validate_changes(request.data)
+        if self.is_dry_run(request):
+            return Response({'dry_run': True, 'matched': flights.count()})
+        return Response({'updated': update_flights(flights, changes)})
+
+    def delete(self, request):
+        flights = self.get_selection(request)
+        if self.is_dry_run(request):
+            return Response({'dry_run': True, 'matched': flights.count()})
+        deleted = delete_flights(flights, chunk_size=settings.FLIGHT_BULK_DELETE_CHUNK_SIZE)
+        return Response({'deleted': deleted})
+
+class FlightImportView(APIView):
+    """
+    Upload a CSV logbook for background import.
+
+    Returns 202 straight away; the process_flight_imports worker does the
+    parsing and inserting, and the job's progress is read from
+    FlightImportDetailView.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['A CSV file is required']})
+        max_size = settings.FLIGHT_IMPORT_MAX_UPLOAD_SIZE
+        if upload.size > max_size:
+            raise ValidationError({'file': [f"File is larger than {max_size} bytes"]})
+
+        job = FlightImportJob.objects.create(user=request.user, content=upload.read())
+        data = FlightImportJobSerializer(job).data
+        data['url'] = request.build_absolute_uri(reverse('flight-import-detail', args=[job.pk]))
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+class FlightImportDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = FlightImportJob.objects.defer('content').get(pk=pk, user=request.user)
+        except FlightImportJob.DoesNotExist:
+            raise Http404
+        return Response(FlightImportJobSerializer(job).data)
+
 class FlightDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get_object(self, pk, user):
+    def get_object(self, pk, user, fields=None):
         try:
-            return Flight.objects.get(pk=pk, user=user)
+            return defer_unrequested(Flight.objects, fields).get(pk=pk, user=user)
         except Flight.DoesNotExist:
             raise Http404
 
     def get(self, request, pk):
-        flight = self.get_object(pk, request.user)
-        serializer = FlightSerializer(flight)
-        return Response(serializer.data)
+        fields = get_sparse_fields(request)
+
+        # Check the validators before loading (and serializing) the full row.
+        try:
+            last_modified = Flight.objects.values_list('updated_at', flat=True).get(pk=pk, user=request.user)
+        except Flight.DoesNotExist:
+            raise Http404
+        etag = make_etag(request.user.pk, last_modified, request.accepted_media_type, request.get_full_path())
+        not_modified = conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        flight = self.get_object(pk, request.user, fields)
+        serializer = FlightSerializer(flight, fields=fields)
+        return set_validators(Response(serializer.data), etag, last_modified)
 
     def put(self, request, pk):
         flight = self.get_object(pk, request.user)
@@ -81,142 +275,270 @@ class FlightDetailView(APIView):
         flight.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class FlightExportView(APIView):
+    """
+    Stream the user's whole logbook as NDJSON (default) or CSV.
+
+    `?type=csv` selects CSV (DRF reserves `?format=`) and `?gzip=1` returns a
+    gzip file compressed on the fly. The list filters apply here too. Under
+    ASGI the stream is relayed with aiterate(), so it is still sent block by
+    block.
+    """
+    permission_classes = [IsAuthenticated]
+    chunk_size = 2000
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get(self, request):
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in self.content_types:
+            raise ValidationError({'type': [f"Expected one of: {', '.join(self.content_types)}"]})
+
+        flights = filter_flights(Flight.objects.filter(user=request.user), request.query_params)
+        flights = flights.order_by('-departure_time', '-id')
+        rows = export.flight_rows(flights, chunk_size=self.chunk_size)
+        if export_type == 'csv':
+            lines = export.csv_lines(rows, list(FlightSerializer().fields))
+        else:
+            lines = export.ndjson_lines(rows)
+        stream = export.blocks(lines)
+
+        filename = f"logbook.{export_type}"
+        content_type = self.content_types[export_type]
+        if request.query_params.get('gzip') in ('1', 'true'):
+            stream = export.gzip_stream(stream)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        if isinstance(request._request, ASGIRequest):
+            stream = aiterate(stream)
+
+        response = StreamingHttpResponse(stream, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+class FlightStatsView(APIView):
+    """
+    Totals plus per-aircraft, per-route and per-month breakdowns for the
+    user's logbook, computed in a single aggregate query.
+    """
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def get_int_param(self, request, name, default):
+        try:
+            value = int(request.query_params.get(name, default))
+        except ValueError:
+            raise ValidationError({name: ['Expected an integer']})
+        return max(0, min(value, self.max_limit))
+
+    def get(self, request):
+        limit = self.get_int_param(request, 'limit', 5)
+        months = self.get_int_param(request, 'months', 12)
+        return Response(flight_stats(request.user, limit=limit, months=months))
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_narrative(request):
-    """Generate a narrative for a flight using ChatGPT."""
+    """
+    Generate a narrative for a flight using ChatGPT.
+
+    A narrative stored for the same prompt inputs is returned straight away
+    (200). Otherwise the generation is queued for run_narrative_worker and
+    the response is 202 with the job to poll; `?regenerate=1` always queues.
+    429 with Retry-After when the user's narrative quota is spent.
+    """
+    regenerate = request.query_params.get('regenerate') in ('1', 'true')
+    stored, job = enqueue_narrative(request.data, request.user, regenerate=regenerate)
+    if stored is not None:
+        return Response({"narrative": stored.narrative, "cached": True})
+
+    data = NarrativeJobSerializer(job).data
+    data['url'] = request.build_absolute_uri(reverse('narrative-job', args=[job.pk]))
+    return Response(data, status=status.HTTP_202_ACCEPTED)
+
+def json_response(data, status=200, **headers):
+    return HttpResponse(dumps(data), status=status, content_type='application/json', headers=headers)
+
+def authenticated_data(request):
+    """
+    Authenticate and parse a plain Django request the way an APIView
+    would; returns (user, data). Raises DRF's exceptions.
+    """
+    drf_request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    if not drf_request.user or not drf_request.user.is_authenticated:
+        raise NotAuthenticated()
+    return drf_request.user, drf_request.data
+
+async def generate_narrative_async(request):
+    """
+    Generate a narrative within the request and return it (200) as
+    {"narrative", "cached"}; `?regenerate=1` skips the stored one.
+
+    DRF views can't be async, so this is a plain Django view using DRF's
+    authentication and parsers. Under ASGI the LLM call is awaited on the
+    event loop, so one process holds many calls in flight without a thread
+    each; under WSGI it runs like a sync view. 429 (with Retry-After) when
+    the user's narrative quota is spent, 503 (with Retry-After) while the
+    circuit breaker is open, 502 when the API call fails.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    regenerate = request.GET.get('regenerate') in ('1', 'true')
     try:
-        # Extract flight data from request
-        flight_data = request.data
-        
-        # Create a prompt for ChatGPT
-        prompt = f"""
-        Generate a concise, focused narrative about this flight:
-        - Departure: {flight_data['departure_airport']} at {flight_data['departure_time']}
-        - Arrival: {flight_data['arrival_airport']} at {flight_data['arrival_time']}
-        - Duration: {flight_data['total_time']}
-        - Distance: {flight_data['distance']} nautical miles
-        - Aircraft: {flight_data['registration_number']}
-        - Conditions: {flight_data['aircraft_condition']}
-        - Weather: {flight_data.get('weather_conditions', 'Unknown')}
-        
-        Create a human-friendly summary that captures the highlights and any challenges of this flight.
-        Keep it concise (2-3 sentences) but informative.
-        """
-        
-        # Call the OpenAI API with proper error handling
-        logger.info("Initializing OpenAI client")
-        
-        # Try approaches in order of preference:
-        
-        # 1. Try direct API access first (most reliable approach)
+        user, data = await sync_to_async(authenticated_data)(request)
+        inputs, model, flight, stored = await sync_to_async(lookup_narrative)(data, user, regenerate=regenerate)
+        if stored is None:
+            await sync_to_async(take_request)(user)
+    except APIException as e:
+        detail = e.detail if isinstance(e.detail, (dict, list)) else {'detail': e.detail}
+        headers = {'WWW-Authenticate': 'Bearer realm="api"'} if e.status_code == 401 else {}
+        if getattr(e, 'wait', None):
+            headers['Retry-After'] = str(e.wait)
+        return json_response(detail, status=e.status_code, **headers)
+    if stored is not None:
+        return json_response({'narrative': stored.narrative, 'cached': True})
+
+    # Don't hold a database connection while waiting on the model. (The
+    # lambda looks the connection up on the thread that ran the queries.)
+    await sync_to_async(lambda: connection.close())()
+    try:
+        if isinstance(request, ASGIRequest):
+            stored = await agenerate_narrative(inputs, model, flight, user)
+        else:
+            # Under WSGI every request gets a short-lived event loop, which
+            # can't keep a connection pool; the pooled sync client can.
+            stored = await sync_to_async(generate_narrative_now)(inputs, model, flight, user)
+    except CircuitOpenError as e:
+        return json_response({'detail': str(e)}, status=503, **{'Retry-After': str(int(e.retry_in) + 1)})
+    except (OpenAIError, RuntimeError) as e:
+        logger.error(f"Narrative generation failed: {str(e)}")
+        return json_response({'detail': str(e)}, status=502)
+    return json_response({'narrative': stored.narrative, 'cached': False})
+
+# Token-authenticated like the DRF views. Set by hand because Django 4.2's
+# @csrf_exempt wraps the view in a sync function.
+generate_narrative_async.csrf_exempt = True
+
+async def aiterate(iterator):
+    """
+    Relay a sync iterator item by item from a worker thread. Under ASGI
+    Django 4.2 reads a sync streaming iterator to the end before sending
+    anything; an async one is sent as it yields.
+    """
+    done = object()
+    next_item = sync_to_async(next)
+    try:
+        while True:
+            item = await next_item(iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        await sync_to_async(iterator.close)()
+
+def sse_event(event, data):
+    """One server-sent event with a JSON payload."""
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + dumps(data) + b'\n\n'
+
+class NarrativeStreamView(APIView):
+    """
+    Generate a narrative as server-sent events, so the text appears as the
+    model writes it. `token` events carry each piece of text, then a `done`
+    event carries the whole narrative, or an `error` event says why it
+    stopped. A stored narrative is sent as a single `done` event with
+    "cached": true; `?regenerate=1` skips it. 429 with Retry-After when the
+    user's narrative quota is spent.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        regenerate = request.query_params.get('regenerate') in ('1', 'true')
+        inputs, model, flight, stored = lookup_narrative(request.data, request.user, regenerate=regenerate)
+        if stored is None:
+            take_request(request.user)
+        events = self.events(inputs, model, flight, stored, request.user)
+        if isinstance(request._request, ASGIRequest):
+            events = aiterate(events)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx-style proxies from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def events(self, inputs, model, flight, stored, user):
+        if stored is not None:
+            yield sse_event('done', {'narrative': stored.narrative, 'cached': True})
+            return
+
+        parts = []
         try:
-            logger.info("Attempting to use direct OpenAI client")
-            from .direct_openai import create_direct_client
-            client = create_direct_client(api_key=settings.OPENAI_API_KEY)
-            
-            logger.info("Sending request to OpenAI API via direct client")
-            response = client.chat.create(
-                model="gpt-4o-mini",  # or "gpt-4" for better quality
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that creates engaging flight narratives based on flight data."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=250,
-                temperature=0.7,
-            )
-            
-            # Extract the narrative from the response
-            narrative = response.choices[0].message.content.strip()
-            
-            # Return the narrative
-            return Response({"narrative": narrative})
-        except Exception as e1:
-            logger.error(f"Direct client approach failed: {str(e1)}")
-            
-            # 2. Try our safe client creator
-            try:
-                logger.info("Attempting to create OpenAI client with safe_client_creator")
-                from .openai_patch import create_safe_openai_client
-                client = create_safe_openai_client(api_key=settings.OPENAI_API_KEY)
-                
-                logger.info("Sending request to OpenAI API")
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",  # or "gpt-4" for better quality
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant that creates engaging flight narratives based on flight data."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=250,
-                    temperature=0.7,
-                )
-                
-                # Extract the narrative from the response
-                narrative = response.choices[0].message.content.strip()
-                
-                # Return the narrative
-                return Response({"narrative": narrative})
-            except Exception as e2:
-                logger.error(f"Safe client approach failed: {str(e2)}")
-                
-                # 3. Direct import approach
-                try:
-                    logger.info("Attempting direct import approach")
-                    # Import the module directly
-                    from openai import OpenAI
-                    # Create client with minimal parameters
-                    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-                    
-                    response = client.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant that creates engaging flight narratives based on flight data."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=250,
-                        temperature=0.7,
-                    )
-                    narrative = response.choices[0].message.content.strip()
-                    return Response({"narrative": narrative})
-                except Exception as e3:
-                    logger.error(f"Direct import approach failed: {str(e3)}")
-                    
-                    # 4. Last resort - no proxy approach
-                    try:
-                        logger.info("Attempting no-proxy approach")
-                        import os
-                        import importlib
-                        
-                        # Clear all proxy variables
-                        proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 
-                                     'ALL_PROXY', 'all_proxy', 'NO_PROXY', 'no_proxy']
-                        for var in proxy_vars:
-                            if var in os.environ:
-                                del os.environ[var]
-                        
-                        # Reload openai module
-                        import openai
-                        importlib.reload(openai)
-                        
-                        # Create client with absolute minimal approach
-                        from openai import OpenAI
-                        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-                        
-                        response = client.chat.completions.create(
-                            model="gpt-4o-mini",
-                            messages=[
-                                {"role": "system", "content": "You are a helpful assistant that creates engaging flight narratives based on flight data."},
-                                {"role": "user", "content": prompt}
-                            ],
-                            max_tokens=250,
-                            temperature=0.7,
-                        )
-                        narrative = response.choices[0].message.content.strip()
-                        return Response({"narrative": narrative})
-                    except Exception as e4:
-                        logger.error(f"All approaches failed. Errors: 1) {str(e1)}, 2) {str(e2)}, 3) {str(e3)}, 4) {str(e4)}")
-                        return Response({"error": "Failed to generate narrative after multiple attempts"}, status=500)
-    
-    except Exception as e:
-        logger.error(f"Error in generate_narrative: {str(e)}")
-        return Response({"error": str(e)}, status=500)
+            for text in stream_narrative(inputs, model, flight, user):
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+        except Exception as e:
+            logger.error(f"Narrative stream failed: {str(e)}")
+            yield sse_event('error', {'detail': str(e)})
+            return
+        yield sse_event('done', {'narrative': ''.join(parts).strip(), 'cached': False})
+
+class NarrativeBatchView(APIView):
+    """
+    Queue narratives for many flights at once: the flights selected by the
+    list filters, `?ids=1,2,3`, or `?all=1` for the whole logbook. The
+    run_narrative_worker pool generates them concurrently within its rate
+    budget. Responds 202 with a per-flight job list to poll at `url`;
+    stored narratives are finished jobs from the start, and
+    `?regenerate=1` queues those too. New generations are charged to the
+    user's narrative quota: flights beyond what it allows right now are
+    listed in `deferred`, to be requested again later, and the response is
+    429 when none fit or the daily token budget is used up.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        flights = select_flights(request, allow_all=True)
+        max_flights = settings.NARRATIVE_BATCH_MAX_FLIGHTS
+        if flights.count() > max_flights:
+            raise ValidationError({'non_field_errors': [f"At most {max_flights} flights per batch"]})
+
+        regenerate = request.query_params.get('regenerate') in ('1', 'true')
+        batch, deferred = enqueue_batch(flights, request.user, regenerate=regenerate)
+        batch = NarrativeBatch.objects.prefetch_related('jobs__narrative').get(pk=batch.pk)
+        data = NarrativeBatchSerializer(batch).data
+        data['deferred'] = deferred
+        data['url'] = request.build_absolute_uri(reverse('narrative-batch', args=[batch.pk]))
+        return Response(data, status=status.HTTP_202_ACCEPTED)
+
+class NarrativeBatchDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            batch = NarrativeBatch.objects.prefetch_related('jobs__narrative').get(pk=pk, user=request.user)
+        except NarrativeBatch.DoesNotExist:
+            raise Http404
+        return Response(NarrativeBatchSerializer(batch).data)
+
+class NarrativeJobView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = NarrativeJob.objects.select_related('narrative').get(pk=pk, user=request.user)
+        except NarrativeJob.DoesNotExist:
+            raise Http404
+        return Response(NarrativeJobSerializer(job).data)
+
+class MetricsView(APIView):
+    """Application counters (see flights.metrics), for staff only."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({'counters': metrics.snapshot()})
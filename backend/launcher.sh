@@ -9,5 +9,34 @@ python /app/cleanup_test_data.py
 echo "=== COLLECTING STATIC FILES ==="
 python /app/manage.py collectstatic --noinput
 
+echo "=== STARTING NARRATIVE WORKER ==="
+# /api/generate-narrative/ queues jobs for this worker. Set
+# RUN_NARRATIVE_WORKER=0 when it runs as its own service instead.
+if [ "${RUN_NARRATIVE_WORKER:-1}" = "1" ]; then
+    (
+        while true; do
+            python /app/manage.py run_narrative_worker
+            echo "Narrative worker exited with status $?; restarting in 5s"
+            sleep 5
+        done
+    ) &
+fi
+
+echo "=== STARTING IMPORT WORKER ==="
+# /api/flights/import/ queues CSV uploads for this worker. Set
+# RUN_IMPORT_WORKER=0 when it runs as its own service instead.
+if [ "${RUN_IMPORT_WORKER:-1}" = "1" ]; then
+    (
+        while true; do
+            python /app/manage.py process_flight_imports
+            echo "Import worker exited with status $?; restarting in 5s"
+            sleep 5
+        done
+    ) &
+fi
+
 echo "=== STARTING SERVER ==="
-gunicorn AirFleet_api.wsgi:application --bind 0.0.0.0:${PORT:-8080} --chdir /app --log-level debug 
\ No newline at end of file
+# ASGI, so async views hold in-flight LLM calls without a thread each.
+# Sync code runs on a fresh thread per request: no persistent DB connections.
+export DB_CONN_MAX_AGE=0
+uvicorn AirFleet_api.asgi:application --host 0.0.0.0 --port ${PORT:-8080} --app-dir /app --log-level debug 
\ No newline at end of file
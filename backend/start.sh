@@ -51,6 +51,42 @@ python manage.py migrate
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
-# Start Gunicorn server
-echo "Starting Gunicorn server..."
-exec gunicorn AirFleet_api.wsgi:application --bind 0.0.0.0:${PORT:-8080} --workers 2 --threads 2 --worker-tmp-dir /dev/shm
\ No newline at end of file
+# /api/generate-narrative/ queues jobs for run_narrative_worker; run it
+# alongside the server unless it is deployed as its own service
+# (RUN_NARRATIVE_WORKER=0).
+if [ "${RUN_NARRATIVE_WORKER:-1}" = "1" ]; then
+    echo "Starting narrative worker..."
+    (
+        while true; do
+            python manage.py run_narrative_worker || true
+            echo "Narrative worker exited; restarting in 5s"
+            sleep 5
+        done
+    ) &
+fi
+
+# CSV uploads to /api/flights/import/ are processed by process_flight_imports;
+# likewise run it here unless it has its own service (RUN_IMPORT_WORKER=0).
+if [ "${RUN_IMPORT_WORKER:-1}" = "1" ]; then
+    echo "Starting import worker..."
+    (
+        while true; do
+            python manage.py process_flight_imports || true
+            echo "Import worker exited; restarting in 5s"
+            sleep 5
+        done
+    ) &
+fi
+
+# Start the web server: ASGI under uvicorn by default, so async views can
+# hold many in-flight LLM calls per process; SERVER_MODE=wsgi for Gunicorn.
+if [ "${SERVER_MODE:-asgi}" = "wsgi" ]; then
+    echo "Starting Gunicorn server..."
+    exec gunicorn AirFleet_api.wsgi:application --bind 0.0.0.0:${PORT:-8080} --workers 2 --threads 2 --worker-tmp-dir /dev/shm
+fi
+
+echo "Starting Uvicorn server..."
+# Each ASGI request runs its sync code on a fresh thread, so persistent
+# database connections would pile up; close them after every request.
+export DB_CONN_MAX_AGE=0
+exec uvicorn AirFleet_api.asgi:application --host 0.0.0.0 --port ${PORT:-8080} --workers ${WEB_CONCURRENCY:-2}
\ No newline at end of file
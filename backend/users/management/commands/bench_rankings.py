@@ -0,0 +1,80 @@
+import statistics
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+
+from flights.synthetic import create_synthetic_flights, synthetic_users
+from users import rankings
+
+
+class Command(BaseCommand):
+    """Load test the anonymous rankings endpoint for cache stampedes"""
+    help = 'Hit /api/rankings/ from many threads at once and count how often the rankings are computed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=20, help='Requests per thread')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--invalidate-every', type=float, default=0.0,
+                            help='Invalidate the cache every N seconds during the run, as flight writes would')
+
+    def handle(self, *args, **options):
+        with synthetic_users(options['users'], prefix='bench-rankings') as users:
+            self.stdout.write(f"Creating flights for {len(users)} users...")
+            for seed, user in enumerate(users):
+                create_synthetic_flights(user, 20 + seed % 50, seed=seed)
+
+            cache.clear()
+            computed_before = rankings.computations()
+            latencies = []
+            errors = []
+            invalidations = 0
+            barrier = threading.Barrier(options['threads'])
+            done = threading.Event()
+
+            def worker():
+                client = Client(HTTP_HOST='localhost')
+                barrier.wait()
+                try:
+                    for _ in range(options['requests']):
+                        start = time.perf_counter()
+                        response = client.get('/api/rankings/')
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        if response.status_code != 200:
+                            errors.append(response.status_code)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+
+            if options['invalidate_every']:
+                while any(thread.is_alive() for thread in threads):
+                    done.wait(options['invalidate_every'])
+                    rankings.invalidate_rankings()
+                    invalidations += 1
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+        computed = rankings.computations() - computed_before
+        latencies.sort()
+        total = len(latencies)
+        self.stdout.write(f"\nRequests:        {total} from {options['threads']} threads in {elapsed:.2f}s "
+                          f"({total / elapsed:.0f} req/s)")
+        self.stdout.write(f"Errors:          {len(errors)}")
+        self.stdout.write(f"Latency p50/p95: {statistics.median(latencies):.2f} / "
+                          f"{latencies[int(total * 0.95) - 1]:.2f} ms")
+        self.stdout.write(f"Invalidations:   {invalidations}")
+        self.stdout.write(f"DB computations: {computed}")
+
+        if computed <= invalidations + 1:
+            self.stdout.write(self.style.SUCCESS('No stampede: at most one computation per cache generation'))
+        else:
+            self.stdout.write(self.style.WARNING('Rankings were computed more than once per cache generation'))
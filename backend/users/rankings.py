@@ -0,0 +1,107 @@
+"""
+Leaderboards
+
+The three rankings are read from UserFlightStats in a single windowed query
+and cached for a short TTL. Flight writes invalidate the cache on commit by
+bumping a generation number, so a recompute that raced with a write caches
+under a key nobody reads any more. A cache-held lock makes sure only one
+request recomputes a cold entry while concurrent requests wait for it.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from flights.models import UserFlightStats
+
+CACHE_KEY = 'rankings:v1'
+GENERATION_KEY = 'rankings:v1:generation'
+LIMIT = 10
+
+# How many times the rankings were actually computed by this process.
+_computations = 0
+_computations_lock = threading.Lock()
+
+
+def computations():
+    return _computations
+
+
+def compute_rankings():
+    global _computations
+    with _computations_lock:
+        _computations += 1
+
+    def rank(field):
+        return Window(RowNumber(), order_by=[F(field).desc(), F('user_id').asc()])
+
+    rows = list(
+        UserFlightStats.objects.filter(flight_count__gt=0)
+        .annotate(
+            username=F('user__username'),
+            flights_rank=rank('flight_count'),
+            time_rank=rank('total_time'),
+            distance_rank=rank('total_distance'),
+        )
+        .filter(Q(flights_rank__lte=LIMIT) | Q(time_rank__lte=LIMIT) | Q(distance_rank__lte=LIMIT))
+        .values('username', 'flight_count', 'total_time', 'total_distance',
+                'flights_rank', 'time_rank', 'distance_rank')
+    )
+
+    def top(rank_field):
+        return sorted((row for row in rows if row[rank_field] <= LIMIT), key=lambda row: row[rank_field])
+
+    return {
+        'flights': [
+            {'username': row['username'], 'total_flights': row['flight_count']}
+            for row in top('flights_rank')
+        ],
+        'time': [
+            {'username': row['username'], 'total_time': str(row['total_time'])}
+            for row in top('time_rank')
+        ],
+        'distance': [
+            {'username': row['username'], 'total_distance': row['total_distance']}
+            for row in top('distance_rank')
+        ],
+    }
+
+
+def get_rankings():
+    """
+    Return the cached rankings, recomputing them at most once per expiry.
+    """
+    key = f"{CACHE_KEY}:{cache.get_or_set(GENERATION_KEY, 0, timeout=None)}"
+    rankings = cache.get(key)
+    if rankings is not None:
+        return rankings
+
+    wait = settings.RANKINGS_LOCK_TIMEOUT
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, True, timeout=wait):
+        try:
+            rankings = compute_rankings()
+            cache.set(key, rankings, timeout=settings.RANKINGS_CACHE_TTL)
+        finally:
+            cache.delete(lock_key)
+        return rankings
+
+    # Someone else is recomputing: wait for their result rather than piling
+    # another copy of the query onto the database.
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.02)
+        rankings = cache.get(key)
+        if rankings is not None:
+            return rankings
+    return compute_rankings()
+
+
+def invalidate_rankings():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, timeout=None)
@@ -2,11 +2,12 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
-from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import UserSerializer
-from django.db.models import Sum, Count
-from flights.models import Flight
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from .rankings import get_rankings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -67,43 +68,6 @@ class RankingsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        User = get_user_model()
-        
-        # Get rankings by total flights
-        flights_ranking = User.objects.annotate(
-            total_flights=Count('flights')
-        ).order_by('-total_flights')[:10]
-
-        # Get rankings by total time
-        time_ranking = User.objects.annotate(
-            total_time=Sum('flights__total_time')
-        ).order_by('-total_time')[:10]
-
-        # Get rankings by total distance
-        distance_ranking = User.objects.annotate(
-            total_distance=Sum('flights__distance')
-        ).order_by('-total_distance')[:10]
-
-        # Format the response
-        response = {
-            'flights': [
-                {
-                    'username': user.username,
-                    'total_flights': user.total_flights
-                } for user in flights_ranking
-            ],
-            'time': [
-                {
-                    'username': user.username,
-                    'total_time': str(user.total_time) if user.total_time else '0:00:00'
-                } for user in time_ranking
-            ],
-            'distance': [
-                {
-                    'username': user.username,
-                    'total_distance': user.total_distance or 0
-                } for user in distance_ranking
-            ]
-        }
-
-        return Response(response) 
\ No newline at end of file
+        response = Response(get_rankings())
+        patch_cache_control(response, public=True, max_age=settings.RANKINGS_CACHE_TTL)
+        return response
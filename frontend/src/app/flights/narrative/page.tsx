@@ -75,6 +75,33 @@ export default function FlightNarrativePage() {
         fetchFlights();
     }, [fetchFlights]);
 
+    // Read the text/event-stream body, calling onToken as text arrives.
+    const readNarrativeStream = async (response: Response, onToken: (text: string) => void) => {
+        const reader = response.body!.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) {
+                throw new Error('Narrative stream ended early');
+            }
+            buffer += value;
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                const event = block.match(/^event: (.*)$/m)?.[1];
+                const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? '{}');
+                if (event === 'token') {
+                    onToken(data.text);
+                } else if (event === 'done') {
+                    return data;
+                } else if (event === 'error') {
+                    throw new Error(`Narrative generation failed: ${data.detail}`);
+                }
+            }
+        }
+    };
+
     const generateNarratives = async (flightData: Flight[]) => {
         const token = getAuthToken();
         
@@ -93,7 +120,7 @@ export default function FlightNarrativePage() {
             
             try {
                 console.log(`Generating narrative for flight ${flight.id}...`);
-                console.log(`POST ${BASE_URL}/generate-narrative/`);
+                console.log(`POST ${BASE_URL}/generate-narrative/stream/`);
                 
                 const payload = {
                     flight_id: flight.id,
@@ -109,7 +136,7 @@ export default function FlightNarrativePage() {
                 
                 console.log('Request payload:', payload);
                 
-                const response = await fetch(`${BASE_URL}/generate-narrative/`, {
+                const response = await fetch(`${BASE_URL}/generate-narrative/stream/`, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -125,6 +152,15 @@ export default function FlightNarrativePage() {
                     return;
                 }
 
+                if (response.status === 429) {
+                    const retryAfter = response.headers.get('Retry-After');
+                    setNarratives(prev => ({
+                        ...prev,
+                        [flight.id]: `Narrative limit reached. Please try again in ${retryAfter ?? 'a few'} seconds.`
+                    }));
+                    continue;
+                }
+
                 if (!response.ok) {
                     const errorText = await response.text();
                     console.error(`Server error: ${response.status} ${response.statusText}`);
@@ -132,7 +168,15 @@ export default function FlightNarrativePage() {
                     throw new Error(`Failed to generate narrative: ${response.status} ${response.statusText}`);
                 }
 
-                const data = await response.json();
+                // Show the narrative as it is written.
+                let text = '';
+                const data = await readNarrativeStream(response, token => {
+                    text += token;
+                    setNarratives(prev => ({
+                        ...prev,
+                        [flight.id]: text
+                    }));
+                });
                 console.log(`Got narrative response:`, data);
                 
                 setNarratives(prev => ({